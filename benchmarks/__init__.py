@@ -0,0 +1 @@
+"""Standalone benchmark scripts, see the docstring of each module for how to run it."""
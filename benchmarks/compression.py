@@ -0,0 +1,103 @@
+"""Compare payload compression codecs on typical Bluesky documents.
+
+Run with ``uv run --extra compression python benchmarks/compression.py``.
+"""
+
+import time
+from collections.abc import Callable
+from uuid import uuid4
+
+import numpy as np
+from ormsgpack import OPT_NAIVE_UTC, OPT_SERIALIZE_NUMPY, packb
+
+from bluesky_nats.compression import CODECS, Codec, get_codec
+
+
+PACKB_OPTIONS = OPT_NAIVE_UTC | OPT_SERIALIZE_NUMPY
+MIN_CALLS = 3
+CANDIDATES = [("deflate", 1), ("deflate", 6), ("zstd", 1), ("zstd", 3), ("zstd", 9), ("lz4", 0)]
+
+
+def _event(data: dict) -> dict:
+    return {
+        "uid": str(uuid4()),
+        "time": time.time(),
+        "seq_num": 1,
+        "descriptor": str(uuid4()),
+        "data": data,
+        "timestamps": dict.fromkeys(data, time.time()),
+        "filled": {},
+    }
+
+
+def _documents() -> dict[str, bytes]:
+    rng = np.random.default_rng(42)
+    y, x = np.mgrid[:512, :512]
+    peak = 1000 * np.exp(-((x - 256) ** 2 + (y - 256) ** 2) / (2 * 40**2))
+    frame = rng.poisson(peak + 10).astype(np.uint16)
+    sparse = np.zeros((512, 512), dtype=np.uint32)
+    sparse[rng.integers(0, 512, 2000), rng.integers(0, 512, 2000)] = rng.integers(1, 5000, 2000)
+    scalars = {f"motor{i}": float(i) for i in range(8)}
+    page = {
+        "uid": [str(uuid4()) for _ in range(1000)],
+        "time": [time.time() + i for i in range(1000)],
+        "seq_num": list(range(1, 1001)),
+        "descriptor": str(uuid4()),
+        "data": {"det": rng.normal(size=1000).tolist(), "motor": np.linspace(0, 1, 1000).tolist()},
+        "timestamps": {"det": [time.time()] * 1000, "motor": [time.time()] * 1000},
+        "filled": {},
+    }
+    docs = {
+        "scalar event": _event(scalars),
+        "event_page (1000 rows)": page,
+        "frame 512x512 uint16": _event({"img": frame}),
+        "sparse 512x512 uint32": _event({"img": sparse}),
+        "noise 256x256 float64": _event({"img": rng.normal(size=(256, 256))}),
+    }
+    return {name: packb(doc, option=PACKB_OPTIONS) for name, doc in docs.items()}
+
+
+def _timeit(func: Callable[[], object], min_time: float = 0.2) -> float:
+    """Return the mean wall time per call in seconds."""
+    calls = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < min_time or calls < MIN_CALLS:
+        func()
+        calls += 1
+    return elapsed / calls
+
+
+def _available(name: str, level: int) -> Codec | None:
+    try:
+        return get_codec(name, level)
+    except ImportError:
+        return None
+
+
+def main() -> None:
+    """Print ratio and throughput for each document and codec."""
+    print(f"codecs registered: {', '.join(sorted(CODECS))}")
+    header = (
+        f"{'document':<24}{'codec':<12}{'bytes':>10}{'ratio':>8}{'comp MB/s':>12}{'decomp MB/s':>13}{'comp us':>10}"
+    )
+    for doc_name, payload in _documents().items():
+        print()
+        print(header)
+        for codec_name, level in CANDIDATES:
+            codec = _available(codec_name, level)
+            label = f"{codec_name}-{level}"
+            if codec is None:
+                print(f"{doc_name:<24}{label:<12}{'not installed':>10}")
+                continue
+            compressed = codec.compress(payload)
+            comp_s = _timeit(lambda codec=codec, payload=payload: codec.compress(payload))
+            decomp_s = _timeit(lambda codec=codec, compressed=compressed: codec.decompress(compressed))
+            megabytes = len(payload) / 1e6
+            print(
+                f"{doc_name:<24}{label:<12}{len(payload):>10}{len(payload) / len(compressed):>8.2f}"
+                f"{megabytes / comp_s:>12.0f}{megabytes / decomp_s:>13.0f}{comp_s * 1e6:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
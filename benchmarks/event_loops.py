@@ -0,0 +1,81 @@
+"""Compare event loop implementations of `CoroutineExecutor`.
+
+Measures coroutine submission throughput and, if a NATS server with a stream on
+`events.>` is reachable (see `docker/Readme.adoc`), JetStream publish throughput of a
+`NATSPublisher`. Install uvloop to include it, then run with
+``uv run python benchmarks/event_loops.py [nats://host:4222]``.
+"""
+
+import sys
+import time
+from uuid import uuid4
+
+from bluesky_nats.nats_client import NATSClientConfig
+from bluesky_nats.nats_publisher import CoroutineExecutor, LoopImplementation, NATSPublisher
+
+
+SUBMISSIONS = 100_000
+DOCUMENTS = 20_000
+CONNECT_TIMEOUT = 2.0
+FLUSH_TIMEOUT = 60.0
+
+
+async def _noop() -> None:
+    pass
+
+
+def _executor(implementation: LoopImplementation) -> CoroutineExecutor | None:
+    try:
+        return CoroutineExecutor(loop_implementation=implementation)
+    except ImportError:
+        return None
+
+
+def _submissions_per_second(executor: CoroutineExecutor) -> float:
+    start = time.perf_counter()
+    futures = [executor.submit_coroutine(_noop()) for _ in range(SUBMISSIONS)]
+    futures[-1].result()
+    return SUBMISSIONS / (time.perf_counter() - start)
+
+
+def _publishes_per_second(executor: CoroutineExecutor, server: str) -> float | None:
+    publisher = NATSPublisher(executor, NATSClientConfig(servers=[server]), "events.benchmark")
+    run_id = str(uuid4())
+    descriptor = str(uuid4())
+    event = {"descriptor": descriptor, "data": {"det": 1.0, "motor": 0.5}, "timestamps": {}, "filled": {}}
+    try:
+        if not publisher.ensure_connection(timeout=CONNECT_TIMEOUT):
+            return None
+        start = time.perf_counter()
+        publisher("start", {"uid": run_id, "time": time.time()})
+        publisher("descriptor", {"uid": descriptor, "run_start": run_id, "data_keys": {}})
+        for seq_num in range(1, DOCUMENTS + 1):
+            publisher("event", {**event, "uid": str(uuid4()), "seq_num": seq_num, "time": time.time()})
+        publisher("stop", {"uid": str(uuid4()), "run_start": run_id, "exit_status": "success"})
+        if not publisher.flush_publishes(timeout=FLUSH_TIMEOUT):
+            return None
+        return (DOCUMENTS + 3) / (time.perf_counter() - start)
+    finally:
+        publisher.close()
+
+
+def main() -> None:
+    """Print submission and publish rates for each available loop implementation."""
+    server = sys.argv[1] if len(sys.argv) > 1 else "nats://localhost:4222"
+    print(f"{'loop':<10}{'submissions/s':>16}{'publishes/s':>14}")
+    for implementation in (LoopImplementation.ASYNCIO, LoopImplementation.UVLOOP):
+        executor = _executor(implementation)
+        if executor is None:
+            print(f"{implementation:<10}{'not installed':>16}")
+            continue
+        try:
+            submissions = _submissions_per_second(executor)
+            publishes = _publishes_per_second(executor, server)
+        finally:
+            executor.shutdown()
+        published = f"{publishes:>14.0f}" if publishes is not None else f"{'no server':>14}"
+        print(f"{implementation:<10}{submissions:>16.0f}{published}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+from bluesky.log import logger
+from event_model import pack_datum_page, pack_event_page
+
+
+BATCHED_DOCUMENTS = {"event": "descriptor", "datum": "resource"}
+
+
+@dataclass(frozen=True)
+class BatchConfig:
+    """Opt-in coalescing of `event`/`datum` documents into `event_page`/`datum_page` documents.
+
+    A page is emitted when one buffer reaches `max_size` documents, when `linger` seconds
+    have passed since the first buffered document, or before any non-batchable document.
+    """
+
+    max_size: int = 1000
+    linger: float | None = 0.1
+
+    def __post_init__(self):
+        """Post initialization checks."""
+        if self.max_size < 1:
+            msg = f"max_size must be a positive integer, got {self.max_size}"
+            raise ValueError(msg)
+        if self.linger is not None and self.linger <= 0:
+            msg = f"linger must be positive or None, got {self.linger}"
+            raise ValueError(msg)
+
+
+class DocumentBatcher:
+    """Buffer `event` and `datum` documents per descriptor/resource and emit them as pages.
+
+    All buffers are flushed together, datum pages first, so that events never overtake the
+    datums they reference. Callers that need flush-and-publish to be atomic with respect to
+    the linger timer must hold `lock` across both steps.
+
+    Pages that `emit` fails to send go back into the buffers and are sent with the next
+    flush. `flush` raises the error to its caller; the linger timer passes it to `on_error`.
+    """
+
+    def __init__(
+        self,
+        emit: Callable[[str, dict], None],
+        config: BatchConfig | None = None,
+        on_error: Callable[[BaseException], None] | None = None,
+    ) -> None:
+        self._emit = emit
+        self._config = config if config is not None else BatchConfig()
+        self._on_error = on_error
+        self.lock = threading.RLock()
+        self._events: dict[str, list[dict]] = {}
+        self._datums: dict[str, list[dict]] = {}
+        self._timer: threading.Timer | None = None
+        self._closed = False
+
+    @property
+    def pending(self) -> int:
+        with self.lock:
+            return sum(map(len, self._events.values())) + sum(map(len, self._datums.values()))
+
+    def add(self, name: str, doc: dict) -> bool:
+        """Buffer a document, returns False if the document is not batchable."""
+        key_field = BATCHED_DOCUMENTS.get(name)
+        if key_field is None:
+            return False
+        buffers = self._events if name == "event" else self._datums
+        with self.lock:
+            if self._closed:
+                return False
+            buffer = buffers.setdefault(doc[key_field], [])
+            buffer.append(doc)
+            if len(buffer) >= self._config.max_size:
+                self.flush()
+            elif self._timer is None and self._config.linger is not None:
+                self._timer = threading.Timer(self._config.linger, self._on_linger)
+                self._timer.daemon = True
+                self._timer.start()
+        return True
+
+    def flush(self) -> None:
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pages = [("datum", key, docs) for key, docs in self._datums.items()]
+            pages += [("event", key, docs) for key, docs in self._events.items()]
+            self._datums, self._events = {}, {}
+            for index, (name, _, docs) in enumerate(pages):
+                page = pack_datum_page(*docs) if name == "datum" else pack_event_page(*docs)
+                try:
+                    self._emit(f"{name}_page", dict(page))
+                except BaseException:
+                    # keep this and the later pages for the next flush instead of losing them
+                    for unsent, key, unsent_docs in pages[index:]:
+                        (self._datums if unsent == "datum" else self._events)[key] = unsent_docs
+                    raise
+
+    def close(self) -> None:
+        with self.lock:
+            self.flush()
+            self._closed = True
+
+    def _on_linger(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:  # noqa: BLE001
+            logger.exception("NATS batch linger flush failed")
+            if self._on_error is not None:
+                self._on_error(e)
+
+    def __call__(self, name: str, doc: Any) -> None:
+        """Feed a document, flushing all buffers ahead of non-batchable documents."""
+        with self.lock:
+            if self.add(name, doc):
+                return
+            self.flush()
+            self._emit(name, doc)
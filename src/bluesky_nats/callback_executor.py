@@ -0,0 +1,99 @@
+import asyncio
+from collections import deque
+from collections.abc import Callable, Hashable
+from concurrent.futures import Executor, Future
+from typing import Any
+
+
+CALLBACK_BACKLOG = 1000
+
+Document = tuple[str, dict]
+
+
+def _call_in_order(func: Callable[[str, dict], Any], documents: list[Document]) -> list[str]:
+    """Call `func` with each document in turn, returning the errors instead of raising them."""
+    errors = []
+    for name, doc in documents:
+        try:
+            func(name, doc)
+        except Exception as e:  # noqa: BLE001
+            errors.append(repr(e))
+    return errors
+
+
+class CallbackExecutor:
+    """Run the callbacks of a `NATSDispatcher` on a thread or process pool.
+
+    Every callback receives the documents of a run in order, one batch at a time, while
+    other runs and other callbacks run in parallel on the pool. At most `max_pending`
+    documents are queued or running; beyond that `submit` waits, which holds back the
+    dispatcher. The pool is owned by the caller.
+
+    With a `ProcessPoolExecutor` callbacks and documents must be picklable and each batch
+    may run in another process, so callbacks keeping state across documents need threads.
+    """
+
+    def __init__(self, executor: Executor, max_pending: int = CALLBACK_BACKLOG) -> None:
+        if max_pending < 1:
+            msg = f"max_pending must be a positive integer, got {max_pending}"
+            raise ValueError(msg)
+        self._executor = executor
+        self._max_pending = max_pending
+        # documents waiting for the batch in flight of their lane, a lane exists while it has one
+        self._lanes: dict[Hashable, deque[Document]] = {}
+        self._pending = 0
+        self._changed = asyncio.Event()
+        self.errors = 0
+
+    @property
+    def pending(self) -> int:
+        """Documents queued or running on the pool."""
+        return self._pending
+
+    async def submit(self, lane: Hashable, func: Callable[[str, dict], Any], name: str, doc: dict) -> None:
+        """Queue `func(name, doc)` behind the earlier documents of `lane`, e.g. a `(run_id, callback)` pair."""
+        while self._pending >= self._max_pending:
+            self._changed.clear()
+            await self._changed.wait()
+        self._pending += 1
+        queued = self._lanes.get(lane)
+        if queued is not None:
+            queued.append((name, doc))
+            return
+        self._lanes[lane] = deque()
+        self._send(lane, func, [(name, doc)])
+
+    async def join(self) -> None:
+        """Wait until all submitted documents have been processed."""
+        while self._pending:
+            self._changed.clear()
+            await self._changed.wait()
+
+    def _send(self, lane: Hashable, func: Callable[[str, dict], Any], documents: list[Document]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._executor.submit(_call_in_order, func, documents)
+        except RuntimeError as e:
+            # the pool has been shut down, fail the batch like a broken pool
+            future = Future()
+            future.set_exception(e)
+        future.add_done_callback(lambda done: loop.call_soon_threadsafe(self._done, lane, func, len(documents), done))
+
+    def _done(self, lane: Hashable, func: Callable[[str, dict], Any], count: int, future: Future) -> None:
+        self._pending -= count
+        self._changed.set()
+        try:
+            errors = future.result()
+        except Exception as e:  # noqa: BLE001
+            # e.g. the pool is broken or the callback could not be pickled
+            errors = [repr(e)] * count
+        for error in errors:
+            self.errors += 1
+            print(f"Error in callback: {error}")
+        queued = self._lanes[lane]
+        if queued:
+            documents = list(queued)
+            queued.clear()
+            self._send(lane, func, documents)
+        else:
+            del self._lanes[lane]
@@ -0,0 +1,131 @@
+import importlib
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Any
+
+
+CONTENT_ENCODING_HEADER = "Content-Encoding"
+
+zstd_lib: ModuleType | None
+try:
+    # Python >= 3.14 ships zstd in the standard library
+    zstd_lib = importlib.import_module("compression.zstd")
+except ImportError:
+    try:
+        zstd_lib = importlib.import_module("zstandard")
+    except ImportError:
+        zstd_lib = None
+
+lz4_lib: ModuleType | None
+try:
+    lz4_lib = importlib.import_module("lz4.frame")
+except ImportError:
+    lz4_lib = None
+
+
+class Codec(ABC):
+    """Payload codec, `name` is sent as the `Content-Encoding` header value."""
+
+    name: str
+
+    def __init__(self, level: int | None = None):
+        self.level = level
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        """Compress a serialized payload."""
+
+    @abstractmethod
+    def decompress(self, data: bytes) -> bytes:
+        """Restore a serialized payload."""
+
+
+class DeflateCodec(Codec):
+    name = "deflate"
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, -1 if self.level is None else self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+
+    def __init__(self, level: int | None = None):
+        if zstd_lib is None:
+            msg = "zstd compression requires Python >= 3.14 or the 'zstandard' library. Please install it."
+            raise ImportError(msg)
+        super().__init__(level)
+        self._stdlib = zstd_lib.__name__ == "compression.zstd"
+        # zstandard compressor objects skip per-call context setup, but must not be shared between threads
+        self._contexts = threading.local()
+
+    def _zstandard(self) -> Any:
+        contexts = self._contexts
+        if not hasattr(contexts, "compressor"):
+            level = {} if self.level is None else {"level": self.level}
+            contexts.compressor = zstd_lib.ZstdCompressor(**level)  # type: ignore[union-attr]
+            contexts.decompressor = zstd_lib.ZstdDecompressor()  # type: ignore[union-attr]
+        return contexts
+
+    def compress(self, data: bytes) -> bytes:
+        if self._stdlib:
+            return zstd_lib.compress(data, level=self.level)  # type: ignore[union-attr]
+        return self._zstandard().compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        if self._stdlib:
+            return zstd_lib.decompress(data)  # type: ignore[union-attr]
+        return self._zstandard().decompressor.decompress(data)
+
+
+class LZ4Codec(Codec):
+    name = "lz4"
+
+    def __init__(self, level: int | None = None):
+        if lz4_lib is None:
+            msg = "lz4 compression requires 'lz4' library. Please install it."
+            raise ImportError(msg)
+        super().__init__(level)
+
+    def compress(self, data: bytes) -> bytes:
+        return lz4_lib.compress(data, compression_level=self.level or 0)  # type: ignore[union-attr]
+
+    def decompress(self, data: bytes) -> bytes:
+        return lz4_lib.decompress(data)  # type: ignore[union-attr]
+
+
+CODECS: dict[str, type[Codec]] = {codec.name: codec for codec in (DeflateCodec, ZstdCodec, LZ4Codec)}
+
+
+def get_codec(name: str, level: int | None = None) -> Codec:
+    """Return a codec instance for a `Content-Encoding` name."""
+    try:
+        codec = CODECS[name]
+    except KeyError:
+        msg = f"Unsupported content encoding: {name}"
+        raise ValueError(msg) from None
+    return codec(level)
+
+
+@dataclass(frozen=True)
+class CompressionConfig:
+    """Compress payloads of at least `min_size` bytes with the named codec."""
+
+    codec: str = "zstd"
+    level: int | None = None
+    min_size: int = 1024
+
+    def __post_init__(self):
+        """Post initialization checks."""
+        if self.min_size < 0:
+            msg = f"min_size must not be negative, got {self.min_size}"
+            raise ValueError(msg)
+        if self.codec not in CODECS:
+            msg = f"Unsupported content encoding: {self.codec}"
+            raise ValueError(msg)
@@ -0,0 +1,228 @@
+import asyncio
+import importlib
+from collections.abc import Callable, Iterator
+from typing import TYPE_CHECKING, Any
+
+from bluesky.log import logger
+
+from bluesky_nats.metrics import HistogramSnapshot
+
+
+if TYPE_CHECKING:
+    from bluesky_nats.nats_dispatcher import NATSDispatcher
+    from bluesky_nats.nats_publisher import NATSPublisher
+    from bluesky_nats.sharding import ShardedNATSPublisher
+
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+METRIC_PREFIX = "bluesky_nats"
+QUANTILES = (("0.5", "p50"), ("0.99", "p99"), ("0.999", "p999"))
+REQUEST_TIMEOUT = 5.0
+
+# (suffix, labels, value) and (name, type, help, samples)
+Sample = tuple[str, dict[str, str], float]
+Family = tuple[str, str, str, list[Sample]]
+SampleSink = Callable[[str, str, str, list[Sample]], None]
+
+PUBLISHER_HEALTH = (
+    ("publisher_connected", "gauge", "connected", "Connected with a JetStream context."),
+    ("publisher_pending_publishes", "gauge", "pending_publishes", "Publishes waiting for completion."),
+    ("publisher_inflight_bytes", "gauge", "inflight_bytes", "Payload bytes in flight."),
+    ("publisher_spooled_publishes", "gauge", "spooled_publishes", "Publishes waiting in the spool."),
+    ("publisher_failed_publishes", "counter", "failed_publishes", "Publishes that failed, not counting spooled ones."),
+    ("publisher_dropped_publishes", "counter", "dropped_publishes", "Publishes dropped by the publish window."),
+    ("publisher_core_publishes", "counter", "core_publishes", "Publishes sent over core NATS."),
+    ("publisher_estimated_lost", "counter", "estimated_lost", "Estimated core NATS publishes lost."),
+)
+PUBLISHER_HISTOGRAMS = (
+    ("publisher_ack_latency_seconds", "ack_latency", "JetStream publish-to-ack latency."),
+    ("publisher_queue_delay_seconds", "queue_delay", "Executor queueing delay."),
+    ("publisher_serialization_seconds", "serialization", "Document serialization time."),
+)
+DISPATCHER_TRACES = (
+    ("dispatcher_transit_seconds", "transit", "Publish to receipt latency of traced messages."),
+    ("dispatcher_deserialize_seconds", "deserialize", "Deserialization time of traced messages."),
+    ("dispatcher_dispatch_seconds", "dispatch", "Wait for the dispatcher loop of traced messages."),
+    ("dispatcher_callback_seconds", "callback", "Callback time of traced messages."),
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def render_openmetrics(families: list[Family]) -> str:
+    """Render metric families in the OpenMetrics text format."""
+    lines: list[str] = []
+    for name, metric_type, help_text, samples in families:
+        if not samples:
+            continue
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"# HELP {name} {help_text}")
+        lines.extend(f"{name}{suffix}{_format_labels(labels)} {value!r}" for suffix, labels, value in samples)
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def _summary_samples(histogram: HistogramSnapshot, labels: dict[str, str]) -> list[Sample]:
+    samples = [("", {**labels, "quantile": quantile}, getattr(histogram, field)) for quantile, field in QUANTILES]
+    samples.append(("_sum", labels, histogram.mean * histogram.count))
+    samples.append(("_count", labels, float(histogram.count)))
+    return samples
+
+
+class MetricsExporter:
+    """Collect publisher and dispatcher metrics and serve them in the OpenMetrics text format.
+
+    Register sources with `add_publisher`/`add_dispatcher` under a name, which becomes the
+    `publisher`/`dispatcher` label. `await start(host, port)` serves `GET /metrics` from the
+    running event loop, e.g. the `CoroutineExecutor` loop via
+    `executor.submit_coroutine(exporter.start(...))` or the dispatcher's loop.
+    `register_collector()` plugs the same metrics into an existing `prometheus_client`
+    registry instead. A scrape only reads counters and walks three histograms per
+    publisher, it never waits for the IO loop or for publishes.
+    """
+
+    def __init__(self) -> None:
+        self._publishers: dict[str, NATSPublisher | ShardedNATSPublisher] = {}
+        self._dispatchers: dict[str, NATSDispatcher] = {}
+        self._server: asyncio.Server | None = None
+
+    def add_publisher(self, publisher: "NATSPublisher | ShardedNATSPublisher", name: str = "default") -> None:
+        self._publishers[name] = publisher
+
+    def add_dispatcher(self, dispatcher: "NATSDispatcher", name: str = "default") -> None:
+        self._dispatchers[name] = dispatcher
+
+    def collect(self) -> list[Family]:
+        """Current values of all metric families."""
+        families: dict[str, Family] = {}
+
+        def sample(name: str, metric_type: str, help_text: str, samples: list[Sample]) -> None:
+            family = families.setdefault(name, (f"{METRIC_PREFIX}_{name}", metric_type, help_text, []))
+            family[3].extend(samples)
+
+        for label, publisher in self._publishers.items():
+            self._collect_publisher(sample, {"publisher": label}, publisher)
+        for label, dispatcher in self._dispatchers.items():
+            self._collect_dispatcher(sample, {"dispatcher": label}, dispatcher)
+        return list(families.values())
+
+    @staticmethod
+    def _collect_publisher(
+        sample: SampleSink, labels: dict[str, str], publisher: "NATSPublisher | ShardedNATSPublisher"
+    ) -> None:
+        health = publisher.health
+        for name, metric_type, field, help_text in PUBLISHER_HEALTH:
+            suffix = "_total" if metric_type == "counter" else ""
+            sample(name, metric_type, help_text, [(suffix, labels, float(getattr(health, field)))])
+        clients = [shard.nats_client for shard in getattr(publisher, "shards", [publisher])]
+        reconnects = sum(client.stats["reconnects"] for client in clients)
+        sample("publisher_reconnects", "counter", "NATS reconnects.", [("_total", labels, float(reconnects))])
+        metrics = health.metrics
+        if metrics is None:
+            return
+        for name, field, help_text in PUBLISHER_HISTOGRAMS:
+            sample(name, "summary", help_text, _summary_samples(getattr(metrics, field), labels))
+        for subject, throughput in metrics.subjects.items():
+            subject_labels = {**labels, "subject": subject}
+            messages, nbytes = float(throughput.messages), float(throughput.bytes)
+            sample("publisher_messages", "counter", "Messages published.", [("_total", subject_labels, messages)])
+            sample("publisher_bytes", "counter", "Payload bytes published.", [("_total", subject_labels, nbytes)])
+
+    @staticmethod
+    def _collect_dispatcher(sample: SampleSink, labels: dict[str, str], dispatcher: "NATSDispatcher") -> None:
+        reconnects = float(dispatcher.reconnects)
+        sample("dispatcher_reconnects", "counter", "NATS reconnects.", [("_total", labels, reconnects)])
+        if dispatcher.tracing is not None:
+            traces = dispatcher.tracing.snapshot()
+            for name, field, help_text in DISPATCHER_TRACES:
+                sample(name, "summary", help_text, _summary_samples(getattr(traces, field), labels))
+        if dispatcher.metrics is None:
+            return
+        metrics = dispatcher.metrics.snapshot()
+        lag, errors = float(metrics.consumer_lag), float(metrics.errors)
+        sample("dispatcher_consumer_lag", "gauge", "Stream messages not yet delivered.", [("", labels, lag)])
+        sample("dispatcher_errors", "counter", "Messages that failed processing.", [("_total", labels, errors)])
+        refetched, missing = float(metrics.refetched), float(metrics.missing)
+        sample("dispatcher_refetched", "counter", "Messages refetched after a gap.", [("_total", labels, refetched)])
+        sample("dispatcher_missing", "counter", "Messages missing after a gap.", [("_total", labels, missing)])
+        depth = float(metrics.queue_depth)
+        sample("dispatcher_queue_depth", "gauge", "Documents waiting for the callbacks.", [("", labels, depth)])
+        blocked_help = "Time receiving was blocked by a full dispatch queue."
+        filtered = float(metrics.filtered)
+        sample("dispatcher_filtered", "counter", "Messages dropped unread.", [("_total", labels, filtered)])
+        sample("dispatcher_blocked_seconds", "summary", blocked_help, _summary_samples(metrics.blocked, labels))
+        for name, throughput in metrics.documents.items():
+            document_labels = {**labels, "document": name}
+            documents, rate = float(throughput.messages), throughput.messages_per_second
+            sample("dispatcher_documents", "counter", "Documents dispatched.", [("_total", document_labels, documents)])
+            sample("dispatcher_documents_per_second", "gauge", "Dispatch rate.", [("", document_labels, rate)])
+
+    def render(self) -> str:
+        return render_openmetrics(self.collect())
+
+    async def start(self, host: str = "127.0.0.1", port: int = 9464) -> None:
+        """Serve `GET /metrics` on the running event loop."""
+        self._server = await asyncio.start_server(self._handle_request, host, port)
+        logger.info(f"NATS metrics exporter listening on {host}:{port}")
+
+    @property
+    def port(self) -> int | None:
+        """Port the exporter listens on, useful when started with `port=0`."""
+        if self._server is None or not self._server.sockets:
+            return None
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        server, self._server = self._server, None
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+
+    async def _handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), REQUEST_TIMEOUT)
+            method, path, *_ = request.split(b"\r\n", 1)[0].decode("latin-1").split(" ")
+            if method == "GET" and path.split("?", 1)[0] in {"/metrics", "/"}:
+                status, content_type, body = "200 OK", OPENMETRICS_CONTENT_TYPE, self.render().encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain; charset=utf-8", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, ConnectionError) as e:
+            logger.debug(f"NATS metrics exporter dropped a request: {e!s}")
+        finally:
+            writer.close()
+
+    def register_collector(self, registry: Any = None) -> Any:
+        """Register with a `prometheus_client` registry, the default registry if None."""
+        try:
+            prometheus_client = importlib.import_module("prometheus_client")
+            core = importlib.import_module("prometheus_client.core")
+        except ImportError as e:
+            msg = "register_collector requires the 'prometheus_client' library. Please install it."
+            raise ImportError(msg) from e
+        exporter = self
+
+        class _Collector:
+            def collect(self) -> Iterator[Any]:
+                for name, metric_type, help_text, samples in exporter.collect():
+                    family = core.Metric(name, help_text, metric_type)
+                    for suffix, labels, value in samples:
+                        family.add_sample(name + suffix, labels, value)
+                    yield family
+
+        collector = _Collector()
+        (registry if registry is not None else prometheus_client.REGISTRY).register(collector)
+        return collector
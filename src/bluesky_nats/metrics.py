@@ -0,0 +1,246 @@
+import math
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+
+SUB_BUCKET_BITS = 4  # 16 buckets per power of two, values are exact to within 1/16
+MAX_VALUE_BITS = 42  # about 73 minutes in nanoseconds, larger values are clamped
+RATE_WINDOW = 5.0
+
+
+def _bucket_index(value: int) -> int:
+    if value < 1 << SUB_BUCKET_BITS:
+        return max(value, 0)
+    value = min(value, (1 << MAX_VALUE_BITS) - 1)
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+
+def _bucket_upper_bound(index: int) -> int:
+    if index < 1 << SUB_BUCKET_BITS:
+        return index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    top = index - (shift << SUB_BUCKET_BITS)
+    return ((top + 1) << shift) - 1
+
+
+BUCKET_COUNT = _bucket_index((1 << MAX_VALUE_BITS) - 1) + 1
+
+
+@dataclass(frozen=True)
+class HistogramSnapshot:
+    """Latency distribution in seconds; percentiles are upper bounds of their bucket."""
+
+    count: int
+    mean: float
+    p50: float
+    p99: float
+    p999: float
+    max: float
+
+
+class LatencyHistogram:
+    """HDR-style histogram of nanosecond durations with logarithmic buckets of linear sub-buckets.
+
+    Recording is a few integer operations and a list increment, without a lock. Each
+    histogram is written from one thread in practice; concurrent writers may lose an
+    occasional count, which is acceptable for monitoring.
+    """
+
+    def __init__(self) -> None:
+        self._counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        self._counts[_bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def add(self, other: "LatencyHistogram") -> None:
+        """Add the counts of `other`, e.g. to combine the histograms of several publishers."""
+        for index, count in enumerate(other._counts):  # noqa: SLF001
+            if count:
+                self._counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction: float) -> int:
+        """Value in nanoseconds that `fraction` of the recorded values do not exceed."""
+        counts = list(self._counts)
+        rank = max(1, math.ceil(fraction * sum(counts)))
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return min(_bucket_upper_bound(index), self.max)
+        return 0
+
+    def snapshot(self) -> HistogramSnapshot:
+        count = self.count
+        return HistogramSnapshot(
+            count=count,
+            mean=self.total / count / 1e9 if count else 0.0,
+            p50=self.percentile(0.5) / 1e9,
+            p99=self.percentile(0.99) / 1e9,
+            p999=self.percentile(0.999) / 1e9,
+            max=self.max / 1e9,
+        )
+
+
+@dataclass(frozen=True)
+class SubjectThroughput:
+    messages: int
+    bytes: int
+    messages_per_second: float
+    bytes_per_second: float
+
+
+class _SubjectCounter:
+    """Message and byte totals of one subject, with rates over windows of `RATE_WINDOW` seconds."""
+
+    def __init__(self, now: float) -> None:
+        self.messages = 0
+        self.bytes = 0
+        self.window_start = now
+        self.window_messages = 0
+        self.window_bytes = 0
+        self.rates = (0.0, 0.0)
+
+    def record(self, nbytes: int, now: float) -> None:
+        self.messages += 1
+        self.bytes += nbytes
+        elapsed = now - self.window_start
+        if elapsed >= RATE_WINDOW:
+            self.rates = (self.window_messages / elapsed, self.window_bytes / elapsed)
+            self.window_start, self.window_messages, self.window_bytes = now, 0, 0
+        self.window_messages += 1
+        self.window_bytes += nbytes
+
+    def snapshot(self, now: float) -> SubjectThroughput:
+        messages_per_second, bytes_per_second = self.rates
+        elapsed = now - self.window_start
+        if elapsed >= RATE_WINDOW:
+            # the current window is already longer than usual, so it includes any idle time
+            messages_per_second, bytes_per_second = self.window_messages / elapsed, self.window_bytes / elapsed
+        return SubjectThroughput(self.messages, self.bytes, messages_per_second, bytes_per_second)
+
+
+@dataclass(frozen=True)
+class MetricsSnapshot:
+    """Serialization time, executor queueing delay and publish-to-ack latency, plus per subject throughput."""
+
+    serialization: HistogramSnapshot
+    queue_delay: HistogramSnapshot
+    ack_latency: HistogramSnapshot
+    subjects: dict[str, SubjectThroughput]
+
+
+class PublisherMetrics:
+    """Instrumentation of a publisher, enabled with `NATSPublisher(..., metrics=True)`."""
+
+    def __init__(self) -> None:
+        self.serialization = LatencyHistogram()
+        self.queue_delay = LatencyHistogram()
+        self.ack_latency = LatencyHistogram()
+        self.subjects: dict[str, _SubjectCounter] = {}
+
+    def record_publish(self, subject: str, nbytes: int) -> None:
+        """Count a message of `nbytes` sent on `subject`."""
+        now = time.monotonic()
+        counter = self.subjects.get(subject)
+        if counter is None:
+            counter = self.subjects.setdefault(subject, _SubjectCounter(now))
+        counter.record(nbytes, now)
+
+    def snapshot(self) -> MetricsSnapshot:
+        now = time.monotonic()
+        return MetricsSnapshot(
+            serialization=self.serialization.snapshot(),
+            queue_delay=self.queue_delay.snapshot(),
+            ack_latency=self.ack_latency.snapshot(),
+            subjects={subject: counter.snapshot(now) for subject, counter in list(self.subjects.items())},
+        )
+
+
+def combined_snapshot(metrics: Iterable[PublisherMetrics]) -> MetricsSnapshot:
+    """Snapshot of several publishers' metrics, with their histograms and subject counters added up."""
+    combined = PublisherMetrics()
+    now = time.monotonic()
+    subjects: dict[str, SubjectThroughput] = {}
+    for part in metrics:
+        combined.serialization.add(part.serialization)
+        combined.queue_delay.add(part.queue_delay)
+        combined.ack_latency.add(part.ack_latency)
+        for subject, counter in list(part.subjects.items()):
+            throughput = counter.snapshot(now)
+            previous = subjects.get(subject)
+            if previous is not None:
+                throughput = SubjectThroughput(
+                    previous.messages + throughput.messages,
+                    previous.bytes + throughput.bytes,
+                    previous.messages_per_second + throughput.messages_per_second,
+                    previous.bytes_per_second + throughput.bytes_per_second,
+                )
+            subjects[subject] = throughput
+    snapshot = combined.snapshot()
+    return MetricsSnapshot(snapshot.serialization, snapshot.queue_delay, snapshot.ack_latency, subjects)
+
+
+@dataclass(frozen=True)
+class DispatcherMetricsSnapshot:
+    documents: dict[str, SubjectThroughput]
+    errors: int
+    consumer_lag: int
+    refetched: int
+    missing: int
+    queue_depth: int
+    blocked: HistogramSnapshot
+    filtered: int
+
+
+class DispatcherMetrics:
+    """Instrumentation of a dispatcher, enabled with `NATSDispatcher(..., metrics=True)`.
+
+    `consumer_lag` is the number of stream messages not yet delivered to the consumer, as
+    reported with the last message received. `refetched` counts messages recovered from the
+    stream after a sequence gap, `missing` those that could not be found. `queue_depth` is
+    the number of documents waiting for the callbacks, `blocked` the time receiving was
+    held up by a full queue. `filtered` counts messages dropped before deserialization
+    because no callback wanted them.
+    """
+
+    def __init__(self) -> None:
+        self.documents: dict[str, _SubjectCounter] = {}
+        self.errors = 0
+        self.consumer_lag = 0
+        self.refetched = 0
+        self.missing = 0
+        self.queue_depth = 0
+        self.blocked = LatencyHistogram()
+        self.filtered = 0
+
+    def record_document(self, name: str, nbytes: int) -> None:
+        """Count a processed document of `nbytes`."""
+        now = time.monotonic()
+        counter = self.documents.get(name)
+        if counter is None:
+            counter = self.documents.setdefault(name, _SubjectCounter(now))
+        counter.record(nbytes, now)
+
+    def snapshot(self) -> DispatcherMetricsSnapshot:
+        now = time.monotonic()
+        return DispatcherMetricsSnapshot(
+            documents={name: counter.snapshot(now) for name, counter in list(self.documents.items())},
+            errors=self.errors,
+            consumer_lag=self.consumer_lag,
+            refetched=self.refetched,
+            missing=self.missing,
+            queue_depth=self.queue_depth,
+            blocked=self.blocked.snapshot(),
+            filtered=self.filtered,
+        )
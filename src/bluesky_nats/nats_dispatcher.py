@@ -1,24 +1,217 @@
 import asyncio
-from collections.abc import AsyncGenerator, Callable
-from contextlib import asynccontextmanager
-from dataclasses import asdict
-from typing import TYPE_CHECKING, Any
+import time
+from collections.abc import AsyncGenerator, Callable, Collection
+from contextlib import asynccontextmanager, suppress
+from dataclasses import asdict, dataclass, replace
+from enum import StrEnum
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, cast
 
 from bluesky.run_engine import Dispatcher
 from event_model import DocumentNames
 from nats.aio.client import Client as NATS  # noqa: N814
 from nats.errors import TimeoutError as NATS_TimeoutError
-from nats.js.api import ConsumerConfig, DeliverPolicy
+from nats.js.api import AckPolicy, ConsumerConfig, DeliverPolicy
+from nats.js.errors import NotFoundError
 from ormsgpack import unpackb
 
+from bluesky_nats.callback_executor import CallbackExecutor
+from bluesky_nats.compression import CONTENT_ENCODING_HEADER, Codec, get_codec
+from bluesky_nats.metrics import DispatcherMetrics
 from bluesky_nats.nats_client import NATSClientConfig
+from bluesky_nats.object_store import ObjectResolver
+from bluesky_nats.sequencing import SEQUENCE_HEADER, RunPosition, RunSequences, parse_sequence
+from bluesky_nats.tracing import TRACEPARENT_HEADER, TraceRecorder
 
 
 if TYPE_CHECKING:
+    import numpy as np
+    from nats.aio.msg import Msg
     from nats.js import JetStreamContext
 
 
+DISPATCH_QUEUE_SIZE = 1000
+SUBJECT_CACHE_SIZE = 1024
+# message, document name, document and the trace timestamps of traced messages
+QueuedDocument = tuple["Msg", DocumentNames, dict, tuple[int, int, int] | None]
+
+
+@lru_cache(maxsize=SUBJECT_CACHE_SIZE)
+def _document_name(subject: str) -> DocumentNames | None:
+    """Document type of a `<prefix>.<document name>` subject, None if it names none."""
+    return DocumentNames.__members__.get(subject.rpartition(".")[2])
+
+
+def _document_filter(documents: Collection[str]) -> frozenset[DocumentNames]:
+    unknown = set(documents) - DocumentNames.__members__.keys()
+    if not documents or unknown:
+        msg = f"documents must be a non-empty collection of document names, got {sorted(documents)}"
+        raise ValueError(msg)
+    return frozenset(DocumentNames[name] for name in documents)
+
+
+@dataclass(frozen=True)
+class PullConsumerConfig:
+    """Fetch messages in batches from a JetStream pull consumer.
+
+    Each fetch asks for up to `batch` messages and returns after at most `max_wait`
+    seconds with whatever has arrived. nats-py fetch requests carry no byte limit, so
+    `max_bytes` sizes each fetch from the average message size of the previous batch.
+    With `durable` set, the consumer is kept on the server and a restarted dispatcher
+    resumes where it stopped.
+    """
+
+    batch: int = 256
+    max_wait: float = 1.0
+    max_bytes: int | None = None
+    durable: str | None = None
+
+    def __post_init__(self):
+        """Post initialization checks."""
+        if self.batch < 1:
+            msg = f"batch must be a positive integer, got {self.batch}"
+            raise ValueError(msg)
+        if self.max_wait <= 0:
+            msg = f"max_wait must be positive, got {self.max_wait}"
+            raise ValueError(msg)
+        if self.max_bytes is not None and self.max_bytes < 1:
+            msg = f"max_bytes must be a positive integer or None, got {self.max_bytes}"
+            raise ValueError(msg)
+
+    def batch_size(self, average_size: float) -> int:
+        """Messages to fetch next, given the average size of the messages fetched so far."""
+        if self.max_bytes is None or average_size <= 0:
+            return self.batch
+        return max(1, min(self.batch, int(self.max_bytes // average_size)))
+
+
+class AckStrategy(StrEnum):
+    NONE = "none"
+    EACH = "each"
+    BATCH = "batch"
+    ASYNC = "async"
+
+
+ACK_POLICIES = {
+    AckStrategy.NONE: AckPolicy.NONE,
+    AckStrategy.EACH: AckPolicy.EXPLICIT,
+    AckStrategy.BATCH: AckPolicy.ALL,
+    AckStrategy.ASYNC: AckPolicy.EXPLICIT,
+}
+
+
+@dataclass(frozen=True)
+class AckConfig:
+    """How the dispatcher acknowledges the messages it has dispatched.
+
+    `EACH` awaits an ack per message. `NONE` sends no acks; the consumer then uses
+    `AckPolicy.NONE`, which is what the ordered push subscription does anyway. `BATCH`
+    uses `AckPolicy.ALL` and acks every `every`-th message, or the last one after
+    `interval` seconds, which acknowledges everything before it too, including messages
+    that failed to process. `ASYNC` sends the acks from a background task, so the
+    receive loop never waits for them. For the pull consumer, the ack policy is set to
+    match the strategy.
+    """
+
+    strategy: AckStrategy = AckStrategy.EACH
+    every: int = 100
+    interval: float = 0.1
+
+    def __post_init__(self):
+        """Post initialization checks."""
+        AckStrategy(self.strategy)
+        if self.every < 1:
+            msg = f"every must be a positive integer, got {self.every}"
+            raise ValueError(msg)
+        if self.interval <= 0:
+            msg = f"interval must be positive, got {self.interval}"
+            raise ValueError(msg)
+
+
+class _Acknowledger:
+    """Send the acks of a dispatcher according to its `AckConfig`, on the dispatcher's loop."""
+
+    def __init__(self, config: AckConfig, loop: asyncio.AbstractEventLoop) -> None:
+        self._config = config
+        self._loop = loop
+        self._last: Msg | None = None
+        self._unacked = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._pending: list[Msg] = []
+        self._task: asyncio.Task[None] | None = None
+
+    async def ack(self, msg: "Msg") -> None:
+        strategy = self._config.strategy
+        if strategy == AckStrategy.EACH:
+            await msg.ack()
+        elif strategy == AckStrategy.BATCH:
+            self._last = msg
+            self._unacked += 1
+            if self._unacked >= self._config.every:
+                await self._ack_batch()
+            elif self._timer is None:
+                self._timer = self._loop.call_later(self._config.interval, self._on_interval)
+        elif strategy == AckStrategy.ASYNC:
+            self._pending.append(msg)
+            if self._task is None or self._task.done():
+                self._task = self._loop.create_task(self._send_pending())
+
+    async def flush(self) -> None:
+        """Send the outstanding acks, e.g. before unsubscribing."""
+        await self._ack_batch()
+        if self._task is not None:
+            await self._task
+
+    def _on_interval(self) -> None:
+        self._timer = None
+        self._task = self._loop.create_task(self._ack_batch())
+
+    async def _ack_batch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        msg, self._last, self._unacked = self._last, None, 0
+        if msg is not None:
+            await self._send(msg)
+
+    async def _send_pending(self) -> None:
+        while self._pending:
+            msgs, self._pending = self._pending, []
+            for msg in msgs:
+                await self._send(msg)
+
+    @staticmethod
+    async def _send(msg: "Msg") -> None:
+        try:
+            await msg.ack()
+        except Exception as e:  # noqa: BLE001
+            print(f"Error acknowledging message: {e}")
+
+
 class NATSDispatcher(Dispatcher):
+    """Dispatch the documents of a JetStream subject to Bluesky callbacks.
+
+    By default messages arrive one at a time on an ordered push subscription. With `pull`
+    set, they are fetched in batches from a pull consumer and processed back to back,
+    which is much faster when catching up on a backlog, see `PullConsumerConfig`.
+    Acknowledgements are sent as configured by `ack`, see `AckConfig`.
+
+    Received documents wait in a queue of `queue_size` documents for the callbacks. While
+    it is full, the dispatcher stops receiving, so slow callbacks hold back the consumer
+    (and eventually the server, through `max_ack_pending` or flow control) instead of
+    growing memory. With `metrics=True` the queue depth and the time spent blocked on a
+    full queue are recorded.
+
+    Callbacks run on the dispatcher's loop unless a `callback_executor` is given, see
+    `CallbackExecutor`. Traced documents then time the hand-off as the callback stage.
+
+    Messages are dropped before deserialization unless a callback is subscribed to their
+    document type, the type is in `documents` and, with `run_ids` set, their `run_id`
+    header is one of them. If `subject` ends in `.*`, `documents` also becomes the
+    consumer's filter subjects, so the server does not deliver other documents at all;
+    gap recovery is then disabled, as gaps in the run sequence are expected.
+    """
+
     def __init__(
         self,
         subject: str,
@@ -26,7 +219,21 @@ class NATSDispatcher(Dispatcher):
         stream_name: str | None = "bluesky",
         loop: asyncio.AbstractEventLoop | None = None,
         deserializer: Callable = unpackb,
+        *,
+        resolve_objects: bool = True,
+        metrics: bool = False,
+        tracing: TraceRecorder | None = None,
+        recover_gaps: bool = True,
+        pull: PullConsumerConfig | None = None,
+        ack: AckConfig | None = None,
+        queue_size: int = DISPATCH_QUEUE_SIZE,
+        callback_executor: CallbackExecutor | None = None,
+        documents: Collection[str] | None = None,
+        run_ids: Collection[str] | None = None,
     ):
+        if queue_size < 1:
+            msg = f"queue_size must be a positive integer, got {queue_size}"
+            raise ValueError(msg)
         self._subject = subject
         self._stream_name = stream_name
 
@@ -35,12 +242,29 @@ class NATSDispatcher(Dispatcher):
         self._consumer_config = ConsumerConfig(
             description="Bluesky Dispatcher for NATS", deliver_policy=DeliverPolicy.NEW
         )
+        self._pull = pull
+        self._ack_config = ack if ack is not None else AckConfig()
+        self._documents = _document_filter(documents) if documents is not None else None
+        self._run_ids = frozenset(run_ids) if run_ids is not None else None
+        if self._documents is not None and subject.endswith(".*"):
+            self._consumer_config.filter_subjects = sorted(f"{subject[:-1]}{name.name}" for name in self._documents)
+            recover_gaps = False
 
         self._deserializer = deserializer
+        self._resolve_objects = resolve_objects
+        self._resolver: ObjectResolver | None = None
+        self._codecs: dict[str, Codec] = {}
+        self.metrics = DispatcherMetrics() if metrics else None
+        self.tracing = tracing
+        self._sequences = RunSequences() if recover_gaps else None
         self.loop = loop or asyncio.get_event_loop()
+        self._acks = _Acknowledger(self._ack_config, self.loop)
+        self._queue: asyncio.Queue[QueuedDocument] = asyncio.Queue(maxsize=queue_size)
+        self._process_task: asyncio.Task[None] | None = None
+        self._callbacks = callback_executor
         self._nc = NATS()
         self._js: JetStreamContext
-        self._subscription: JetStreamContext.PushSubscription
+        self._subscription: JetStreamContext.PushSubscription | JetStreamContext.PullSubscription
         self._task = None
         self.closed = False
 
@@ -59,29 +283,36 @@ class NATSDispatcher(Dispatcher):
         """Async context setup."""
         await self.connect()
         await self._subscribe()
-        self._task = self.loop.create_task(self._poll())
+        self._task = self.loop.create_task(self._poll() if self._pull is None else self._poll_batches())
 
     async def connect(self) -> None:
         await self._nc.connect(**asdict(self._client_config))
         self._js = self._nc.jetstream()
+        self._resolver = ObjectResolver(self._js)
+
+    async def fetch_object(self, reference: dict) -> "np.ndarray":
+        """Fetch an array referenced by an externalized document on demand."""
+        if self._resolver is None:
+            msg = "NATSDispatcher is not connected"
+            raise RuntimeError(msg)
+        return await self._resolver.fetch(reference)
 
     async def _subscribe(self) -> None:
+        if self._pull is not None:
+            config = replace(self._consumer_config, ack_policy=ACK_POLICIES[self._ack_config.strategy])
+            self._subscription = await self._js.pull_subscribe(
+                subject=self._subject, durable=self._pull.durable, stream=self._stream_name, config=config
+            )
+            return
         self._subscription = await self._js.subscribe(
             subject=self._subject, stream=self._stream_name, ordered_consumer=True, config=self._consumer_config
         )
 
     async def _poll(self) -> None:
+        subscription = cast("JetStreamContext.PushSubscription", self._subscription)
         while True:
             try:
-                msg = await self._subscription.next_msg()
-                try:
-                    name = msg.subject.split(".")[-1]
-                    doc = self._deserializer(msg.data)
-                    if name:
-                        self.loop.call_soon(self.process, DocumentNames[name], doc)
-                    await msg.ack()
-                except Exception as e:  # noqa: BLE001
-                    print(f"Error processing message: {e}")
+                await self._process_message(await subscription.next_msg())
             except asyncio.CancelledError:
                 break
             except NATS_TimeoutError:
@@ -89,6 +320,225 @@ class NATSDispatcher(Dispatcher):
             except Exception as e:  # noqa: BLE001
                 print(f"Unexpected error: {e!s}")
 
+    async def _poll_batches(self) -> None:
+        subscription = cast("JetStreamContext.PullSubscription", self._subscription)
+        config = cast("PullConsumerConfig", self._pull)
+        batch = config.batch
+        while True:
+            try:
+                msgs = await self._fetch_batch(subscription, batch, config.max_wait)
+                for msg in msgs:
+                    await self._process_message(msg)
+            except asyncio.CancelledError:
+                break
+            if msgs:
+                batch = config.batch_size(sum(len(msg.data) for msg in msgs) / len(msgs))
+
+    @staticmethod
+    async def _fetch_batch(
+        subscription: "JetStreamContext.PullSubscription", batch: int, max_wait: float
+    ) -> list["Msg"]:
+        try:
+            return await subscription.fetch(batch, timeout=max_wait)
+        except NATS_TimeoutError:
+            return []
+        except Exception as e:  # noqa: BLE001
+            print(f"Unexpected error: {e!s}")
+        # e.g. while reconnecting, do not spin on a failing fetch
+        await asyncio.sleep(max_wait)
+        return []
+
+    async def _process_message(self, msg: "Msg") -> None:
+        try:
+            await self._handle_message(msg)
+        except Exception as e:  # noqa: BLE001
+            if self.metrics is not None:
+                self.metrics.errors += 1
+            print(f"Error processing message: {e}")
+
+    def _decode(self, msg: "Msg") -> bytes:
+        """Decompress the payload according to its `Content-Encoding` header, if any."""
+        encoding = msg.headers.get(CONTENT_ENCODING_HEADER) if msg.headers else None
+        if encoding is None:
+            return msg.data
+        codec = self._codecs.get(encoding)
+        if codec is None:
+            codec = self._codecs[encoding] = get_codec(encoding)
+        return codec.decompress(msg.data)
+
+    async def _handle_message(self, msg: "Msg") -> None:
+        sequence = self._sequence_of(msg) if self._sequences is not None else None
+        if sequence is None:
+            await self._dispatch_message(msg)
+            await self._acks.ack(msg)
+            return
+        key, seq = sequence
+        sequences = cast("RunSequences", self._sequences)
+        position = sequences.get(key)
+        stream_seq = msg.metadata.sequence.stream if msg.reply else None
+        if position is None:
+            sequences.start(key, seq, stream_seq)
+        elif seq <= position.seq:
+            if seq not in position.missing:
+                # already dispatched, e.g. redelivered after a consumer reset or refetched
+                await self._acks.ack(msg)
+                return
+            position.missing.discard(seq)
+        else:
+            if seq > position.seq + 1:
+                await self._refetch(key, position, seq, stream_seq)
+            position.advance(seq, stream_seq)
+        await self._dispatch_message(msg)
+        await self._acks.ack(msg)
+
+    @staticmethod
+    def _sequence_of(msg: "Msg") -> tuple[tuple[str, str], int] | None:
+        headers = msg.headers
+        value = headers.get(SEQUENCE_HEADER) if headers else None
+        sequence = parse_sequence(value) if value else None
+        if sequence is None:
+            return None
+        return (str(headers.get("run_id")), sequence[0]), sequence[1]  # type: ignore[union-attr]
+
+    async def _refetch(self, key: tuple[str, str], position: RunPosition, seq: int, stream_seq: int | None) -> None:
+        """Dispatch the messages of a run between its last seen sequence number and `seq` from the stream."""
+        missing = set(range(position.seq + 1, seq))
+        if self._stream_name is not None and position.stream_seq is not None and stream_seq is not None:
+            # the missing messages were stored between the neighbours received around the gap
+            next_seq = position.stream_seq + 1
+            while missing and next_seq < stream_seq:
+                try:
+                    raw = await self._js.get_msg(self._stream_name, seq=next_seq, subject=self._subject, next=True)
+                except NotFoundError:
+                    break
+                if raw.seq is None or raw.seq >= stream_seq:
+                    break
+                next_seq = raw.seq + 1
+                sequence = self._sequence_of(cast("Msg", raw))
+                if sequence is None or sequence[0] != key or sequence[1] not in missing:
+                    continue
+                missing.discard(sequence[1])
+                await self._dispatch_message(cast("Msg", raw))
+        recovered = seq - position.seq - 1 - len(missing)
+        if self.metrics is not None:
+            self.metrics.refetched += recovered
+            self.metrics.missing += len(missing)
+        print(f"Sequence gap in run {key[0]}: refetched {recovered}, still missing {len(missing)}")
+        position.add_missing(missing)
+
+    async def _dispatch_message(self, msg: "Msg") -> None:
+        name = _document_name(msg.subject)
+        if name is None or not self._wants(name, msg):
+            if self.metrics is not None:
+                self._record_message(None, msg)
+            return
+        traced = self.tracing is not None and bool(msg.headers) and TRACEPARENT_HEADER in msg.headers
+        received_at, started = (time.time_ns(), time.perf_counter_ns()) if traced else (0, 0)
+        doc = self._deserializer(self._decode(msg))
+        deserialized = time.perf_counter_ns() if traced else 0
+        if self._resolve_objects and self._resolver is not None:
+            doc = await self._resolver.resolve(name.name, doc)
+        await self._enqueue((msg, name, doc, (received_at, started, deserialized) if traced else None))
+        if self.metrics is not None:
+            self._record_message(name.name, msg)
+
+    def _wants(self, name: DocumentNames, msg: "Msg") -> bool:
+        """Whether a callback is interested in the message, decided from its subject and headers only."""
+        # the registry keeps an empty dict for a document type once its callbacks are unsubscribed
+        if not self.cb_registry.callbacks.get(name) or (self._documents is not None and name not in self._documents):
+            return False
+        if self._run_ids is None:
+            return True
+        return bool(msg.headers) and msg.headers.get("run_id") in self._run_ids
+
+    async def _enqueue(self, document: QueuedDocument) -> None:
+        if self._process_task is None or self._process_task.done():
+            self._process_task = self.loop.create_task(self._process_queue())
+        queue = self._queue
+        metrics = self.metrics
+        if queue.full():
+            # stop receiving until the callbacks have caught up
+            started = time.perf_counter_ns()
+            await queue.put(document)
+            if metrics is not None:
+                metrics.blocked.record(time.perf_counter_ns() - started)
+        else:
+            queue.put_nowait(document)
+        if metrics is not None:
+            metrics.queue_depth = queue.qsize()
+
+    async def _process_queue(self) -> None:
+        queue = self._queue
+        while True:
+            msg, name, doc, timestamps = await queue.get()
+            try:
+                if timestamps is None:
+                    await self._process(msg, name, doc)
+                else:
+                    await self._process_traced(msg, name, doc, timestamps)
+            except Exception as e:  # noqa: BLE001
+                if self.metrics is not None:
+                    self.metrics.errors += 1
+                print(f"Error processing document: {e}")
+            finally:
+                queue.task_done()
+            if self.metrics is not None:
+                self.metrics.queue_depth = queue.qsize()
+
+    async def _drain_queue(self) -> None:
+        """Let the callbacks process the queued documents, then stop the processing task."""
+        task, self._process_task = self._process_task, None
+        if task is None or task.done():
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=5.0)
+            if self._callbacks is not None:
+                await asyncio.wait_for(self._callbacks.join(), timeout=5.0)
+        except TimeoutError:
+            print("Processing queued documents timed out")
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+    async def _process(self, msg: "Msg", name: DocumentNames, doc: dict) -> None:
+        if self._callbacks is None:
+            self.process(name, doc)
+            return
+        # one lane per run and callback keeps each callback's view of a run in order
+        run_id = msg.headers.get("run_id") if msg.headers else None
+        for cid, func in list(self.cb_registry.callbacks.get(name, {}).items()):
+            await self._callbacks.submit((run_id, cid), func, name.name, doc)
+
+    async def _process_traced(
+        self, msg: "Msg", name: DocumentNames, doc: dict, timestamps: tuple[int, int, int]
+    ) -> None:
+        received_at, started, deserialized = timestamps
+        dispatched = time.perf_counter_ns()
+        await self._process(msg, name, doc)
+        cast("TraceRecorder", self.tracing).record(
+            msg.headers or {},
+            msg.subject,
+            received_at=received_at,
+            started=started,
+            deserialized=deserialized,
+            dispatched=dispatched,
+            done=time.perf_counter_ns(),
+        )
+
+    def _record_message(self, name: str | None, msg: "Msg") -> None:
+        metrics = cast("DispatcherMetrics", self.metrics)
+        if name is None:
+            metrics.filtered += 1
+        else:
+            metrics.record_document(name, len(msg.data))
+        if getattr(msg, "reply", None):
+            metrics.consumer_lag = msg.metadata.num_pending
+
+    @property
+    def reconnects(self) -> int:
+        """Number of times the NATS connection was re-established."""
+        return self._nc.stats["reconnects"]
+
     @asynccontextmanager
     async def run(self) -> AsyncGenerator[Any, Any]:
         async with self:
@@ -124,6 +574,12 @@ class NATSDispatcher(Dispatcher):
             except Exception as e:  # noqa: BLE001
                 print(f"Error cancelling task: {e}")
 
+        await self._drain_queue()
+        try:
+            await asyncio.wait_for(self._acks.flush(), timeout=5.0)
+        except TimeoutError:
+            print("Sending outstanding acks timed out")
+
         if self._subscription is not None:
             try:
                 await asyncio.wait_for(self._subscription.unsubscribe(), timeout=5.0)
@@ -1,58 +1,289 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import heapq
+import importlib
 import inspect
+import os
+import sys
 import threading
 import time
 from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict, deque
 from concurrent.futures import CancelledError as FutureCancelledError
 from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from concurrent.futures import TimeoutError as FutureTimeoutError
 from dataclasses import asdict, dataclass
-from threading import Lock
-from typing import TYPE_CHECKING, Any, Protocol, cast
+from enum import StrEnum
+from functools import partial
+from threading import Condition, Lock
+from typing import TYPE_CHECKING, Any, Literal, Protocol, cast, overload
 
 from bluesky.log import logger
 from nats.aio.client import Client as NATS  # noqa: N814
+from nats.errors import (
+    ConnectionClosedError,
+    ConnectionReconnectingError,
+    NoServersError,
+    OutboundBufferLimitError,
+    StaleConnectionError,
+)
 from nats.js.errors import NoStreamResponseError
 from ormsgpack import OPT_NAIVE_UTC, OPT_SERIALIZE_NUMPY, packb
 
+from bluesky_nats.batching import BatchConfig, DocumentBatcher
+from bluesky_nats.compression import CONTENT_ENCODING_HEADER, CompressionConfig, get_codec
+from bluesky_nats.metrics import MetricsSnapshot, PublisherMetrics
 from bluesky_nats.nats_client import NATSClientConfig
+from bluesky_nats.object_store import ArrayOffloadConfig, externalize_arrays, get_object_store, upload_arrays
+from bluesky_nats.routing import EXPECTED_STREAM_HEADER, DocumentRouter, HeaderFactory, RouteRule
+from bluesky_nats.sequencing import SEQUENCE_HEADER, SequenceCounter
+from bluesky_nats.spool import SegmentSpool, SpoolConfig, ThreadedSpool
+from bluesky_nats.tracing import TraceContext, TracingConfig
 
 
 NATS_TIMEOUT = 10.0
+PACKB_OPTIONS = OPT_NAIVE_UTC | OPT_SERIALIZE_NUMPY
+VOLATILE_DOCUMENTS = frozenset({"event", "event_page"})
+PRIORITY_DOCUMENTS = frozenset({"start", "descriptor", "stop"})
+MSG_ID_HEADER = "Nats-Msg-Id"
+SPOOL_REPLAY_BATCH = 256
+SPOOL_REPLAY_WINDOW = 64
+SPOOL_RETRY_INTERVAL = 1.0
+RUN_TRACKER_LIMIT = 16
+# failures that are expected to go away once the connection or stream is back
+TRANSIENT_PUBLISH_ERRORS: tuple[type[Exception], ...] = (
+    ConnectionError,
+    TimeoutError,
+    NoStreamResponseError,
+    ConnectionClosedError,
+    ConnectionReconnectingError,
+    NoServersError,
+    OutboundBufferLimitError,
+    StaleConnectionError,
+)
 
 if TYPE_CHECKING:
-    from collections.abc import Callable, Coroutine
+    from collections.abc import Callable, Coroutine, Iterable, Sequence
     from uuid import UUID
 
+    import numpy as np
     from nats.js import JetStreamContext
+    from nats.js.object_store import ObjectStore
+
+    from bluesky_nats.spool import SpoolRecord
+
+
+class CoroutineBatch:
+    """Completion handle of coroutines submitted with `submit_coroutines(..., handle=True)`.
+
+    Completions are counted on the IO loop instead of resolving a Future per coroutine.
+    Results are discarded, exceptions are collected in `exceptions`.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.exceptions: list[BaseException] = []
+        self._remaining = size
+        self._done = threading.Event()
+        if not size:
+            self._done.set()
+
+    @property
+    def pending(self) -> int:
+        return self._remaining
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until every coroutine of the batch is done, returns False on timeout."""
+        return self._done.wait(timeout)
+
+    def _task_done(self, task: asyncio.Task[Any]) -> None:
+        self._complete(asyncio.CancelledError() if task.cancelled() else task.exception())
+
+    def _complete(self, exception: BaseException | None) -> None:
+        if exception is not None:
+            self.exceptions.append(exception)
+        self._remaining -= 1
+        if not self._remaining:
+            self._done.set()
+
+
+def _resolve_future(future: Future[Any], task: asyncio.Task[Any]) -> None:
+    """Copy the outcome of a task to the Future returned by `submit_coroutine`."""
+    if task.cancelled():
+        future.cancel()
+    if not future.set_running_or_notify_cancel():
+        return
+    exception = task.exception()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(task.result())
+
+
+class LoopImplementation(StrEnum):
+    ASYNCIO = "asyncio"
+    UVLOOP = "uvloop"
+    AUTO = "auto"
+
+
+def new_event_loop(implementation: LoopImplementation | str = LoopImplementation.ASYNCIO) -> asyncio.AbstractEventLoop:
+    """Create an event loop, `AUTO` uses uvloop if it is installed and asyncio otherwise."""
+    implementation = LoopImplementation(implementation)
+    if implementation != LoopImplementation.ASYNCIO:
+        try:
+            uvloop = importlib.import_module("uvloop")
+        except ImportError as e:
+            if implementation == LoopImplementation.UVLOOP:
+                msg = "The uvloop event loop requires the 'uvloop' library. Please install it."
+                raise ImportError(msg) from e
+        else:
+            return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
 
 
 class CoroutineExecutor(Executor):
-    def __init__(self) -> None:
-        self._io_loop = asyncio.new_event_loop()
-        self._io_loop_thread = threading.Thread(target=self._run_io_loop, name="nats-coroutine-executor", daemon=True)
-        self._thread_pool = ThreadPoolExecutor()
+    """Run coroutines on an event loop in a thread of its own.
+
+    Submitted coroutines go into a queue that the loop drains in bulk: submissions arriving
+    while a drain is already scheduled add no further cross-thread wakeup, and tasks start
+    in submission order. `submit_coroutines` queues many coroutines at once and can return
+    a single `CoroutineBatch` handle instead of one Future per coroutine.
+
+    `loop_implementation` selects the event loop, see `LoopImplementation`; uvloop speeds
+    up socket handling on the IO thread. The IO thread is named `thread_name` and, on
+    Linux, runs with the niceness `nice` (lowering it needs privileges). The thread pool
+    for plain callables is only created on the first `submit` of one, with `max_workers`
+    threads.
+    """
+
+    def __init__(
+        self,
+        *,
+        loop_implementation: LoopImplementation | str = LoopImplementation.ASYNCIO,
+        max_workers: int | None = None,
+        thread_name: str = "nats-coroutine-executor",
+        nice: int | None = None,
+    ) -> None:
+        if max_workers is not None and max_workers < 1:
+            msg = f"max_workers must be a positive integer or None, got {max_workers}"
+            raise ValueError(msg)
+        self._io_loop = new_event_loop(loop_implementation)
+        self._io_loop_thread = threading.Thread(target=self._run_io_loop, name=thread_name, daemon=True)
+        self._nice = nice
+        self._max_workers = max_workers
+        self._thread_pool: ThreadPoolExecutor | None = None
         self._shutdown_lock = Lock()
         self._is_shutdown = False
+        # deque appends and pops are atomic, only the loop pops
+        self._submissions: deque[tuple[Coroutine[Any, Any, Any], Future[Any] | CoroutineBatch]] = deque()
+        self._wakeup_pending = False
         self._io_loop_thread.start()
 
     def _run_io_loop(self) -> None:
+        if self._nice is not None:
+            self._set_thread_nice(self._nice)
         asyncio.set_event_loop(self._io_loop)
         try:
             self._io_loop.run_forever()
         finally:
+            self._discard_submissions()
             if not self._io_loop.is_closed():
                 self._io_loop.close()
 
+    @staticmethod
+    def _set_thread_nice(nice: int) -> None:
+        if not sys.platform.startswith("linux"):
+            # elsewhere the niceness applies to the whole process
+            logger.warning("CoroutineExecutor nice is only supported on Linux, ignored")
+            return
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+        except OSError as e:
+            logger.warning(f"CoroutineExecutor could not set the IO thread niceness to {nice}: {e!s}")
+
     def submit_coroutine(self, coro: Coroutine[Any, Any, Any]) -> Future[Any]:
+        future: Future[Any] = Future()
+        self._enqueue([(coro, future)])
+        return future
+
+    @overload
+    def submit_coroutines(
+        self, coros: Iterable[Coroutine[Any, Any, Any]], *, handle: Literal[False] = False
+    ) -> list[Future[Any]]: ...
+
+    @overload
+    def submit_coroutines(
+        self, coros: Iterable[Coroutine[Any, Any, Any]], *, handle: Literal[True]
+    ) -> CoroutineBatch: ...
+
+    def submit_coroutines(
+        self, coros: Iterable[Coroutine[Any, Any, Any]], *, handle: bool = False
+    ) -> list[Future[Any]] | CoroutineBatch:
+        """Queue coroutines with a single wakeup of the loop, they start in the given order.
+
+        Returns a Future per coroutine, or with `handle=True` one `CoroutineBatch` for all of them.
+        """
+        coros = list(coros)
+        if handle:
+            batch = CoroutineBatch(len(coros))
+            self._enqueue([(coro, batch) for coro in coros])
+            return batch
+        futures: list[Future[Any]] = [Future() for _ in coros]
+        self._enqueue(list(zip(coros, futures, strict=True)))
+        return futures
+
+    def _enqueue(self, items: list[tuple[Coroutine[Any, Any, Any], Future[Any] | CoroutineBatch]]) -> None:
         with self._shutdown_lock:
             if self._is_shutdown:
-                coro.close()
+                for coro, _ in items:
+                    coro.close()
                 msg = "CoroutineExecutor is shut down"
                 raise RuntimeError(msg)
-        return asyncio.run_coroutine_threadsafe(coro, self._io_loop)
+        self._submissions.extend(items)
+        if self._wakeup_pending:
+            return
+        self._wakeup_pending = True
+        try:
+            self._io_loop.call_soon_threadsafe(self._drain_submissions)
+        except RuntimeError:
+            self._discard_submissions()
+            raise
+
+    def _drain_submissions(self) -> None:
+        # cleared first, so anything queued from now on schedules another drain
+        self._wakeup_pending = False
+        submissions = self._submissions
+        loop = self._io_loop
+        while submissions:
+            coro, target = submissions.popleft()
+            if isinstance(target, CoroutineBatch):
+                loop.create_task(coro).add_done_callback(target._task_done)  # noqa: SLF001
+                continue
+            if target.cancelled():
+                coro.close()
+                continue
+            task = loop.create_task(coro)
+            task.add_done_callback(partial(_resolve_future, target))
+            target.add_done_callback(partial(self._cancel_task, task))
+
+    def _cancel_task(self, task: asyncio.Task[Any], future: Future[Any]) -> None:
+        if future.cancelled() and not self._io_loop.is_closed():
+            self._io_loop.call_soon_threadsafe(task.cancel)
+
+    def _discard_submissions(self) -> None:
+        """Close coroutines that never reached the loop and cancel their Futures."""
+        while self._submissions:
+            coro, target = self._submissions.popleft()
+            coro.close()
+            if isinstance(target, CoroutineBatch):
+                target._complete(asyncio.CancelledError())  # noqa: SLF001
+            else:
+                target.cancel()
 
     def submit(self, fn: object, *args, **kwargs) -> Any:  # noqa: ANN002
         if not callable(fn):
@@ -65,7 +296,12 @@ class CoroutineExecutor(Executor):
             if self._is_shutdown:
                 msg = "CoroutineExecutor is shut down"
                 raise RuntimeError(msg)
-        return self._thread_pool.submit(callable_fn, *args, **kwargs)
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix=f"{self._io_loop_thread.name}-worker"
+                )
+            thread_pool = self._thread_pool
+        return thread_pool.submit(callable_fn, *args, **kwargs)
 
     def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:  # noqa: FBT001, FBT002
         with self._shutdown_lock:
@@ -73,7 +309,8 @@ class CoroutineExecutor(Executor):
                 return
             self._is_shutdown = True
 
-        self._thread_pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=wait, cancel_futures=cancel_futures)
 
         if self._io_loop.is_running():
             self._io_loop.call_soon_threadsafe(self._io_loop.stop)
@@ -89,22 +326,236 @@ class CoroutineSubmittingExecutor(Protocol):
     def submit_coroutine(self, coro: Coroutine[Any, Any, Any]) -> Future[Any]: ...
 
 
+class WindowPolicy(StrEnum):
+    BLOCK = "block"
+    DROP = "drop"
+    RAISE = "raise"
+
+
+@dataclass(frozen=True)
+class PublishWindow:
+    """Bound on in-flight publishes, by message count and/or payload bytes.
+
+    When the window is full, `BLOCK` waits up to `timeout` seconds for capacity and then
+    raises `TimeoutError`, `RAISE` raises `RuntimeError` immediately, and `DROP` discards
+    volatile documents (`event`/`event_page`) while blocking for all other documents.
+    """
+
+    max_messages: int | None = None
+    max_bytes: int | None = None
+    policy: WindowPolicy = WindowPolicy.BLOCK
+    timeout: float = NATS_TIMEOUT
+
+    def __post_init__(self):
+        """Post initialization checks."""
+        for limit in ("max_messages", "max_bytes"):
+            value = getattr(self, limit)
+            if value is not None and value < 1:
+                msg = f"{limit} must be a positive integer or None, got {value}"
+                raise ValueError(msg)
+        WindowPolicy(self.policy)
+
+
+@dataclass(frozen=True)
+class RetryConfig:
+    """Retry transient publish failures with bounded exponential backoff.
+
+    A publish is attempted up to `max_attempts` times, waiting `initial_backoff` seconds
+    after the first failure and `multiplier` times longer after each further one, capped
+    at `max_backoff`.
+    """
+
+    max_attempts: int = 5
+    initial_backoff: float = 0.05
+    max_backoff: float = 2.0
+    multiplier: float = 2.0
+
+    def __post_init__(self):
+        """Post initialization checks."""
+        if self.max_attempts < 1:
+            msg = f"max_attempts must be a positive integer, got {self.max_attempts}"
+            raise ValueError(msg)
+        if self.initial_backoff < 0 or self.max_backoff < self.initial_backoff or self.multiplier < 1:
+            msg = "backoff must satisfy 0 <= initial_backoff <= max_backoff and multiplier >= 1"
+            raise ValueError(msg)
+
+    def backoff(self, attempt: int) -> float:
+        """Delay in seconds after the given failed attempt (1-based)."""
+        return min(self.max_backoff, self.initial_backoff * self.multiplier ** (attempt - 1))
+
+
+def subject_matches(pattern: str, subject: str) -> bool:
+    """Match a subject against a NATS subject pattern with `*` and `>` wildcards."""
+    parts = subject.split(".")
+    pattern_parts = pattern.split(".")
+    for index, part in enumerate(pattern_parts):
+        if part == ">":
+            return len(parts) > index
+        if index >= len(parts) or part not in ("*", parts[index]):
+            return False
+    return len(parts) == len(pattern_parts)
+
+
+@dataclass(frozen=True)
+class CorePublishConfig:
+    """Publish selected documents over core NATS without waiting for a JetStream ack.
+
+    Documents are selected by name (the last subject token) or by NATS subject patterns.
+    Every `sample_every`-th selected document is still published through JetStream; its
+    `PubAck` sequence number, compared with the previous acknowledged publish, gives an
+    estimate of the messages that never reached the stream. Messages are counted per
+    `RouteRule` stream, or per subject prefix without one, and spooled messages are not
+    counted as sent. The estimate assumes that the subjects of a prefix are stored in one
+    stream and is a lower bound when other publishers write to the same stream.
+    `sample_every=None` disables the sampling, the estimate then relies on the acks of the
+    remaining JetStream documents only.
+    """
+
+    documents: frozenset[str] = VOLATILE_DOCUMENTS
+    subjects: tuple[str, ...] = ()
+    sample_every: int | None = 100
+
+    def __post_init__(self):
+        """Post initialization checks."""
+        if self.sample_every is not None and self.sample_every < 1:
+            msg = f"sample_every must be a positive integer or None, got {self.sample_every}"
+            raise ValueError(msg)
+
+    def selects(self, subject: str) -> bool:
+        return subject.rsplit(".", 1)[-1] in self.documents or any(
+            subject_matches(pattern, subject) for pattern in self.subjects
+        )
+
+
+@dataclass(frozen=True)
+class PriorityLanes:
+    """Publish run metadata `documents` ahead of queued bulk documents.
+
+    Priority documents skip the publish window, the serializer thread and the array upload
+    barrier. With `separate_connection=True` they go out on a second NATS connection, so
+    they do not queue behind bulk payloads in the main connection's write buffer either.
+    Within a run, stream order stays the emission order: a priority document waits for
+    the pending publishes of its run, and bulk documents wait for the preceding priority
+    document. Only documents of different runs overtake each other, e.g. the next run's
+    `start` may be stored before the previous run's last events and `stop`.
+    """
+
+    documents: frozenset[str] = PRIORITY_DOCUMENTS
+    separate_connection: bool = False
+
+    def __post_init__(self):
+        """Post initialization checks."""
+        if not self.documents:
+            msg = "documents must not be empty"
+            raise ValueError(msg)
+        object.__setattr__(self, "documents", frozenset(self.documents))
+
+
+def message_id(name: str, doc: dict) -> str | None:
+    """Deterministic JetStream message id for a document, None if it has no unique key."""
+    key = doc.get("datum_id" if name in ("datum", "datum_page") else "uid")
+    if isinstance(key, list):
+        # a page is identified by its first document and its length
+        return f"{name}:{key[0]}:{len(key)}" if key else None
+    return f"{name}:{key}" if key is not None else None
+
+
 @dataclass(frozen=True)
 class PublisherHealth:
     connected: bool
     strict_publish: bool
     pending_publishes: int
+    inflight_bytes: int
+    dropped_publishes: int
+    failed_publishes: int
+    spooled_publishes: int
+    core_publishes: int
+    estimated_lost: int
     last_error: str | None
     last_error_at: float | None
     last_ack_at: float | None
     last_subject: str | None
+    metrics: MetricsSnapshot | None = None
+
+
+class PublishTracker:
+    """Count pending publishes and wait for them with O(1) work per publish.
+
+    Publishes are numbered on submission. Everything up to the completion watermark is
+    done; publishes that complete out of order wait in a heap until the watermark catches
+    up, which is rare because publishes complete in order on one connection.
+    """
+
+    def __init__(self) -> None:
+        self._cond = Condition()
+        self._submitted = 0
+        self._watermark = 0
+        self._ahead: list[int] = []
+        self._callbacks: list[tuple[int, int, Callable[[], None]]] = []
+        self._waiters = 0
+        self.failed = 0
+
+    @property
+    def submitted(self) -> int:
+        return self._submitted
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return self._submitted - self._watermark - len(self._ahead)
+
+    def track(self) -> int:
+        """Number a new publish."""
+        with self._cond:
+            self._submitted += 1
+            return self._submitted
+
+    def complete(self, seq: int, *, failed: bool = False) -> None:
+        with self._cond:
+            if failed:
+                self.failed += 1
+            if seq != self._watermark + 1:
+                heapq.heappush(self._ahead, seq)
+                return
+            self._watermark = seq
+            while self._ahead and self._ahead[0] == self._watermark + 1:
+                self._watermark = heapq.heappop(self._ahead)
+            ready = []
+            while self._callbacks and self._callbacks[0][0] <= self._watermark:
+                ready.append(heapq.heappop(self._callbacks)[2])
+            if self._waiters:
+                self._cond.notify_all()
+        for callback in ready:
+            callback()
+
+    def wait(self, seq: int, timeout: float | None = None) -> bool:
+        """Block until every publish up to `seq` is done, returns False on timeout."""
+        with self._cond:
+            self._waiters += 1
+            try:
+                return self._cond.wait_for(lambda: self._watermark >= seq, timeout=timeout)
+            finally:
+                self._waiters -= 1
+
+    def when_completed(self, seq: int, callback: Callable[[], None]) -> None:
+        """Call `callback` once every publish up to `seq` is done, right away if they are."""
+        with self._cond:
+            if self._watermark < seq:
+                heapq.heappush(self._callbacks, (seq, id(callback), callback))
+                return
+        callback()
+
+
+def _acknowledged(future: Future[Any]) -> bool:
+    """Whether a publish future resolved to an acknowledged publish."""
+    return not future.cancelled() and future.exception() is None and future.result() is not False
 
 
 class Publisher(ABC):
     """Abstract Publisher."""
 
     @abstractmethod
-    async def publish(self, subject: str, payload: bytes, headers: dict) -> None:
+    async def publish(self, subject: str, payload: bytes, headers: dict) -> bool | None:
         """Publish a message to a subject."""
 
     @abstractmethod
@@ -121,7 +572,49 @@ class NATSPublisher(Publisher):
 
     Messages are published by subject and stream routing is handled by the NATS server
     configuration. This publisher intentionally does not select a stream directly; it
-    uses JetStream publish to obtain `PubAck` confirmation from the server.
+    uses JetStream publish to obtain `PubAck` confirmation from the server. Every message
+    carries its run id and a per-run sequence number, which `NATSDispatcher` uses to
+    detect and refetch missing documents.
+
+    With `offload_serialization=True` documents are packed on a dedicated FIFO worker thread
+    instead of the caller's (RunEngine) thread, so documents must not be mutated after they
+    have been emitted.
+
+    With `array_offload` set, large numpy arrays in `event`/`event_page` documents are
+    uploaded to the JetStream Object Store and replaced by references. Later documents are
+    held back until the referencing document is published, so publish order is unchanged.
+
+    With `spool` set, publishes that fail because NATS is unreachable are appended to an
+    on-disk spool instead of being lost, see `SpoolConfig`. A background task replays the
+    spool in order once the connection is back; until it is empty, new publishes are
+    spooled behind it. Records left over on close are replayed by the next publisher
+    using the same spool directory.
+
+    With `retry` set, transient failures (timeouts, reconnects, missing stream responders)
+    are retried with exponential backoff. Every message then carries a deterministic
+    `Nats-Msg-Id` header, derived from the document uid or the run id and a per-run
+    sequence number, so that the JetStream duplicate window discards resent copies. A
+    retried document may be stored after documents published while it was backing off.
+
+    Publishes are also counted per run, so `flush_run` waits for the acknowledgements of
+    one run only, not for documents published after it. With `flush_on_stop` set, this
+    happens automatically after every `stop` document, with `flush_on_stop` as timeout.
+
+    With `metrics=True`, serialization time, executor queueing delay and publish-to-ack
+    latency are recorded in histograms, next to per subject message and byte rates, see
+    `PublisherMetrics`. `health.metrics` carries a snapshot of them.
+
+    Subjects and static headers are compiled once per run and document name by a
+    `DocumentRouter`: a callable `subject_factory` and the `header_factory` are called
+    once per run, not per document. `routes` send selected document types to other
+    subjects, optionally asserting the stream they are stored in, see `RouteRule`.
+
+    With `priority_lanes` set, run metadata documents are published ahead of queued bulk
+    documents, optionally on a connection of their own, see `PriorityLanes`.
+
+    With `tracing` set, sampled documents carry trace context headers that
+    `NATSDispatcher` turns into deserialize, dispatch and callback timings, see
+    `TracingConfig`.
     """
 
     def __init__(
@@ -131,6 +624,20 @@ class NATSPublisher(Publisher):
         subject_factory: Callable[[], str] | str | None = "events.volatile",
         *,
         strict_publish: bool = False,
+        batching: BatchConfig | None = None,
+        window: PublishWindow | None = None,
+        offload_serialization: bool = False,
+        array_offload: ArrayOffloadConfig | None = None,
+        compression: CompressionConfig | None = None,
+        spool: SpoolConfig | None = None,
+        retry: RetryConfig | None = None,
+        core_publish: CorePublishConfig | None = None,
+        flush_on_stop: float | None = None,
+        metrics: bool = False,
+        tracing: TracingConfig | None = None,
+        routes: Sequence[RouteRule] = (),
+        header_factory: HeaderFactory | None = None,
+        priority_lanes: PriorityLanes | None = None,
     ) -> None:
         logger.debug(f"new {self.__class__} instance created.")
 
@@ -143,10 +650,18 @@ class NATSPublisher(Publisher):
         self.executor = executor
         self.nats_client = NATS()
         self.js: JetStreamContext | None = None
+        self._priority_lanes = priority_lanes
+        self._priority_client = NATS() if priority_lanes is not None and priority_lanes.separate_connection else None
+        self._priority_js: JetStreamContext | None = None
+        self._priority_head: Future[Any] | None = None
         self._connect_future: Future[Any] | None = None
         self._connect_lock = Lock()
-        self._publish_futures: set[Future[Any]] = set()
-        self._publish_lock = Lock()
+        self._publishes = PublishTracker()
+        self._reported_failures = 0
+        self._run_publishes: OrderedDict[Any, PublishTracker] = OrderedDict()
+        self._flush_on_stop = flush_on_stop
+        self._metrics = PublisherMetrics() if metrics else None
+        self._tracer = TraceContext(tracing) if tracing is not None else None
         self._strict_publish = strict_publish
         self._strict_error_lock = Lock()
         self._strict_error: BaseException | None = None
@@ -155,8 +670,33 @@ class NATSPublisher(Publisher):
         self._last_error_at: float | None = None
         self._last_ack_at: float | None = None
         self._last_subject: str | None = None
-
-        self._subject_factory: str | Callable[[], str] = self.validate_subject_factory(subject_factory)
+        self._window = window
+        self._window_cond = Condition()
+        self._inflight_messages = self._inflight_bytes = self._dropped_publishes = 0
+        self._offload_serialization = offload_serialization
+        self._serializer: ThreadPoolExecutor | None = None
+        self._serializer_lock = Lock()
+        self._array_offload = array_offload
+        self._object_store: ObjectStore | None = None
+        self._order_barrier: asyncio.Future[None] | None = None
+        self._compression = compression
+        self._codec = get_codec(compression.codec, compression.level) if compression is not None else None
+        self._spool = ThreadedSpool(SegmentSpool(spool)) if spool is not None else None
+        self._spool_replay: asyncio.Task[None] | None = None
+        self._retry = retry
+        self._sequence = SequenceCounter()
+        self._core_publish = core_publish
+        self._core_selected = self._core_publishes = self._estimated_lost = self._failed_publishes = 0
+        # per stream key: messages sent, sent messages spooled instead, last (stream, seq, sent, spooled) ack
+        self._sent_messages, self._unsent_messages = Counter[str](), Counter[str]()
+        self._stream_marks: dict[str, tuple[str, int, int, int]] = {}
+
+        self._router = DocumentRouter(self.validate_subject_factory(subject_factory), routes, header_factory)
+        self._batcher = (
+            DocumentBatcher(self._publish_document, batching, self._record_strict_error)
+            if batching is not None
+            else None
+        )
 
         self._run_id: UUID
 
@@ -164,38 +704,293 @@ class NATSPublisher(Publisher):
         """Make instances of this Publisher callable."""
         self._raise_if_strict_error()
 
-        subject_factory = self._subject_factory
-        subject = f"{subject_factory}.{name}" if isinstance(subject_factory, str) else f"{subject_factory()}.{name}"
+        if self._batcher is not None:
+            self._batcher(name, doc)
+            return
+        self._publish_document(name, doc)
 
+    def _publish_document(self, name: str, doc: dict, after: Sequence[Future[Any]] = ()) -> Future[Any] | None:
+        """Submit a document, held back until the `after` futures are done, see `ShardedNATSPublisher`."""
+        self.update_run_id(name, doc)
+        route = self._router.route(self.run_id, name)
+        subject = route.subject
+        # a single attribute store, `health` reads it under the lock
+        self._last_subject = subject
+
+        headers = dict(route.headers)
+        uploads: list[tuple[str, np.ndarray]] = []
+        if self._array_offload is not None:
+            doc, uploads = externalize_arrays(name, doc, self._array_offload)
+
+        priority = self._priority_lanes is not None and name in self._priority_lanes.documents
+        after = self._lane_dependencies(after, priority=priority)
+        if self._offload_serialization and not priority:
+            publish_future = self._submit_offloaded(name, subject, doc, headers, uploads, after=after)
+        else:
+            publish_future = self._submit_inline(name, subject, doc, headers, uploads, after=after, priority=priority)
+        if priority:
+            self._priority_head = publish_future
+        logger.debug(f"NATS publisher state connected={self.nats_client.is_connected}, js_ready={self.js is not None}")
+        if name == "stop" and self._flush_on_stop is not None:
+            self._flush_stopped_run(doc["run_start"], self._flush_on_stop)
+        return publish_future
+
+    def _lane_dependencies(self, after: Sequence[Future[Any]], *, priority: bool) -> Sequence[Future[Any]]:
+        """Add the publishes a document must wait for to keep its run in order across the lanes."""
+        if self._priority_lanes is None:
+            return after
+        if priority:
+            drained = self._run_drained(self.run_id)
+            return (*after, drained) if drained is not None else after
+        head = self._priority_head
+        if head is not None and not head.done():
+            # the priority document may still wait for its run or use another connection
+            return (*after, head)
+        return after
+
+    def _run_drained(self, run_id: UUID) -> Future[None] | None:
+        """Future resolved once the publishes of `run_id` submitted so far are done, None if there are none."""
         with self._health_lock:
-            self._last_subject = subject
+            run = self._run_publishes.get(run_id)
+        if run is None or not run.pending:
+            return None
+        drained: Future[None] = Future()
+        run.when_completed(run.submitted, lambda: drained.set_result(None))
+        return drained
+
+    def _flush_stopped_run(self, run_id: UUID, timeout: float) -> None:
+        if self.flush_run(run_id, timeout=timeout):
+            return
+        msg = f"NATS publishes of run {run_id} were not all acknowledged within {timeout}s"
+        if self._strict_publish:
+            raise RuntimeError(msg)
+        logger.warning(msg)
+
+    def _stamp_sequence(self, name: str, doc: dict, headers: dict) -> None:
+        """Number a document admitted into the window, dropped documents must not leave a gap."""
+        seq = self._sequence.next(self.run_id)
+        headers[SEQUENCE_HEADER] = seq
+        if self._retry is not None:
+            headers[MSG_ID_HEADER] = message_id(name, doc) or f"{self.run_id}:{seq}"
+        if self._tracer is not None:
+            self._tracer.inject(headers, self.run_id)
+
+    def _encode(self, doc: dict, headers: dict) -> bytes:
+        """Serialize a document, compressing it and tagging `headers` if configured."""
+        metrics = self._metrics
+        started = time.perf_counter_ns() if metrics is not None else 0
+        payload = packb(doc, option=PACKB_OPTIONS)
+        if self._codec is not None and len(payload) >= cast("CompressionConfig", self._compression).min_size:
+            payload = self._codec.compress(payload)
+            headers[CONTENT_ENCODING_HEADER] = self._codec.name
+        if metrics is not None:
+            metrics.serialization.record(time.perf_counter_ns() - started)
+        return payload
+
+    def _submit_inline(
+        self,
+        name: str,
+        subject: str,
+        doc: dict,
+        headers: dict,
+        uploads: list[tuple[str, np.ndarray]],
+        *,
+        after: Sequence[Future[Any]],
+        priority: bool = False,
+    ) -> Future[Any] | None:
+        payload = self._encode(doc, headers)
+        nbytes = len(payload)
+        if not self._acquire_window(name, nbytes):
+            logger.debug(f"NATS publish window full, dropped {name} document: subject={subject}")
+            return None
+        self._stamp_sequence(name, doc, headers)
+        queued_at = time.perf_counter_ns() if self._metrics is not None else 0
+        return self._submit_publish(
+            self._publish_ordered(subject, payload, headers, uploads, after, queued_at=queued_at, priority=priority),
+            nbytes,
+            headers.get("run_id"),
+        )
 
-        self.update_run_id(name, doc)
-        # TODO: maybe worthwhile refactoring to a header factory for higher flexibility.  # noqa: TD002, TD003
-        headers = {"run_id": self.run_id}
+    def _submit_offloaded(
+        self,
+        name: str,
+        subject: str,
+        doc: dict,
+        headers: dict,
+        uploads: list[tuple[str, np.ndarray]],
+        *,
+        after: Sequence[Future[Any]],
+    ) -> Future[Any] | None:
+        # the payload size is unknown until the worker has packed it, so offloaded payloads
+        # count towards the byte limit only from serialization until publish completion
+        if not self._acquire_window(name, 0):
+            logger.debug(f"NATS publish window full, dropped {name} document: subject={subject}")
+            return None
+        self._stamp_sequence(name, doc, headers)
+        try:
+            payload_future = self._get_serializer().submit(self._encode, doc, headers)
+        except BaseException:
+            self._release_window(0)
+            raise
+        queued_at = time.perf_counter_ns() if self._metrics is not None else 0
+        return self._submit_publish(
+            self._publish_ordered(subject, payload_future, headers, uploads, after, queued_at=queued_at),
+            0,
+            headers.get("run_id"),
+        )
 
-        payload = packb(doc, option=OPT_NAIVE_UTC | OPT_SERIALIZE_NUMPY)
+    def _submit_publish(self, coro: Coroutine[Any, Any, bool], nbytes: int, run_id: UUID | None = None) -> Future[Any]:
         self._start_connect_if_needed()
-        publish_future = self.executor.submit_coroutine(self.publish(subject=subject, payload=payload, headers=headers))
-        with self._publish_lock:
-            self._publish_futures.add(publish_future)
-        publish_future.add_done_callback(self._on_publish_done)
+        try:
+            publish_future = self.executor.submit_coroutine(coro)
+        except BaseException:
+            self._release_window(nbytes)
+            raise
+        publish_future.add_done_callback(lambda _: self._release_window(nbytes))
+        self._track_publish(publish_future, run_id)
         if self._strict_publish and publish_future.done():
             publish_future.result()
-        logger.debug(f"NATS publisher state connected={self.nats_client.is_connected}, js_ready={self.js is not None}")
+        return publish_future
 
-    def _record_strict_error(self, exception: BaseException) -> None:
+    def _get_serializer(self) -> ThreadPoolExecutor:
+        with self._serializer_lock:
+            if self._serializer is None:
+                # a single worker keeps payloads completing in submission order
+                self._serializer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nats-serializer")
+            return self._serializer
+
+    async def _publish_ordered(
+        self,
+        subject: str,
+        payload: bytes | Future[bytes],
+        headers: dict,
+        uploads: list[tuple[str, np.ndarray]],
+        after: Sequence[Future[Any]] = (),
+        *,
+        queued_at: int = 0,
+        priority: bool = False,
+    ) -> bool:
+        if queued_at:
+            cast("PublisherMetrics", self._metrics).queue_delay.record(time.perf_counter_ns() - queued_at)
+        # Tasks start in submission order; the barrier is read before the first await so that
+        # every later document waits for a document that is still uploading its arrays.
+        # Priority documents wait for their own run in `after` instead.
+        barrier = self._order_barrier if not priority else None
+        written: asyncio.Future[None] | None = None
+        if uploads:
+            written = asyncio.get_running_loop().create_future()
+            self._order_barrier = written
+        nbytes = 0
+        try:
+            try:
+                if isinstance(payload, Future):
+                    payload = await asyncio.wrap_future(payload)
+                    nbytes = len(payload)
+                    self._account_window_bytes(nbytes)
+                if uploads:
+                    await self._upload_arrays(uploads)
+                await self._wait_for_predecessors(after, barrier)
+                publish = (
+                    self.publish(subject=subject, payload=payload, headers=headers, priority=True)
+                    if priority
+                    else self.publish(subject=subject, payload=payload, headers=headers)
+                )
+                if written is not None:
+                    # schedule the write ahead of the documents released below
+                    publish = asyncio.ensure_future(publish)
+            finally:
+                if written is not None:
+                    written.set_result(None)
+                    if self._order_barrier is written:
+                        self._order_barrier = None
+            return await publish
+        finally:
+            if nbytes:
+                self._account_window_bytes(-nbytes)
+
+    @staticmethod
+    async def _wait_for_predecessors(after: Sequence[Future[Any]], barrier: asyncio.Future[None] | None) -> None:
+        if after:
+            # publishes on other connections that must be stored first, failed or not
+            await asyncio.wait([asyncio.wrap_future(future) for future in after])
+        if barrier is not None and not barrier.done():
+            await asyncio.wait((barrier,))
+
+    async def _upload_arrays(self, uploads: list[tuple[str, np.ndarray]]) -> None:
+        config = cast("ArrayOffloadConfig", self._array_offload)
+        if self._object_store is None:
+            self._object_store = await get_object_store(await self._get_jetstream(), config)
+        await upload_arrays(self._object_store, uploads, config.chunk_size)
+
+    def _window_has_room(self, nbytes: int) -> bool:
+        window = self._window
+        if window is None:
+            return True
+        if window.max_messages is not None and self._inflight_messages >= window.max_messages:
+            return False
+        # a single oversized payload is admitted into an empty window rather than blocking forever
+        return (
+            window.max_bytes is None or self._inflight_bytes == 0 or self._inflight_bytes + nbytes <= window.max_bytes
+        )
+
+    def _acquire_window(self, name: str, nbytes: int) -> bool:
+        """Reserve in-flight capacity for a publish, returns False if the document was dropped."""
+        with self._window_cond:
+            if not self._window_has_room(nbytes) and not self._bypasses_window(name):
+                window = cast("PublishWindow", self._window)
+                if window.policy == WindowPolicy.RAISE:
+                    msg = f"NATS publish window full: messages={self._inflight_messages}, bytes={self._inflight_bytes}"
+                    raise RuntimeError(msg)
+                if window.policy == WindowPolicy.DROP and name in VOLATILE_DOCUMENTS:
+                    self._dropped_publishes += 1
+                    return False
+                if not self._window_cond.wait_for(lambda: self._window_has_room(nbytes), timeout=window.timeout):
+                    msg = f"NATS publish window did not free up within {window.timeout}s"
+                    raise TimeoutError(msg)
+            self._inflight_messages += 1
+            self._inflight_bytes += nbytes
+        return True
+
+    def _bypasses_window(self, name: str) -> bool:
+        """Priority documents are admitted into a full window, they are few and small."""
+        return self._priority_lanes is not None and name in self._priority_lanes.documents
+
+    def _account_window_bytes(self, nbytes: int) -> None:
+        with self._window_cond:
+            self._inflight_bytes += nbytes
+            if nbytes < 0:
+                self._window_cond.notify_all()
+
+    def _release_window(self, nbytes: int) -> None:
+        with self._window_cond:
+            self._inflight_messages -= 1
+            self._inflight_bytes -= nbytes
+            self._window_cond.notify_all()
+
+    def _record_error(self, exception: BaseException) -> None:
         with self._health_lock:
             self._last_error = f"{type(exception).__name__}: {exception!s}"
             self._last_error_at = time.time()
 
+    def _record_strict_error(self, exception: BaseException) -> None:
+        self._record_error(exception)
+
         if not self._strict_publish:
             return
         with self._strict_error_lock:
             if self._strict_error is None:
                 self._strict_error = exception
 
-    def _record_publish_ack(self, subject: str) -> None:
+    def _count_failed_publish(self) -> None:
+        # spooled publishes are not counted, they reach the stream once the spool is replayed
+        with self._health_lock:
+            self._failed_publishes += 1
+
+    def _record_publish_ack(self, subject: str, nbytes: int = 0, started: int = 0) -> None:
+        metrics = self._metrics
+        if metrics is not None and started:
+            metrics.ack_latency.record(time.perf_counter_ns() - started)
+            metrics.record_publish(subject, nbytes)
         with self._health_lock:
             self._last_subject = subject
             self._last_ack_at = time.time()
@@ -255,75 +1050,143 @@ class NATSPublisher(Publisher):
         self._record_strict_error(exception)
         logger.debug(f"NATS connect future failed: {exception!s}")
 
-    def _on_publish_done(self, future: Future[Any]) -> None:
-        with self._publish_lock:
-            self._publish_futures.discard(future)
-        exception = future.exception()
+    def _track_publish(self, future: Future[Any], run_id: UUID | None = None) -> int:
+        seq = self._publishes.track()
+        future.add_done_callback(lambda done: self._on_publish_done(done, seq))
+        if run_id is not None:
+            run = self._run_tracker(run_id)
+            run_seq = run.track()
+            future.add_done_callback(lambda done: run.complete(run_seq, failed=not _acknowledged(done)))
+        return seq
+
+    def _run_tracker(self, run_id: UUID) -> PublishTracker:
+        with self._health_lock:
+            run = self._run_publishes.get(run_id)
+            if run is None:
+                run = self._run_publishes[run_id] = PublishTracker()
+                # forget the oldest runs once they are done, a run that is still pending is kept
+                while (
+                    len(self._run_publishes) > RUN_TRACKER_LIMIT
+                    and not next(iter(self._run_publishes.values())).pending
+                ):
+                    self._run_publishes.popitem(last=False)
+            return run
+
+    def _on_publish_done(self, future: Future[Any], seq: int) -> None:
+        exception = FutureCancelledError() if future.cancelled() else future.exception()
+        # like `flush_run`, a publish that returned False (spooled or swallowed error) fails the flush
+        self._publishes.complete(seq, failed=not _acknowledged(future))
         if exception is None:
             logger.debug("NATS publish future completed")
             return
+        self._count_failed_publish()
         self._record_strict_error(exception)
         logger.debug(f"NATS publish future failed: {exception!s}")
 
+    def _flush_result(self, *, done: bool, timeout: float) -> bool:
+        failed = self._publishes.failed - self._reported_failures
+        if not done:
+            logger.warning(f"NATS flush timed out within {timeout}s with pending={self._publishes.pending}")
+            return False
+        self._reported_failures += failed
+        if failed:
+            logger.warning(f"NATS flush complete: {failed} publishes were not acknowledged since the last flush")
+            return False
+        logger.debug("NATS flush complete: no pending publishes")
+        return True
+
     def flush_publishes(self, timeout: float = NATS_TIMEOUT) -> bool:
-        deadline = time.monotonic() + timeout
-        had_failure = False
-        while True:
-            with self._publish_lock:
-                pending_futures = list(self._publish_futures)
-            if not pending_futures:
-                logger.debug("NATS flush complete: no pending publish futures")
-                return not had_failure
-            remaining = deadline - time.monotonic()
-            if remaining <= 0:
-                logger.warning(f"NATS flush timed out with pending={len(pending_futures)}")
-                return False
-            publish_future = pending_futures[0]
-            try:
-                publish_future.result(timeout=remaining)
-                with self._publish_lock:
-                    self._publish_futures.discard(publish_future)
-            except FutureTimeoutError:
-                logger.warning(f"NATS flush timed out waiting for publish completion within {timeout}s")
-                return False
-            except FutureCancelledError as e:
-                had_failure = True
-                self._record_strict_error(e)
-                with self._publish_lock:
-                    self._publish_futures.discard(publish_future)
-            except Exception as e:  # noqa: BLE001
-                had_failure = True
-                self._record_strict_error(e)
-                with self._publish_lock:
-                    self._publish_futures.discard(publish_future)
+        """Wait for all publishes submitted so far, returns False on timeout or if any was not acknowledged."""
+        if self._batcher is not None:
+            self._batcher.flush()
+        done = self._publishes.wait(self._publishes.submitted, timeout)
+        return self._flush_result(done=done, timeout=timeout)
+
+    def _run_flush_target(self, run_id: UUID) -> tuple[PublishTracker, int] | None:
+        if self._batcher is not None:
+            self._batcher.flush()
+        with self._health_lock:
+            run = self._run_publishes.get(run_id)
+        return (run, run.submitted) if run is not None else None
+
+    @staticmethod
+    def _run_flush_result(run_id: UUID, run: PublishTracker, *, done: bool, timeout: float) -> bool:
+        if not done:
+            logger.warning(f"NATS flush of run {run_id} timed out within {timeout}s with pending={run.pending}")
+            return False
+        if run.failed:
+            logger.warning(f"NATS flush of run {run_id} complete: {run.failed} publishes were not acknowledged")
+            return False
+        return True
+
+    def flush_run(self, run_id: UUID, timeout: float = NATS_TIMEOUT) -> bool:
+        """Wait for the acknowledgements of all documents of `run_id` published so far.
+
+        Returns False on timeout or if any of them failed or was spooled. Publishes submitted
+        later, of this or any other run, are not waited for. Runs that are unknown, or too
+        old to be tracked, count as flushed.
+        """
+        target = self._run_flush_target(run_id)
+        if target is None:
+            return True
+        run, seq = target
+        return self._run_flush_result(run_id, run, done=run.wait(seq, timeout), timeout=timeout)
+
+    @property
+    def metrics(self) -> PublisherMetrics | None:
+        """Live instrumentation, None unless the publisher was created with `metrics=True`."""
+        return self._metrics
 
     @property
     def health(self) -> PublisherHealth:
-        with self._publish_lock:
-            pending_publishes = len(self._publish_futures)
         with self._health_lock:
             last_error = self._last_error
             last_error_at = self._last_error_at
             last_ack_at = self._last_ack_at
             last_subject = self._last_subject
+            core_publishes = self._core_publishes
+            estimated_lost = self._estimated_lost
+            failed_publishes = self._failed_publishes
+        with self._window_cond:
+            inflight_bytes = self._inflight_bytes
+            dropped_publishes = self._dropped_publishes
+        spooled_publishes = self._spool.pending_records if self._spool is not None else 0
         connected = self.nats_client.is_connected and self.js is not None
         return PublisherHealth(
             connected=connected,
             strict_publish=self._strict_publish,
-            pending_publishes=pending_publishes,
+            pending_publishes=self._publishes.pending,
+            inflight_bytes=inflight_bytes,
+            dropped_publishes=dropped_publishes,
+            failed_publishes=failed_publishes,
+            spooled_publishes=spooled_publishes,
+            core_publishes=core_publishes,
+            estimated_lost=estimated_lost,
             last_error=last_error,
             last_error_at=last_error_at,
             last_ack_at=last_ack_at,
             last_subject=last_subject,
+            metrics=self._metrics.snapshot() if self._metrics is not None else None,
         )
 
     async def _drain_and_close_nats(self) -> None:
+        replay, self._spool_replay = self._spool_replay, None
+        if replay is not None and not replay.done():
+            replay.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await replay
+        if self._priority_client is not None:
+            self._priority_js = None
+            if self._priority_client.is_connected:
+                await self._priority_client.drain()
         if self.nats_client.is_connected:
             await self.nats_client.drain()
             return
         await self.nats_client.close()
 
     def close(self, timeout: float = NATS_TIMEOUT) -> bool:
+        if self._batcher is not None:
+            self._batcher.close()
         ok = self.flush_publishes(timeout=timeout)
 
         try:
@@ -336,12 +1199,22 @@ class NATSPublisher(Publisher):
             logger.exception("NATS close failed")
             ok = False
         finally:
-            with self._connect_lock:
-                self._connect_future = None
-                self.js = None
+            self._release_resources()
 
         return ok
 
+    def _release_resources(self) -> None:
+        with self._connect_lock:
+            self._connect_future = None
+            self.js = None
+            self._priority_js = None
+        with self._serializer_lock:
+            serializer, self._serializer = self._serializer, None
+        if serializer is not None:
+            serializer.shutdown(wait=False)
+        if self._spool is not None:
+            self._spool.close()
+
     def shutdown_callback(
         self, *, timeout: float = NATS_TIMEOUT, shutdown_executor: bool = False
     ) -> Callable[[], None]:
@@ -370,10 +1243,24 @@ class NATSPublisher(Publisher):
         try:
             await self.nats_client.connect(**asdict(config))
             self.js = self.nats_client.jetstream()
+            self._object_store = None
             logger.info(f"NATS connected: is_connected={self.nats_client.is_connected}, servers={config.servers}")
         except Exception:
             logger.exception(f"NATS connect failed: servers={config.servers}")
             raise
+        if self._priority_client is not None:
+            await self._connect_priority_lane(config)
+        self._ensure_spool_replay()
+
+    async def _connect_priority_lane(self, config: NATSClientConfig) -> None:
+        client = cast("NATS", self._priority_client)
+        try:
+            if not client.is_connected:
+                await client.connect(**asdict(config))
+            self._priority_js = client.jetstream()
+        except Exception as e:  # noqa: BLE001
+            # priority documents still keep their order through their dependencies
+            logger.warning(f"NATS priority lane connect failed, using the main connection: {e!s}")
 
     def _start_connect_if_needed(self) -> None:
         is_connected = self.nats_client.is_connected and self.js is not None
@@ -400,8 +1287,10 @@ class NATSPublisher(Publisher):
             msg = f"{e!s}"
             raise ConnectionError(msg) from e
 
-    async def _get_jetstream(self) -> JetStreamContext:
+    async def _get_jetstream(self, *, priority: bool = False) -> JetStreamContext:
         await self._ensure_connected()
+        if priority and self._priority_js is not None:
+            return self._priority_js
         if self.js is None:
             msg = "NATS JetStream context is not available"
             raise ConnectionError(msg)
@@ -415,21 +1304,196 @@ class NATSPublisher(Publisher):
     def run_id(self, value: UUID) -> None:
         self._run_id = value
 
-    async def publish(self, subject: str, payload: bytes, headers: dict) -> None:
-        """Publish a message to a subject."""
-        js = await self._get_jetstream()
-        try:
-            ack = await js.publish(subject=subject, payload=payload, headers=headers)
-            self._record_publish_ack(subject)
+    async def publish(self, subject: str, payload: bytes, headers: dict, *, priority: bool = False) -> bool:
+        """Publish a message to a subject, returns True once it is acknowledged or sent over core NATS.
+
+        With `priority`, the message goes out on the priority lane connection if there is one.
+        """
+        stream_key = self._stream_key(subject, headers) if self._core_publish is not None else None
+        if stream_key is not None and self._use_core_publish(subject):
+            self._count_sent(stream_key)
+            return await self._publish_core(subject, payload, headers, stream_key)
+        if self._spool is not None and self._spool.pending_records:
+            # queue up behind the records waiting for replay to keep publish order
+            if not await self._spool_publish(subject, payload, headers):
+                msg = f"NATS spool full, lost publish: subject={subject}"
+                raise RuntimeError(msg)
+            return False
+        sent_index = self._count_sent(stream_key) if stream_key is not None else 0
+        started = time.perf_counter_ns() if self._metrics is not None else 0
+        attempt = 1
+        while True:
+            try:
+                js = await self._get_jetstream(priority=priority)
+                ack = await js.publish(subject=subject, payload=payload, headers=headers)
+            except TRANSIENT_PUBLISH_ERRORS as e:
+                if self._retry is None or attempt >= self._retry.max_attempts:
+                    error = e
+                    break
+                delay = self._retry.backoff(attempt)
+                logger.debug(f"NATS publish attempt {attempt} failed, retrying in {delay}s: subject={subject}, {e!s}")
+                attempt += 1
+                # only this publish sleeps, other publishes keep flowing on the IO loop
+                await asyncio.sleep(delay)
+                continue
+            except Exception as e:  # noqa: BLE001
+                error = e
+                break
+            self._record_publish_ack(subject, len(payload), started)
+            if stream_key is not None:
+                self._verify_stream_sequence(ack, stream_key, sent_index)
             logger.debug(f"NATS published: subject={subject}, is_connected={self.nats_client.is_connected}, ack={ack}")
-        except NoStreamResponseError as e:
-            self._record_strict_error(e)
-            logger.exception(
-                f"NATS no stream response: subject={subject}, is_connected={self.nats_client.is_connected}"
-            )
+            return True
+        if await self._publish_failed(subject, payload, headers, error) and stream_key is not None:
+            # the spooled message reaches the stream later, it was not sent now
+            self._unsent_messages[stream_key] += 1
+        return False
+
+    @staticmethod
+    def _stream_key(subject: str, headers: dict) -> str:
+        """Stream a message is stored in if the route says so, otherwise its subject prefix."""
+        return headers.get(EXPECTED_STREAM_HEADER) or subject.rpartition(".")[0]
+
+    def _count_sent(self, stream_key: str) -> int:
+        """Count a message sent towards `stream_key`, returns its index."""
+        self._sent_messages[stream_key] += 1
+        return self._sent_messages[stream_key]
+
+    def _use_core_publish(self, subject: str) -> bool:
+        config = cast("CorePublishConfig", self._core_publish)
+        if not config.selects(subject):
+            return False
+        self._core_selected += 1
+        # every sample_every-th selected message goes through JetStream as a sequence probe
+        return config.sample_every is None or self._core_selected % config.sample_every != 0
+
+    async def _publish_core(self, subject: str, payload: bytes, headers: dict, stream_key: str) -> bool:
+        try:
+            await self._ensure_connected()
+            await self.nats_client.publish(subject, payload, headers=headers)
         except Exception as e:  # noqa: BLE001
-            self._record_strict_error(e)
-            logger.exception(f"NATS publish failed: subject={subject}, is_connected={self.nats_client.is_connected}")
+            # fire-and-forget documents are allowed to get lost, this never latches strict mode
+            with self._health_lock:
+                self._estimated_lost += 1
+            # counted as lost already, keep the next probe's sequence gap from counting it again
+            self._unsent_messages[stream_key] += 1
+            self._record_error(e)
+            logger.debug(f"NATS core publish failed: subject={subject}, {e!s}")
+            return False
+        with self._health_lock:
+            self._core_publishes += 1
+            self._last_subject = subject
+        if self._metrics is not None:
+            self._metrics.record_publish(subject, len(payload))
+        return True
+
+    def _verify_stream_sequence(self, ack: Any, stream_key: str, sent_index: int) -> None:
+        """Compare the stream sequence gap between two acks with the messages sent in between.
+
+        Messages are counted per stream key, so that routes storing into other streams do
+        not inflate the estimate; a key whose acks come from another stream starts over.
+        """
+        if ack.duplicate:
+            return
+        mark = self._stream_marks.get(stream_key)
+        unsent = self._unsent_messages[stream_key]
+        if mark is not None and mark[0] == ack.stream:
+            _, seq, index, unsent_before = mark
+            if sent_index <= index or ack.seq <= seq:
+                # an ack that overtook a later publish carries no new information
+                return
+            missing = (sent_index - index) - (unsent - unsent_before) - (ack.seq - seq)
+            if missing > 0:
+                with self._health_lock:
+                    self._estimated_lost += missing
+                logger.debug(f"NATS stream {ack.stream} is missing an estimated {missing} messages")
+        self._stream_marks[stream_key] = (ack.stream, ack.seq, sent_index, unsent)
+
+    async def _publish_failed(self, subject: str, payload: bytes, headers: dict, error: Exception) -> bool:
+        """Spool or report a failed publish, returns True if it was spooled."""
+        if isinstance(error, TRANSIENT_PUBLISH_ERRORS) and await self._spool_publish(subject, payload, headers, error):
+            return True
+        if isinstance(error, ConnectionError) and self.js is None:
+            # no JetStream context to publish with, fail the publish future
+            raise error
+        self._count_failed_publish()
+        self._record_strict_error(error)
+        if isinstance(error, NoStreamResponseError):
+            logger.error(
+                f"NATS no stream response: subject={subject}, is_connected={self.nats_client.is_connected}",
+                exc_info=error,
+            )
+            return False
+        logger.error(
+            f"NATS publish failed: subject={subject}, is_connected={self.nats_client.is_connected}", exc_info=error
+        )
+        return False
+
+    async def _spool_publish(
+        self, subject: str, payload: bytes, headers: dict, error: BaseException | None = None
+    ) -> bool:
+        """Append a publish to the spool, returns False if there is no spool or it is full."""
+        if self._spool is None:
+            return False
+        if MSG_ID_HEADER not in headers and SEQUENCE_HEADER in headers:
+            # a replay may resend a record the server has stored already, let it drop the copy
+            headers = {**headers, MSG_ID_HEADER: f"{headers.get('run_id')}:{headers[SEQUENCE_HEADER]}"}
+        if not await self._spool.append(subject, headers, payload):
+            logger.error(f"NATS spool full: pending_bytes={self._spool.pending_bytes}, subject={subject}")
+            return False
+        if error is not None:
+            self._record_error(error)
+            logger.warning(f"NATS publish spooled: subject={subject}, error={error!s}")
+        self._ensure_spool_replay()
+        return True
+
+    def _ensure_spool_replay(self) -> None:
+        if self._spool is None or not self._spool.pending_records:
+            return
+        if self._spool_replay is None or self._spool_replay.done():
+            self._spool_replay = asyncio.get_running_loop().create_task(self._replay_spool())
+
+    async def _replay_spool(self) -> None:
+        spool = cast("ThreadedSpool", self._spool)
+        while spool.pending_records:
+            try:
+                js = await self._get_jetstream()
+            except ConnectionError:
+                await asyncio.sleep(SPOOL_RETRY_INTERVAL)
+                continue
+            records = await spool.read(SPOOL_REPLAY_BATCH)
+            acked, error = await self._replay_records(js, records)
+            await spool.commit(records[:acked])
+            if acked:
+                self._record_publish_ack(records[acked - 1].subject)
+            if error is not None:
+                self._record_error(error)
+                logger.warning(f"NATS spool replay failed, retrying: {error!s}")
+                await asyncio.sleep(SPOOL_RETRY_INTERVAL)
+        logger.info("NATS spool replay complete")
+
+    @staticmethod
+    async def _replay_records(js: JetStreamContext, records: list[SpoolRecord]) -> tuple[int, Exception | None]:
+        """Publish records with up to SPOOL_REPLAY_WINDOW acks outstanding, returns the acked prefix and its error.
+
+        No more records are sent after a failure. Records behind it that were acknowledged
+        anyway are sent again with the next batch, the server drops them by their `Nats-Msg-Id`.
+        """
+        inflight: deque[asyncio.Future[Any]] = deque()
+        results: list[Any] = []
+        for record in records:
+            if len(inflight) == SPOOL_REPLAY_WINDOW:
+                results.extend(await asyncio.gather(inflight.popleft(), return_exceptions=True))
+                if isinstance(results[-1], Exception):
+                    break
+            inflight.append(
+                asyncio.ensure_future(
+                    js.publish(subject=record.subject, payload=record.payload, headers=record.headers)
+                )
+            )
+        results.extend(await asyncio.gather(*inflight, return_exceptions=True))
+        acked = next((i for i, result in enumerate(results) if isinstance(result, BaseException)), len(results))
+        return acked, (results[acked] if acked < len(results) else None)
 
     @staticmethod
     def validate_subject_factory(subject_factory: str | Callable[[], str] | None) -> str | Callable[[], str]:
@@ -444,3 +1508,152 @@ class NATSPublisher(Publisher):
             raise TypeError(msg)
         msg = "subject_factory must be a string or a callable"
         raise TypeError(msg)
+
+
+def _on_loop(loop: asyncio.AbstractEventLoop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+class _LoopExecutor:
+    """Schedule coroutines on a given event loop, as a task when already running on it."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+
+    def submit_coroutine(self, coro: Coroutine[Any, Any, Any]) -> Future[Any]:
+        if _on_loop(self.loop):
+            # no thread hop and no concurrent.futures.Future, the task is awaited by aflush()
+            return cast("Future[Any]", self.loop.create_task(coro))
+        if self.loop.is_closed():
+            coro.close()
+            msg = "event loop is closed"
+            raise RuntimeError(msg)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+class AsyncNATSPublisher(NATSPublisher):
+    """`NATSPublisher` running directly on the caller's event loop, e.g. `RE.loop`.
+
+    Documents emitted on `loop` are published from tasks created on that loop, documents
+    emitted from other threads are handed over thread-safely. Health, batching, windows
+    and strict mode behave as for `NATSPublisher`, but nothing may block `loop`: use
+    `await aflush()`, `await aflush_run()`, `await aclose()` and `await aensure_connection()`
+    there, and a publish window that is full raises `RuntimeError` instead of waiting.
+    `flush_on_stop` is not supported since it would block the loop on every `stop`.
+    """
+
+    def __init__(
+        self,
+        client_config: NATSClientConfig | None = None,
+        subject_factory: Callable[[], str] | str | None = "events.volatile",
+        *,
+        loop: asyncio.AbstractEventLoop | None = None,
+        **publisher_options: Any,
+    ) -> None:
+        if publisher_options.get("flush_on_stop") is not None:
+            msg = "AsyncNATSPublisher does not support flush_on_stop, await aflush_run() instead"
+            raise ValueError(msg)
+        self.loop = loop if loop is not None else asyncio.get_running_loop()
+        super().__init__(_LoopExecutor(self.loop), client_config, subject_factory, **publisher_options)
+
+    def _acquire_window(self, name: str, nbytes: int) -> bool:
+        window = self._window
+        if window is not None and _on_loop(self.loop):
+            with self._window_cond:
+                if (
+                    not self._window_has_room(nbytes)
+                    and not self._bypasses_window(name)
+                    and not (window.policy == WindowPolicy.DROP and name in VOLATILE_DOCUMENTS)
+                ):
+                    msg = f"NATS publish window full: messages={self._inflight_messages}, bytes={self._inflight_bytes}"
+                    raise RuntimeError(msg)
+        return super()._acquire_window(name, nbytes)
+
+    def _run_blocking(self, coro: Coroutine[Any, Any, bool], timeout: float, method: str) -> bool:
+        if _on_loop(self.loop):
+            msg = f"AsyncNATSPublisher.{method}() would block its event loop, await {coro.__name__}() instead"
+            coro.close()
+            raise RuntimeError(msg)
+        if not self.loop.is_running():
+            return self.loop.run_until_complete(coro)
+        try:
+            # the coroutine enforces the timeout itself, the margin covers the hand-over
+            return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout=timeout + 1.0)
+        except FutureTimeoutError:
+            logger.warning(f"NATS {method} timed out within {timeout}s")
+            return False
+
+    async def aensure_connection(self, timeout: float = NATS_TIMEOUT) -> bool:  # noqa: ASYNC109
+        try:
+            await asyncio.wait_for(self._get_jetstream(), timeout)
+        except (ConnectionError, TimeoutError) as e:
+            logger.debug(f"NATS connect did not succeed within {timeout}s: {e!s}")
+            return False
+        return True
+
+    def ensure_connection(self, timeout: float = NATS_TIMEOUT) -> bool:
+        return self._run_blocking(self.aensure_connection(timeout), timeout, "ensure_connection")
+
+    async def aflush(self, timeout: float = NATS_TIMEOUT) -> bool:  # noqa: ASYNC109
+        if self._batcher is not None:
+            self._batcher.flush()
+        completed = self.loop.create_future()
+
+        def _set_completed() -> None:
+            if not completed.done():
+                completed.set_result(None)
+
+        self._publishes.when_completed(
+            self._publishes.submitted, lambda: self.loop.call_soon_threadsafe(_set_completed)
+        )
+        try:
+            await asyncio.wait_for(completed, timeout)
+        except TimeoutError:
+            return self._flush_result(done=False, timeout=timeout)
+        return self._flush_result(done=True, timeout=timeout)
+
+    def flush_publishes(self, timeout: float = NATS_TIMEOUT) -> bool:
+        return self._run_blocking(self.aflush(timeout), timeout, "flush_publishes")
+
+    async def aflush_run(self, run_id: UUID, timeout: float = NATS_TIMEOUT) -> bool:  # noqa: ASYNC109
+        target = self._run_flush_target(run_id)
+        if target is None:
+            return True
+        run, seq = target
+        completed = self.loop.create_future()
+
+        def _set_completed() -> None:
+            if not completed.done():
+                completed.set_result(None)
+
+        run.when_completed(seq, lambda: self.loop.call_soon_threadsafe(_set_completed))
+        try:
+            await asyncio.wait_for(completed, timeout)
+        except TimeoutError:
+            return self._run_flush_result(run_id, run, done=False, timeout=timeout)
+        return self._run_flush_result(run_id, run, done=True, timeout=timeout)
+
+    def flush_run(self, run_id: UUID, timeout: float = NATS_TIMEOUT) -> bool:
+        return self._run_blocking(self.aflush_run(run_id, timeout), timeout, "flush_run")
+
+    async def aclose(self, timeout: float = NATS_TIMEOUT) -> bool:  # noqa: ASYNC109
+        if self._batcher is not None:
+            self._batcher.close()
+        ok = await self.aflush(timeout)
+        try:
+            await asyncio.wait_for(self._drain_and_close_nats(), timeout)
+        except TimeoutError:
+            logger.warning(f"NATS close timed out within {timeout}s")
+            ok = False
+        except Exception:  # noqa: BLE001
+            logger.exception("NATS close failed")
+            ok = False
+        finally:
+            self._release_resources()
+        return ok
+
+    def close(self, timeout: float = NATS_TIMEOUT) -> bool:
+        return self._run_blocking(self.aclose(timeout), timeout, "close")
@@ -0,0 +1,133 @@
+import asyncio
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+from nats.js import api
+from nats.js.errors import BucketNotFoundError
+
+
+if TYPE_CHECKING:
+    from nats.js import JetStreamContext
+    from nats.js.object_store import ObjectStore
+
+
+OBJECT_REFERENCE_KEY = "__nats_object__"
+OFFLOADED_DOCUMENTS = frozenset({"event", "event_page"})
+
+
+@dataclass(frozen=True)
+class ArrayOffloadConfig:
+    """Move numpy arrays of at least `threshold` bytes out of event documents.
+
+    Arrays are uploaded to the JetStream Object Store `bucket` in chunks of `chunk_size`
+    bytes and replaced in the document by a reference, see `make_reference`.
+    """
+
+    bucket: str = "bluesky-arrays"
+    threshold: int = 1024 * 1024
+    chunk_size: int = 128 * 1024
+    create_bucket: bool = True
+
+    def __post_init__(self):
+        """Post initialization checks."""
+        if self.threshold < 1 or self.chunk_size < 1:
+            msg = "threshold and chunk_size must be positive integers"
+            raise ValueError(msg)
+
+
+def make_reference(bucket: str, name: str, array: np.ndarray) -> dict:
+    """Compact document entry pointing at an array stored in the Object Store."""
+    return {
+        OBJECT_REFERENCE_KEY: {"bucket": bucket, "name": name, "dtype": array.dtype.str, "shape": list(array.shape)}
+    }
+
+
+def is_reference(value: Any) -> bool:
+    """Check whether a data value is an Object Store reference."""
+    return isinstance(value, dict) and OBJECT_REFERENCE_KEY in value
+
+
+def externalize_arrays(name: str, doc: dict, config: ArrayOffloadConfig) -> tuple[dict, list[tuple[str, np.ndarray]]]:
+    """Replace large arrays in an event/event_page with references.
+
+    Returns the (shallow-copied) document and the `(object name, array)` pairs to upload.
+    The input document is never mutated.
+    """
+    if name not in OFFLOADED_DOCUMENTS:
+        return doc, []
+
+    def _offload(uid: str, key: str, value: Any) -> Any:
+        if not isinstance(value, np.ndarray) or value.nbytes < config.threshold:
+            return value
+        object_name = f"{uid}/{key}"
+        uploads.append((object_name, value))
+        return make_reference(config.bucket, object_name, value)
+
+    uploads: list[tuple[str, np.ndarray]] = []
+    if name == "event":
+        data = {key: _offload(doc["uid"], key, value) for key, value in doc["data"].items()}
+    else:
+        data = {
+            key: [_offload(uid, key, value) for uid, value in zip(doc["uid"], column, strict=True)]
+            for key, column in doc["data"].items()
+        }
+    if not uploads:
+        return doc, []
+    return {**doc, "data": data}, uploads
+
+
+async def get_object_store(js: "JetStreamContext", config: ArrayOffloadConfig) -> "ObjectStore":
+    """Bind the configured bucket, creating it if allowed."""
+    try:
+        return await js.object_store(config.bucket)
+    except BucketNotFoundError:
+        if not config.create_bucket:
+            raise
+        return await js.create_object_store(config.bucket)
+
+
+async def upload_arrays(store: "ObjectStore", uploads: list[tuple[str, np.ndarray]], chunk_size: int) -> None:
+    """Upload arrays concurrently as raw C-ordered bytes."""
+    await asyncio.gather(
+        *(
+            store.put(
+                object_name,
+                np.ascontiguousarray(array).tobytes(),
+                meta=api.ObjectMeta(name=object_name, options=api.ObjectMetaOptions(max_chunk_size=chunk_size)),
+            )
+            for object_name, array in uploads
+        )
+    )
+
+
+class ObjectResolver:
+    """Fetch arrays referenced by externalized documents from the JetStream Object Store."""
+
+    def __init__(self, js: "JetStreamContext") -> None:
+        self._js = js
+        self._stores: dict[str, ObjectStore] = {}
+
+    async def fetch(self, reference: dict) -> np.ndarray:
+        info = reference[OBJECT_REFERENCE_KEY]
+        store = self._stores.get(info["bucket"])
+        if store is None:
+            store = self._stores[info["bucket"]] = await self._js.object_store(info["bucket"])
+        result = await store.get(info["name"])
+        return np.frombuffer(bytearray(result.data or b""), dtype=np.dtype(info["dtype"])).reshape(info["shape"])
+
+    async def _fetch_item(self, value: Any) -> Any:
+        return await self.fetch(value) if is_reference(value) else value
+
+    async def resolve(self, name: str, doc: dict) -> dict:
+        """Replace all references in an event/event_page by the fetched arrays, in place."""
+        if name not in OFFLOADED_DOCUMENTS:
+            return doc
+        data = doc["data"]
+        for key, value in data.items():
+            if name == "event":
+                if is_reference(value):
+                    data[key] = await self.fetch(value)
+            elif any(is_reference(item) for item in value):
+                data[key] = list(await asyncio.gather(*(self._fetch_item(item) for item in value)))
+        return doc
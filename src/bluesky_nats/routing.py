@@ -0,0 +1,80 @@
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+
+EXPECTED_STREAM_HEADER = "Nats-Expected-Stream"
+
+HeaderFactory = Callable[[Any, str], dict[str, str]]
+
+
+@dataclass(frozen=True)
+class RouteRule:
+    """Publish the `documents` to `<subject_prefix>.<document name>` instead of the default subject.
+
+    With `stream` set, JetStream rejects the publish unless the subject is stored in that
+    stream, e.g. to make sure bulk events end up in a different stream than run metadata.
+    """
+
+    documents: frozenset[str]
+    subject_prefix: str
+    stream: str | None = None
+
+    def __post_init__(self):
+        """Post initialization checks."""
+        if not self.documents or not self.subject_prefix:
+            msg = "documents and subject_prefix must not be empty"
+            raise ValueError(msg)
+        object.__setattr__(self, "documents", frozenset(self.documents))
+
+
+@dataclass(frozen=True)
+class Route:
+    subject: str
+    headers: dict[str, str]
+
+
+class DocumentRouter:
+    """Subjects and static headers per document name, compiled once per run.
+
+    A callable `subject_factory` and the `header_factory` are called once per run and
+    document name, not for every document. Routes are dropped when the run changes.
+    Callers must copy `Route.headers` before adding per-message headers.
+    """
+
+    def __init__(
+        self,
+        subject_factory: str | Callable[[], str],
+        rules: Sequence[RouteRule] = (),
+        header_factory: HeaderFactory | None = None,
+    ) -> None:
+        self._subject_factory = subject_factory
+        self._rules = {name: rule for rule in rules for name in rule.documents}
+        if len(self._rules) != sum(len(rule.documents) for rule in rules):
+            msg = "every document name may appear in one RouteRule only"
+            raise ValueError(msg)
+        self._header_factory = header_factory
+        self._run: Any = None
+        self._routes: dict[str, Route] = {}
+
+    def route(self, run_id: Any, name: str) -> Route:
+        if run_id != self._run:
+            self._run, self._routes = run_id, {}
+        route = self._routes.get(name)
+        if route is None:
+            route = self._routes[name] = self._compile(run_id, name)
+        return route
+
+    def _compile(self, run_id: Any, name: str) -> Route:
+        rule = self._rules.get(name)
+        if rule is not None:
+            prefix = rule.subject_prefix
+        else:
+            subject_factory = self._subject_factory
+            prefix = subject_factory if isinstance(subject_factory, str) else subject_factory()
+        headers = {"run_id": run_id}
+        if self._header_factory is not None:
+            headers.update(self._header_factory(run_id, name))
+        if rule is not None and rule.stream is not None:
+            headers[EXPECTED_STREAM_HEADER] = rule.stream
+        return Route(f"{prefix}.{name}", headers)
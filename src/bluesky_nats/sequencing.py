@@ -0,0 +1,76 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+
+SEQUENCE_HEADER = "Bluesky-Seq"
+RUN_HISTORY = 64
+MISSING_HISTORY = 4096
+
+
+def format_sequence(seq: int, source: str = "") -> str:
+    """Header value of a per-run sequence number, `source` tells apart publishers of one run."""
+    return f"{source}:{seq}" if source else str(seq)
+
+
+def parse_sequence(value: str) -> tuple[str, int] | None:
+    """Return `(source, seq)` of a sequence header value, None if malformed."""
+    source, _, seq = value.rpartition(":")
+    try:
+        return source, int(seq)
+    except ValueError:
+        return None
+
+
+class SequenceCounter:
+    """Per-run sequence numbers of one publisher, restarting at 1 with every run."""
+
+    def __init__(self, source: str = "") -> None:
+        self.source = source
+        self._run: object = None
+        self._seq = 0
+
+    def next(self, run_id: object) -> str:
+        """Header value of the next document of `run_id`."""
+        if run_id != self._run:
+            self._run, self._seq = run_id, 0
+        self._seq += 1
+        return format_sequence(self._seq, self.source)
+
+
+@dataclass
+class RunPosition:
+    """Highest sequence number and its stream sequence seen for a run, plus numbers still missing."""
+
+    seq: int
+    stream_seq: int | None
+    missing: set[int] = field(default_factory=set)
+
+    def advance(self, seq: int, stream_seq: int | None) -> None:
+        self.seq = seq
+        if stream_seq is not None:
+            self.stream_seq = stream_seq
+
+    def add_missing(self, missing: set[int]) -> None:
+        self.missing |= missing
+        if len(self.missing) > MISSING_HISTORY:
+            # numbers this far behind are not coming anymore
+            self.missing = {seq for seq in self.missing if seq > self.seq - MISSING_HISTORY}
+
+
+class RunSequences:
+    """Positions of the most recently seen `RUN_HISTORY` runs, keyed by `(run_id, source)`."""
+
+    def __init__(self, max_runs: int = RUN_HISTORY) -> None:
+        self._max_runs = max_runs
+        self._positions: OrderedDict[tuple[str, str], RunPosition] = OrderedDict()
+
+    def get(self, key: tuple[str, str]) -> RunPosition | None:
+        position = self._positions.get(key)
+        if position is not None:
+            self._positions.move_to_end(key)
+        return position
+
+    def start(self, key: tuple[str, str], seq: int, stream_seq: int | None) -> None:
+        self._positions[key] = RunPosition(seq, stream_seq)
+        if len(self._positions) > self._max_runs:
+            self._positions.popitem(last=False)
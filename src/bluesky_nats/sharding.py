@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import zlib
+from threading import Lock
+from typing import TYPE_CHECKING, Any
+
+from bluesky.log import logger
+
+from bluesky_nats.batching import BatchConfig, DocumentBatcher
+from bluesky_nats.metrics import combined_snapshot
+from bluesky_nats.nats_publisher import (
+    NATS_TIMEOUT,
+    VOLATILE_DOCUMENTS,
+    CoroutineSubmittingExecutor,
+    NATSPublisher,
+    Publisher,
+    PublisherHealth,
+)
+
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Sequence
+    from concurrent.futures import Future
+    from uuid import UUID
+
+    from bluesky_nats.nats_client import NATSClientConfig
+
+
+DATUM_DOCUMENTS = frozenset({"datum", "datum_page"})
+
+
+def document_shard_key(name: str, doc: dict) -> str:
+    """Default shard key: events follow their descriptor, datums their resource, the rest their run."""
+    if name in VOLATILE_DOCUMENTS:
+        return doc["descriptor"]
+    if name in DATUM_DOCUMENTS:
+        return doc["resource"]
+    if name == "stop":
+        return doc["run_start"]
+    return doc.get("uid", name)
+
+
+class ShardedNATSPublisher(Publisher):
+    """Spread documents over several `NATSPublisher` shards, each with its own NATS connection.
+
+    One shard is created per executor; passing distinct `CoroutineExecutor` instances puts
+    every connection on its own event loop thread. Documents with the same `shard_key` go
+    to the same shard and keep their order. Across shards, a document is held back (on the
+    IO loop, not the caller's thread) until the documents it depends on are published:
+    every document waits for the preceding non-event document, events also wait for
+    datums published on other shards, and `stop` waits for everything before it.
+
+    Remaining keyword arguments are passed to every `NATSPublisher`; `batching` is applied
+    once, ahead of sharding, and `flush_on_stop` flushes the run on all shards.
+    """
+
+    def __init__(
+        self,
+        executors: Sequence[CoroutineSubmittingExecutor],
+        client_config: NATSClientConfig | None = None,
+        subject_factory: Callable[[], str] | str | None = "events.volatile",
+        *,
+        shard_key: Callable[[str, dict], str] = document_shard_key,
+        batching: BatchConfig | None = None,
+        flush_on_stop: float | None = None,
+        **publisher_options: Any,
+    ) -> None:
+        if not executors:
+            msg = "ShardedNATSPublisher needs at least one executor"
+            raise ValueError(msg)
+        self.shards = [
+            NATSPublisher(executor, client_config, subject_factory, **publisher_options) for executor in executors
+        ]
+        for index, shard in enumerate(self.shards):
+            # documents of one run are only in order per shard, so each shard numbers its own
+            shard._sequence.source = str(index)  # noqa: SLF001
+        self._shard_key = shard_key
+        self._route_lock = Lock()
+        self._last_publish: dict[int, Future[Any]] = {}
+        self._last_datum: dict[int, Future[Any]] = {}
+        self._last_control: tuple[int, Future[Any]] | None = None
+        self._flush_on_stop = flush_on_stop
+        self._batcher = (
+            DocumentBatcher(self._route, batching, self._record_strict_error) if batching is not None else None
+        )
+
+    def _record_strict_error(self, exception: BaseException) -> None:
+        # a failed linger flush may have spanned several shards, latch it on all of them
+        for shard in self.shards:
+            shard._record_strict_error(exception)  # noqa: SLF001
+
+    def _shard_index(self, key: str) -> int:
+        return zlib.crc32(str(key).encode()) % len(self.shards)
+
+    def __call__(self, name: str, doc: dict) -> None:
+        """Make instances of this Publisher callable."""
+        for shard in self.shards:
+            shard._raise_if_strict_error()  # noqa: SLF001
+
+        if self._batcher is not None:
+            self._batcher(name, doc)
+            return
+        self._route(name, doc)
+
+    def _route(self, name: str, doc: dict) -> None:
+        index = self._shard_index(self._shard_key(name, doc))
+        with self._route_lock:
+            if name == "start":
+                for shard in self.shards:
+                    shard.run_id = doc["uid"]
+            if name == "stop":
+                after = [future for shard, future in self._last_publish.items() if shard != index]
+            else:
+                after = []
+                if self._last_control is not None and self._last_control[0] != index:
+                    after.append(self._last_control[1])
+                if name in VOLATILE_DOCUMENTS:
+                    after.extend(future for shard, future in self._last_datum.items() if shard != index)
+            after = [future for future in after if not future.done()]
+
+            publish_future = self.shards[index]._publish_document(name, doc, after)  # noqa: SLF001
+            if publish_future is not None:
+                self._last_publish[index] = publish_future
+                if name in DATUM_DOCUMENTS:
+                    self._last_datum[index] = publish_future
+                elif name not in VOLATILE_DOCUMENTS:
+                    self._last_control = (index, publish_future)
+        if name == "stop" and self._flush_on_stop is not None:
+            self._flush_stopped_run(doc["run_start"], self._flush_on_stop)
+
+    def _flush_stopped_run(self, run_id: UUID, timeout: float) -> None:
+        if self.flush_run(run_id, timeout=timeout):
+            return
+        msg = f"NATS publishes of run {run_id} were not all acknowledged within {timeout}s"
+        if any(shard._strict_publish for shard in self.shards):  # noqa: SLF001
+            raise RuntimeError(msg)
+        logger.warning(msg)
+
+    async def publish(self, subject: str, payload: bytes, headers: dict) -> bool:
+        """Publish a message to a subject, on the shard selected by the subject."""
+        shard = self.shards[self._shard_index(subject)]
+        return await asyncio.wrap_future(shard.executor.submit_coroutine(shard.publish(subject, payload, headers)))
+
+    def ensure_connection(self, timeout: float = NATS_TIMEOUT) -> bool:
+        for shard in self.shards:
+            shard._start_connect_if_needed()  # noqa: SLF001
+        deadline = time.monotonic() + timeout
+        connected = [shard.ensure_connection(max(0.0, deadline - time.monotonic())) for shard in self.shards]
+        return all(connected)
+
+    def flush_publishes(self, timeout: float = NATS_TIMEOUT) -> bool:
+        if self._batcher is not None:
+            self._batcher.flush()
+        deadline = time.monotonic() + timeout
+        # every shard is flushed, even after one of them failed
+        flushed = [shard.flush_publishes(max(0.0, deadline - time.monotonic())) for shard in self.shards]
+        return all(flushed)
+
+    def flush_run(self, run_id: UUID, timeout: float = NATS_TIMEOUT) -> bool:
+        if self._batcher is not None:
+            self._batcher.flush()
+        deadline = time.monotonic() + timeout
+        flushed = [shard.flush_run(run_id, max(0.0, deadline - time.monotonic())) for shard in self.shards]
+        return all(flushed)
+
+    @property
+    def shard_health(self) -> list[PublisherHealth]:
+        return [shard.health for shard in self.shards]
+
+    @property
+    def health(self) -> PublisherHealth:
+        healths = self.shard_health
+        metrics = [shard.metrics for shard in self.shards if shard.metrics is not None]
+        last_error = max(
+            (health for health in healths if health.last_error_at is not None),
+            key=lambda health: health.last_error_at or 0.0,
+            default=None,
+        )
+        last_ack = max(
+            (health for health in healths if health.last_ack_at is not None),
+            key=lambda health: health.last_ack_at or 0.0,
+            default=None,
+        )
+        return PublisherHealth(
+            connected=all(health.connected for health in healths),
+            strict_publish=any(health.strict_publish for health in healths),
+            pending_publishes=sum(health.pending_publishes for health in healths),
+            inflight_bytes=sum(health.inflight_bytes for health in healths),
+            dropped_publishes=sum(health.dropped_publishes for health in healths),
+            failed_publishes=sum(health.failed_publishes for health in healths),
+            spooled_publishes=sum(health.spooled_publishes for health in healths),
+            core_publishes=sum(health.core_publishes for health in healths),
+            estimated_lost=sum(health.estimated_lost for health in healths),
+            last_error=last_error.last_error if last_error is not None else None,
+            last_error_at=last_error.last_error_at if last_error is not None else None,
+            last_ack_at=last_ack.last_ack_at if last_ack is not None else None,
+            last_subject=last_ack.last_subject if last_ack is not None else None,
+            metrics=combined_snapshot(metrics) if metrics else None,
+        )
+
+    def close(self, timeout: float = NATS_TIMEOUT) -> bool:
+        if self._batcher is not None:
+            self._batcher.close()
+        deadline = time.monotonic() + timeout
+        closed = [shard.close(max(0.0, deadline - time.monotonic())) for shard in self.shards]
+        ok = all(closed)
+        if not ok:
+            logger.warning("NATS sharded publisher did not close cleanly")
+        return ok
+
+    def shutdown_callback(
+        self, *, timeout: float = NATS_TIMEOUT, shutdown_executor: bool = False
+    ) -> Callable[[], None]:
+        def _shutdown_callback() -> None:
+            try:
+                self.close(timeout=timeout)
+            finally:
+                if shutdown_executor:
+                    # executors may be shared between shards, shut each down once
+                    for executor in {id(shard.executor): shard.executor for shard in self.shards}.values():
+                        shutdown = getattr(executor, "shutdown", None)
+                        if callable(shutdown):
+                            shutdown()
+
+        return _shutdown_callback
@@ -0,0 +1,281 @@
+import asyncio
+import mmap
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import StrEnum
+from functools import partial
+from pathlib import Path
+from threading import Lock
+from typing import Any
+
+from bluesky.log import logger
+from ormsgpack import packb, unpackb
+
+
+FRAME_HEADER = struct.Struct("<II")  # body length, crc32 of body
+CURSOR = struct.Struct("<QQ")  # segment index, offset
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+
+
+class FsyncPolicy(StrEnum):
+    ALWAYS = "always"
+    ROTATE = "rotate"
+    NEVER = "never"
+
+
+@dataclass(frozen=True)
+class SpoolConfig:
+    """On-disk spool for publishes that could not reach NATS.
+
+    Records are appended to memory-mapped segment files of `segment_size` bytes in
+    `directory`. `fsync` selects whether segments are synced to disk after every record,
+    on segment rotation, or never (left to the OS). Appends are refused once `max_bytes`
+    of records are waiting for replay.
+    """
+
+    directory: str | Path
+    segment_size: int = 64 * 1024 * 1024
+    max_bytes: int = 1024 * 1024 * 1024
+    fsync: FsyncPolicy = FsyncPolicy.ROTATE
+
+    def __post_init__(self):
+        """Post initialization checks."""
+        if self.segment_size <= 2 * FRAME_HEADER.size or self.max_bytes < 1:
+            msg = "segment_size and max_bytes must be positive and hold at least one record header"
+            raise ValueError(msg)
+        FsyncPolicy(self.fsync)
+
+
+@dataclass(frozen=True)
+class SpoolRecord:
+    subject: str
+    headers: dict
+    payload: bytes
+    size: int
+    segment: int
+    end: int
+
+
+class _Segment:
+    def __init__(self, path: Path, size: int | None = None) -> None:
+        self.path = path
+        with path.open("r+b" if size is None else "w+b") as f:
+            if size is not None:
+                f.truncate(size)
+            self.mmap = mmap.mmap(f.fileno(), 0)
+
+    @property
+    def size(self) -> int:
+        return len(self.mmap)
+
+    def frame_at(self, offset: int) -> tuple[bytes, int] | None:
+        """Return the record body starting at `offset` and the offset after it, if valid."""
+        if offset + FRAME_HEADER.size > self.size:
+            return None
+        length, crc = FRAME_HEADER.unpack_from(self.mmap, offset)
+        start = offset + FRAME_HEADER.size
+        if length == 0 or start + length > self.size:
+            return None
+        body = self.mmap[start : start + length]
+        if zlib.crc32(body) != crc:
+            # torn write from a crash: everything from here on is discarded
+            return None
+        return body, start + length
+
+    def sync(self) -> None:
+        self.mmap.flush()
+
+    def close(self) -> None:
+        if not self.mmap.closed:
+            self.mmap.flush()
+            self.mmap.close()
+
+
+class SegmentSpool:
+    """Append-only, memory-mapped write-ahead log of `(subject, headers, payload)` records.
+
+    Records are read back in append order with `read` and released with `commit`; fully
+    committed segments are deleted. The read position is persisted, so a restarted
+    publisher resumes replay where the previous one stopped.
+    """
+
+    def __init__(self, config: SpoolConfig) -> None:
+        self._config = config
+        self._directory = Path(config.directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._segments: dict[int, _Segment] = {}
+        self._pending_records = 0
+        self._pending_bytes = 0
+        self._recover()
+
+    @property
+    def pending_records(self) -> int:
+        return self._pending_records
+
+    @property
+    def pending_bytes(self) -> int:
+        return self._pending_bytes
+
+    def _segment_path(self, index: int) -> Path:
+        return self._directory / f"{index:020d}{SEGMENT_SUFFIX}"
+
+    def _read_cursor(self) -> tuple[int, int]:
+        cursor_path = self._directory / CURSOR_FILE
+        if not cursor_path.exists():
+            return 0, 0
+        cursor = cursor_path.read_bytes()
+        if len(cursor) != CURSOR.size:
+            # replaying from the oldest segment may resend records, which is better than losing them
+            logger.warning(f"NATS spool cursor in {self._directory} is damaged, replaying from the oldest segment")
+            return 0, 0
+        return CURSOR.unpack(cursor)
+
+    def _recover(self) -> None:
+        self._read_segment, self._read_offset = self._read_cursor()
+        for path in sorted(self._directory.glob(f"*{SEGMENT_SUFFIX}")):
+            index = int(path.stem)
+            if index < self._read_segment or path.stat().st_size == 0:
+                path.unlink()
+                continue
+            self._segments[index] = _Segment(path)
+        if not self._segments:
+            self._read_offset = 0
+            self._open_write_segment(self._read_segment, self._config.segment_size)
+            return
+        if self._read_segment not in self._segments:
+            self._read_segment, self._read_offset = min(self._segments), 0
+        for index in sorted(self._segments):
+            segment = self._segments[index]
+            offset = self._read_offset if index == self._read_segment else 0
+            while (frame := segment.frame_at(offset)) is not None:
+                self._pending_records += 1
+                self._pending_bytes += len(frame[0])
+                offset = frame[1]
+            self._write_segment, self._write_offset = index, offset
+        segment = self._segments[self._write_segment]
+        if any(segment.mmap[self._write_offset : self._write_offset + FRAME_HEADER.size]):
+            # clear a torn tail so that it cannot be mistaken for records appended later
+            segment.mmap[self._write_offset :] = bytes(segment.size - self._write_offset)
+        if self._pending_records:
+            logger.info(f"NATS spool recovered {self._pending_records} records from {self._directory}")
+
+    def _open_write_segment(self, index: int, size: int) -> None:
+        self._segments[index] = _Segment(self._segment_path(index), size)
+        self._write_segment = index
+        self._write_offset = 0
+
+    def append(self, subject: str, headers: dict, payload: bytes) -> bool:
+        """Append a record, returns False if the spool is full."""
+        body = packb([subject, headers, payload])
+        frame = FRAME_HEADER.pack(len(body), zlib.crc32(body)) + body
+        with self._lock:
+            if self._pending_bytes + len(body) > self._config.max_bytes:
+                return False
+            segment = self._segments[self._write_segment]
+            # keep room for a zero header so readers always find the end of the segment
+            if self._write_offset + len(frame) + FRAME_HEADER.size > segment.size:
+                if self._config.fsync != FsyncPolicy.NEVER:
+                    segment.sync()
+                size = max(self._config.segment_size, len(frame) + FRAME_HEADER.size)
+                self._open_write_segment(self._write_segment + 1, size)
+                segment = self._segments[self._write_segment]
+            segment.mmap[self._write_offset : self._write_offset + len(frame)] = frame
+            self._write_offset += len(frame)
+            if self._config.fsync == FsyncPolicy.ALWAYS:
+                segment.sync()
+            self._pending_records += 1
+            self._pending_bytes += len(body)
+        return True
+
+    def read(self, max_records: int) -> list[SpoolRecord]:
+        """Return up to `max_records` records from the read position without consuming them."""
+        records: list[SpoolRecord] = []
+        with self._lock:
+            index, offset = self._read_segment, self._read_offset
+            while len(records) < max_records and index <= self._write_segment:
+                segment = self._segments.get(index)
+                frame = segment.frame_at(offset) if segment is not None else None
+                if frame is None:
+                    index, offset = index + 1, 0
+                    continue
+                body, offset = frame
+                subject, headers, payload = unpackb(body)
+                records.append(SpoolRecord(subject, headers, payload, len(body), index, offset))
+        return records
+
+    def commit(self, records: list[SpoolRecord]) -> None:
+        """Release records returned by `read`, which must be a prefix of the pending records."""
+        if not records:
+            return
+        last = records[-1]
+        with self._lock:
+            self._pending_records -= len(records)
+            self._pending_bytes -= sum(record.size for record in records)
+            self._read_segment, self._read_offset = last.segment, last.end
+            self._write_cursor()
+            for index in [index for index in self._segments if index < last.segment]:
+                self._segments.pop(index).close()
+                self._segment_path(index).unlink(missing_ok=True)
+
+    def _write_cursor(self) -> None:
+        # replace the cursor in one step, a crash must leave either the old or the new one
+        temporary = self._directory / f"{CURSOR_FILE}.tmp"
+        with temporary.open("wb") as f:
+            f.write(CURSOR.pack(self._read_segment, self._read_offset))
+            if self._config.fsync != FsyncPolicy.NEVER:
+                f.flush()
+                os.fsync(f.fileno())
+        temporary.replace(self._directory / CURSOR_FILE)
+
+    def close(self) -> None:
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments.clear()
+
+
+class ThreadedSpool:
+    """Run the blocking I/O of a `SegmentSpool`, including fsync, on a thread of its own.
+
+    Calls complete in the order they were made. `pending_records` includes appends that
+    are still being written, so that publishes checking it queue up behind them.
+    """
+
+    def __init__(self, spool: SegmentSpool) -> None:
+        self._spool = spool
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nats-spool")
+        self._appending = 0
+
+    @property
+    def pending_records(self) -> int:
+        return self._spool.pending_records + self._appending
+
+    @property
+    def pending_bytes(self) -> int:
+        return self._spool.pending_bytes
+
+    async def append(self, subject: str, headers: dict, payload: bytes) -> bool:
+        """Append a record, returns False if the spool is full."""
+        self._appending += 1
+        try:
+            return await self._run(self._spool.append, subject, headers, payload)
+        finally:
+            self._appending -= 1
+
+    async def read(self, max_records: int) -> list[SpoolRecord]:
+        return await self._run(self._spool.read, max_records)
+
+    async def commit(self, records: list[SpoolRecord]) -> None:
+        await self._run(self._spool.commit, records)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self._spool.close()
+
+    async def _run(self, fn: Any, *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(fn, *args))
@@ -0,0 +1,153 @@
+import secrets
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from uuid import UUID
+
+from bluesky_nats.metrics import HistogramSnapshot, LatencyHistogram
+from bluesky_nats.sequencing import SEQUENCE_HEADER, parse_sequence
+
+
+TRACEPARENT_HEADER = "traceparent"
+PUBLISH_TIME_HEADER = "Bluesky-Publish-Time-Ns"
+
+
+@dataclass(frozen=True)
+class TracingConfig:
+    """Trace every `sample_every`-th document from the RunEngine to the dispatcher callbacks.
+
+    Traced documents carry a W3C `traceparent` header, whose trace id is the run uid, and
+    a nanosecond publish timestamp, next to the per-run sequence number every document has.
+    """
+
+    sample_every: int = 100
+
+    def __post_init__(self):
+        """Post initialization checks."""
+        if self.sample_every < 1:
+            msg = f"sample_every must be a positive integer, got {self.sample_every}"
+            raise ValueError(msg)
+
+
+def trace_id_for_run(run_id: object) -> str:
+    """W3C trace id of a run: the run uid if it is a UUID, random otherwise."""
+    try:
+        return UUID(str(run_id)).hex
+    except ValueError:
+        return secrets.token_hex(16)
+
+
+def format_traceparent(trace_id: str, span_id: str) -> str:
+    """Version 00 `traceparent` header value of a sampled span."""
+    return f"00-{trace_id}-{span_id}-01"
+
+
+def parse_traceparent(value: str) -> tuple[str, str] | None:
+    """Return `(trace_id, span_id)` of a version 00 `traceparent` header, None if malformed."""
+    parts = value.split("-")
+    if len(parts) != 4 or parts[0] != "00" or len(parts[1]) != 32 or len(parts[2]) != 16:  # noqa: PLR2004
+        return None
+    return parts[1], parts[2]
+
+
+class TraceContext:
+    """Publisher side of tracing: adds the trace headers to every `sample_every`-th document."""
+
+    def __init__(self, config: TracingConfig) -> None:
+        self._config = config
+        self._count = 0
+        self._run: tuple[object, str] | None = None
+
+    def inject(self, headers: dict, run_id: object) -> None:
+        self._count += 1
+        if self._count % self._config.sample_every:
+            return
+        if self._run is None or self._run[0] != run_id:
+            self._run = (run_id, trace_id_for_run(run_id))
+        headers[TRACEPARENT_HEADER] = format_traceparent(self._run[1], secrets.token_hex(8))
+        headers[PUBLISH_TIME_HEADER] = str(time.time_ns())
+
+
+@dataclass(frozen=True)
+class DispatchSpan:
+    """Timings of one traced message in the dispatcher, in seconds.
+
+    `transit` is measured from the publisher's clock to the dispatcher's clock, so it is
+    only meaningful when both hosts are synchronized.
+    """
+
+    trace_id: str
+    span_id: str
+    subject: str
+    seq: int | None
+    transit: float
+    deserialize: float
+    dispatch: float
+    callback: float
+
+
+@dataclass(frozen=True)
+class TraceSnapshot:
+    transit: HistogramSnapshot
+    deserialize: HistogramSnapshot
+    dispatch: HistogramSnapshot
+    callback: HistogramSnapshot
+
+
+class TraceRecorder:
+    """Collect the spans of traced messages in a dispatcher, see `NATSDispatcher(tracing=...)`.
+
+    Stage latencies go into histograms; `on_span`, if given, receives every `DispatchSpan`,
+    e.g. to forward it to a tracing backend.
+    """
+
+    def __init__(self, on_span: Callable[[DispatchSpan], None] | None = None) -> None:
+        self.on_span = on_span
+        self.transit = LatencyHistogram()
+        self.deserialize = LatencyHistogram()
+        self.dispatch = LatencyHistogram()
+        self.callback = LatencyHistogram()
+
+    def record(
+        self,
+        headers: dict,
+        subject: str,
+        *,
+        received_at: int,
+        started: int,
+        deserialized: int,
+        dispatched: int,
+        done: int,
+    ) -> None:
+        """Record a traced message from its `perf_counter_ns` timestamps and `time_ns` receive time."""
+        context = parse_traceparent(headers.get(TRACEPARENT_HEADER, ""))
+        if context is None:
+            return
+        published_at = headers.get(PUBLISH_TIME_HEADER)
+        transit = max(received_at - int(published_at), 0) if published_at else 0
+        sequence = parse_sequence(headers.get(SEQUENCE_HEADER, ""))
+        self.transit.record(transit)
+        self.deserialize.record(deserialized - started)
+        self.dispatch.record(dispatched - deserialized)
+        self.callback.record(done - dispatched)
+        if self.on_span is not None:
+            self.on_span(
+                DispatchSpan(
+                    trace_id=context[0],
+                    span_id=context[1],
+                    subject=subject,
+                    seq=sequence[1] if sequence is not None else None,
+                    transit=transit / 1e9,
+                    deserialize=(deserialized - started) / 1e9,
+                    dispatch=(dispatched - deserialized) / 1e9,
+                    callback=(done - dispatched) / 1e9,
+                )
+            )
+
+    def snapshot(self) -> TraceSnapshot:
+        return TraceSnapshot(
+            transit=self.transit.snapshot(),
+            deserialize=self.deserialize.snapshot(),
+            dispatch=self.dispatch.snapshot(),
+            callback=self.callback.snapshot(),
+        )
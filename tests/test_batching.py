@@ -0,0 +1,144 @@
+import threading
+
+import pytest
+
+from bluesky_nats.batching import BatchConfig, DocumentBatcher
+
+
+def _event(seq_num: int, descriptor: str = "d1") -> dict:
+    return {
+        "uid": f"{descriptor}-e{seq_num}",
+        "time": float(seq_num),
+        "seq_num": seq_num,
+        "descriptor": descriptor,
+        "data": {"x": seq_num},
+        "timestamps": {"x": float(seq_num)},
+        "filled": {},
+    }
+
+
+def _datum(index: int, resource: str = "r1") -> dict:
+    return {"datum_id": f"{resource}/{index}", "resource": resource, "datum_kwargs": {"index": index}}
+
+
+@pytest.fixture
+def emitted() -> list[tuple[str, dict]]:
+    """Collect documents emitted by the batcher."""
+    return []
+
+
+@pytest.fixture
+def batcher(emitted) -> DocumentBatcher:
+    """Batcher without linger timer, flushing every three documents."""
+    return DocumentBatcher(lambda name, doc: emitted.append((name, doc)), BatchConfig(max_size=3, linger=None))
+
+
+def test_config_rejects_invalid_values() -> None:
+    """BatchConfig validates size and linger."""
+    with pytest.raises(ValueError, match="max_size"):
+        BatchConfig(max_size=0)
+    with pytest.raises(ValueError, match="linger"):
+        BatchConfig(linger=0)
+
+
+def test_non_batchable_documents_pass_through(batcher, emitted) -> None:
+    """Documents other than event/datum are emitted unchanged."""
+    batcher("start", {"uid": "run"})
+    assert emitted == [("start", {"uid": "run"})]
+
+
+def test_flush_on_size_limit(batcher, emitted) -> None:
+    """Reaching max_size emits one event_page."""
+    for seq_num in range(1, 4):
+        batcher("event", _event(seq_num))
+
+    assert len(emitted) == 1
+    name, page = emitted[0]
+    assert name == "event_page"
+    assert page["seq_num"] == [1, 2, 3]
+    assert page["data"] == {"x": [1, 2, 3]}
+    assert batcher.pending == 0
+
+
+def test_flush_before_stop_keeps_order(batcher, emitted) -> None:
+    """Buffered events are emitted before the document that triggered the flush."""
+    batcher("event", _event(1))
+    batcher("stop", {"uid": "stop", "run_start": "run"})
+
+    assert [name for name, _ in emitted] == ["event_page", "stop"]
+
+
+def test_events_are_paged_per_descriptor(batcher, emitted) -> None:
+    """Each descriptor gets its own event_page."""
+    batcher("event", _event(1, "d1"))
+    batcher("event", _event(1, "d2"))
+    batcher("event", _event(2, "d1"))
+    batcher.flush()
+
+    pages = {doc["descriptor"]: doc["seq_num"] for _, doc in emitted}
+    assert pages == {"d1": [1, 2], "d2": [1]}
+
+
+def test_datum_pages_are_emitted_before_event_pages(batcher, emitted) -> None:
+    """Datums flush ahead of events so references always resolve."""
+    batcher("event", _event(1))
+    batcher("datum", _datum(0))
+    batcher("descriptor", {"uid": "d2", "run_start": "run"})
+
+    assert [name for name, _ in emitted] == ["datum_page", "event_page", "descriptor"]
+    assert emitted[0][1]["datum_id"] == ["r1/0"]
+
+
+def test_linger_timer_flushes() -> None:
+    """Buffered documents are emitted after the linger time without further input."""
+    flushed = threading.Event()
+    emitted: list[str] = []
+
+    def _emit(name: str, doc: dict) -> None:
+        emitted.append(name)
+        flushed.set()
+
+    batcher = DocumentBatcher(_emit, BatchConfig(max_size=100, linger=0.01))
+    batcher("event", _event(1))
+
+    assert flushed.wait(timeout=2)
+    assert emitted == ["event_page"]
+
+
+def test_failed_linger_flush_keeps_documents_and_reports_the_error() -> None:
+    """Pages the linger timer cannot send stay buffered for the next flush."""
+    failed = threading.Event()
+    errors: list[BaseException] = []
+    emitted: list[tuple[str, dict]] = []
+
+    def _emit(name: str, doc: dict) -> None:
+        if not errors:
+            msg = "window full"
+            raise RuntimeError(msg)
+        emitted.append((name, doc))
+
+    def _on_error(error: BaseException) -> None:
+        errors.append(error)
+        failed.set()
+
+    batcher = DocumentBatcher(_emit, BatchConfig(max_size=100, linger=0.01), on_error=_on_error)
+    batcher("datum", _datum(0))
+    for seq_num in range(1, 4):
+        batcher("event", _event(seq_num))
+
+    assert failed.wait(timeout=2)
+    assert [str(error) for error in errors] == ["window full"]
+    assert batcher.pending == 4
+
+    batcher.flush()
+    assert [name for name, _ in emitted] == ["datum_page", "event_page"]
+    assert emitted[1][1]["seq_num"] == [1, 2, 3]
+
+
+def test_close_flushes_and_disables_batching(batcher, emitted) -> None:
+    """After close, pending documents are emitted and new ones pass straight through."""
+    batcher("event", _event(1))
+    batcher.close()
+    batcher("event", _event(2))
+
+    assert [name for name, _ in emitted] == ["event_page", "event"]
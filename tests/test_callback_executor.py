@@ -0,0 +1,64 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bluesky_nats.callback_executor import CallbackExecutor
+
+
+def test_max_pending_must_be_positive() -> None:
+    """At least one document has to fit."""
+    with ThreadPoolExecutor() as pool, pytest.raises(ValueError, match="max_pending"):
+        CallbackExecutor(pool, max_pending=0)
+
+
+@pytest.mark.asyncio
+async def test_documents_of_a_lane_arrive_in_order() -> None:
+    """A lane gets its documents one batch at a time, in submission order."""
+    received = []
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        callbacks = CallbackExecutor(pool)
+        for n in range(50):
+            await callbacks.submit("run", lambda name, doc: received.append(doc["n"]), "event", {"n": n})
+        await asyncio.wait_for(callbacks.join(), timeout=2)
+
+    assert received == list(range(50))
+    assert callbacks.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_lanes_run_in_parallel() -> None:
+    """Different runs are processed at the same time on the pool."""
+    barrier = threading.Barrier(2, timeout=2)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        callbacks = CallbackExecutor(pool)
+        await callbacks.submit("run-1", lambda name, doc: barrier.wait(), "start", {})
+        await callbacks.submit("run-2", lambda name, doc: barrier.wait(), "start", {})
+        await asyncio.wait_for(callbacks.join(), timeout=2)
+
+    assert callbacks.errors == 0
+
+
+@pytest.mark.asyncio
+async def test_submit_waits_for_room_and_counts_errors() -> None:
+    """Beyond max_pending documents submit waits, failing callbacks are counted."""
+    release = threading.Event()
+
+    def callback(name: str, doc: dict) -> None:
+        release.wait(timeout=2)
+        if doc["fail"]:
+            raise ValueError(name)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        callbacks = CallbackExecutor(pool, max_pending=1)
+        await callbacks.submit("run", callback, "event", {"fail": True})
+        blocked = asyncio.create_task(callbacks.submit("run", callback, "event", {"fail": False}))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        release.set()
+        await asyncio.wait_for(blocked, timeout=2)
+        await asyncio.wait_for(callbacks.join(), timeout=2)
+
+    assert callbacks.errors == 1
@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from ormsgpack import OPT_SERIALIZE_NUMPY, packb
+
+from bluesky_nats import compression
+from bluesky_nats.compression import CODECS, CompressionConfig, LZ4Codec, get_codec
+
+
+PAYLOAD = packb({"data": {"img": np.tile(np.arange(256, dtype=np.uint16), 64)}}, option=OPT_SERIALIZE_NUMPY)
+
+
+@pytest.mark.parametrize("name", sorted(CODECS))
+def test_codec_round_trip(name: str) -> None:
+    """Every registered codec restores the original payload and shrinks redundant data."""
+    codec = get_codec(name)
+    compressed = codec.compress(PAYLOAD)
+
+    assert codec.name == name
+    assert len(compressed) < len(PAYLOAD)
+    assert codec.decompress(compressed) == PAYLOAD
+
+
+def test_zstd_codec_is_safe_to_share_between_threads() -> None:
+    """Threads compressing with one codec get their own zstandard contexts."""
+    codec = get_codec("zstd")
+    if codec._stdlib:  # type: ignore[attr-defined]  # noqa: SLF001
+        pytest.skip("the standard library zstd module keeps no contexts")
+    compressor = codec._zstandard().compressor  # type: ignore[attr-defined]  # noqa: SLF001
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        payloads = list(pool.map(lambda _: codec.decompress(codec.compress(PAYLOAD)), range(64)))
+        compressors = list(pool.map(lambda _: codec._zstandard().compressor, range(64)))  # type: ignore[attr-defined]  # noqa: SLF001
+
+    assert payloads == [PAYLOAD] * 64
+    assert all(other is not compressor for other in compressors)
+
+
+def test_codec_level_is_applied() -> None:
+    """A higher level never produces a larger deflate payload on redundant data."""
+    assert len(get_codec("deflate", 9).compress(PAYLOAD)) <= len(get_codec("deflate", 1).compress(PAYLOAD))
+
+
+def test_get_codec_rejects_unknown_encoding() -> None:
+    """Unknown encodings fail loudly."""
+    with pytest.raises(ValueError, match="Unsupported content encoding: br"):
+        get_codec("br")
+
+
+def test_missing_optional_library_raises_import_error(monkeypatch) -> None:
+    """Codecs backed by optional libraries explain what to install."""
+    monkeypatch.setattr(compression, "lz4_lib", None)
+    with pytest.raises(ImportError, match="'lz4' library"):
+        LZ4Codec()
+
+
+def test_compression_config_validation() -> None:
+    """CompressionConfig checks the codec name and threshold."""
+    with pytest.raises(ValueError, match="Unsupported content encoding"):
+        CompressionConfig(codec="br")
+    with pytest.raises(ValueError, match="min_size"):
+        CompressionConfig(min_size=-1)
@@ -1,10 +1,13 @@
 import asyncio
+import os
+import sys
 import threading
+from types import SimpleNamespace
 from typing import Any, cast
 
 import pytest
 
-from bluesky_nats.nats_publisher import CoroutineExecutor
+from bluesky_nats.nats_publisher import CoroutineExecutor, LoopImplementation, new_event_loop
 
 
 @pytest.mark.asyncio
@@ -77,3 +80,147 @@ async def test_constructor_rejects_removed_loop_argument() -> None:
 
     with pytest.raises(TypeError):
         executor_ctor(running_loop)
+
+
+def test_submit_coroutines_start_in_order() -> None:
+    """A batch resolves one Future per coroutine, started in submission order."""
+    executor = CoroutineExecutor()
+    started: list[int] = []
+
+    async def record(index: int) -> int:
+        started.append(index)
+        await asyncio.sleep(0)
+        return index
+
+    futures = executor.submit_coroutines(record(index) for index in range(50))
+    assert [future.result(timeout=2) for future in futures] == list(range(50))
+    assert started == list(range(50))
+    executor.shutdown()
+
+
+def test_submissions_share_one_wakeup_while_a_drain_is_pending(mocker) -> None:
+    """Coroutines queued while the loop is busy are drained together."""
+    executor = CoroutineExecutor()
+    running, release = threading.Event(), threading.Event()
+
+    async def block() -> None:
+        running.set()
+        release.wait(timeout=2)
+
+    async def noop() -> None:
+        pass
+
+    executor.submit_coroutine(block())
+    assert running.wait(timeout=2)
+    wakeup = mocker.spy(executor._io_loop, "call_soon_threadsafe")  # noqa: SLF001
+    futures = [executor.submit_coroutine(noop()) for _ in range(10)]
+    futures.extend(executor.submit_coroutines([noop(), noop()]))
+    release.set()
+
+    for future in futures:
+        future.result(timeout=2)
+    assert wakeup.call_count == 1
+    executor.shutdown()
+
+
+def test_batch_handle_collects_exceptions() -> None:
+    """A batch handle counts completions and keeps the exceptions."""
+    executor = CoroutineExecutor()
+
+    async def fail(index: int) -> None:
+        if index % 2:
+            msg = f"failed {index}"
+            raise ValueError(msg)
+
+    batch = executor.submit_coroutines((fail(index) for index in range(6)), handle=True)
+    assert batch.wait(timeout=2)
+    assert batch.done()
+    assert batch.pending == 0
+    assert sorted(str(exception) for exception in batch.exceptions) == ["failed 1", "failed 3", "failed 5"]
+    executor.shutdown()
+
+
+def test_cancelling_a_future_cancels_its_task() -> None:
+    """Cancelling the returned Future cancels the coroutine on the loop."""
+    executor = CoroutineExecutor()
+    running, cancelled = threading.Event(), threading.Event()
+
+    async def wait_forever() -> None:
+        running.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    future = executor.submit_coroutine(wait_forever())
+    assert running.wait(timeout=2)
+    assert future.cancel()
+    assert cancelled.wait(timeout=2)
+    executor.shutdown()
+
+
+def test_submit_coroutines_after_shutdown_closes_them() -> None:
+    """Rejected coroutines are closed, not left unawaited."""
+    executor = CoroutineExecutor()
+    executor.shutdown()
+
+    async def noop() -> None:
+        pass
+
+    coro = noop()
+    with pytest.raises(RuntimeError, match="CoroutineExecutor is shut down"):
+        executor.submit_coroutines([coro])
+    assert coro.cr_frame is None
+
+
+def test_new_event_loop_falls_back_without_uvloop(mocker) -> None:
+    """AUTO uses asyncio when uvloop is missing, UVLOOP insists on it."""
+    mocker.patch("bluesky_nats.nats_publisher.importlib.import_module", side_effect=ImportError)
+    loop = new_event_loop(LoopImplementation.AUTO)
+    assert isinstance(loop, asyncio.BaseEventLoop)
+    loop.close()
+    with pytest.raises(ImportError, match="requires the 'uvloop' library"):
+        new_event_loop("uvloop")
+
+
+def test_new_event_loop_uses_uvloop_when_installed(mocker) -> None:
+    """AUTO and UVLOOP create the loop with uvloop if it can be imported."""
+    uvloop = SimpleNamespace(new_event_loop=mocker.Mock(return_value="uvloop loop"))
+    mocker.patch("bluesky_nats.nats_publisher.importlib.import_module", return_value=uvloop)
+    assert new_event_loop("auto") == "uvloop loop"
+    assert new_event_loop(LoopImplementation.UVLOOP) == "uvloop loop"
+
+
+def test_thread_pool_is_created_lazily_with_named_threads() -> None:
+    """Plain callables start a sized pool named after the IO thread on first use."""
+    executor = CoroutineExecutor(thread_name="beamline-io", max_workers=1)
+    assert executor._thread_pool is None  # noqa: SLF001
+
+    async def io_thread_name() -> str:
+        return threading.current_thread().name
+
+    assert executor.submit_coroutine(io_thread_name()).result(timeout=2) == "beamline-io"
+    worker = executor.submit(lambda: threading.current_thread().name).result(timeout=2)
+    assert worker.startswith("beamline-io-worker")
+    assert executor._thread_pool._max_workers == 1  # type: ignore[union-attr]  # noqa: SLF001
+    executor.shutdown()
+
+
+def test_rejects_invalid_max_workers() -> None:
+    """The thread pool needs at least one worker."""
+    with pytest.raises(ValueError, match="max_workers"):
+        CoroutineExecutor(max_workers=0)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="per-thread niceness is Linux only")
+def test_io_thread_niceness() -> None:
+    """The IO thread runs with the requested niceness, other threads keep theirs."""
+    executor = CoroutineExecutor(nice=19)
+
+    async def niceness() -> int:
+        return os.getpriority(os.PRIO_PROCESS, threading.get_native_id())
+
+    assert executor.submit_coroutine(niceness()).result(timeout=2) == 19
+    assert os.getpriority(os.PRIO_PROCESS, threading.get_native_id()) != 19
+    executor.shutdown()
@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from ormsgpack import packb
+
+from bluesky_nats.exporter import OPENMETRICS_CONTENT_TYPE, MetricsExporter
+from bluesky_nats.nats_dispatcher import NATSDispatcher
+from bluesky_nats.nats_publisher import NATSPublisher
+
+
+def _publisher() -> NATSPublisher:
+    publisher = NATSPublisher(executor=Mock(), subject_factory="test.subject", metrics=True)
+    publisher.nats_client = Mock(is_connected=True, stats={"reconnects": 2})
+    publisher.js = AsyncMock()
+    return publisher
+
+
+@pytest.mark.asyncio
+async def test_render_publisher_metrics() -> None:
+    """Health counters, latency summaries and per subject counters are rendered."""
+    publisher = _publisher()
+    await publisher.publish(subject="test.subject.event", payload=b"doc", headers={})
+    exporter = MetricsExporter()
+    exporter.add_publisher(publisher, "beamline")
+
+    text = exporter.render()
+
+    assert "# TYPE bluesky_nats_publisher_pending_publishes gauge" in text
+    assert 'bluesky_nats_publisher_pending_publishes{publisher="beamline"} 0.0' in text
+    assert 'bluesky_nats_publisher_reconnects_total{publisher="beamline"} 2.0' in text
+    assert 'bluesky_nats_publisher_ack_latency_seconds_count{publisher="beamline"} 1.0' in text
+    assert 'bluesky_nats_publisher_ack_latency_seconds{publisher="beamline",quantile="0.99"}' in text
+    assert 'bluesky_nats_publisher_bytes_total{publisher="beamline",subject="test.subject.event"} 3.0' in text
+    assert text.endswith("# EOF\n")
+
+
+@pytest.mark.asyncio
+async def test_render_dispatcher_metrics() -> None:
+    """Consumer lag and per document counters come from the dispatcher."""
+    dispatcher = NATSDispatcher(subject="events.>", loop=asyncio.get_running_loop(), metrics=True)
+    dispatcher.subscribe(lambda name, doc: None)
+    msg = SimpleNamespace(
+        subject="events.test.start",
+        data=packb({"uid": "run"}),
+        headers=None,
+        reply="$JS.ACK.bluesky.consumer.1.10.10.1700000000000000000.7",
+        metadata=SimpleNamespace(num_pending=7),
+        ack=AsyncMock(),
+    )
+    await dispatcher._handle_message(msg)  # noqa: SLF001
+    exporter = MetricsExporter()
+    exporter.add_dispatcher(dispatcher)
+
+    text = exporter.render()
+
+    assert 'bluesky_nats_dispatcher_consumer_lag{dispatcher="default"} 7.0' in text
+    assert 'bluesky_nats_dispatcher_documents_total{dispatcher="default",document="start"} 1.0' in text
+    assert 'bluesky_nats_dispatcher_errors_total{dispatcher="default"} 0.0' in text
+    assert 'bluesky_nats_dispatcher_queue_depth{dispatcher="default"}' in text
+    assert 'bluesky_nats_dispatcher_filtered_total{dispatcher="default"} 0.0' in text
+    assert 'bluesky_nats_dispatcher_blocked_seconds_count{dispatcher="default"} 0.0' in text
+
+
+@pytest.mark.asyncio
+async def test_http_endpoint_serves_metrics() -> None:
+    """GET /metrics answers with the OpenMetrics text, other paths with 404."""
+    exporter = MetricsExporter()
+    exporter.add_publisher(_publisher())
+    await exporter.start(port=0)
+
+    async def _get(path: str) -> bytes:
+        reader, writer = await asyncio.open_connection("127.0.0.1", exporter.port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        return response
+
+    try:
+        response = await _get("/metrics")
+        assert response.startswith(b"HTTP/1.1 200 OK")
+        assert OPENMETRICS_CONTENT_TYPE.encode() in response
+        assert response.endswith(b"# EOF\n")
+        assert (await _get("/other")).startswith(b"HTTP/1.1 404")
+    finally:
+        await exporter.stop()
+    assert exporter.port is None
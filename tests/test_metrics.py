@@ -0,0 +1,69 @@
+import pytest
+
+from bluesky_nats import metrics
+from bluesky_nats.metrics import LatencyHistogram, PublisherMetrics, combined_snapshot
+
+
+def test_histogram_percentiles_are_within_bucket_precision() -> None:
+    """Percentiles land within 1/16 of the recorded value."""
+    histogram = LatencyHistogram()
+    for value in range(1, 1001):
+        histogram.record(value * 1000)
+
+    assert histogram.count == 1000
+    assert histogram.percentile(0.5) == pytest.approx(500_000, rel=1 / 16)
+    assert histogram.percentile(0.99) == pytest.approx(990_000, rel=1 / 16)
+    assert histogram.percentile(1.0) == 1_000_000
+    snapshot = histogram.snapshot()
+    assert snapshot.mean == pytest.approx(500.5e-6)
+    assert snapshot.max == pytest.approx(1e-3)
+
+
+def test_histogram_buckets_are_contiguous() -> None:
+    """Every value maps to a bucket whose upper bound is not below it."""
+    previous = -1
+    for value in [*range(100), 1000, 12345, 10**9, 2**50]:
+        index = metrics._bucket_index(value)  # noqa: SLF001
+        assert index >= previous
+        assert index < metrics.BUCKET_COUNT
+        if value < 2**metrics.MAX_VALUE_BITS:
+            assert metrics._bucket_upper_bound(index) >= value  # noqa: SLF001
+        previous = index
+
+
+def test_empty_histogram_snapshot() -> None:
+    """A histogram without values reports zeros."""
+    snapshot = LatencyHistogram().snapshot()
+    assert (snapshot.count, snapshot.mean, snapshot.p99, snapshot.max) == (0, 0.0, 0.0, 0.0)
+
+
+def test_subject_rates_cover_the_last_window(mocker) -> None:
+    """Rates are computed over windows of RATE_WINDOW seconds, idle time included."""
+    clock = mocker.patch("bluesky_nats.metrics.time.monotonic", return_value=0.0)
+    publisher_metrics = PublisherMetrics()
+    for _ in range(10):
+        publisher_metrics.record_publish("events.event", 100)
+
+    clock.return_value = 5.0
+    throughput = publisher_metrics.snapshot().subjects["events.event"]
+    assert (throughput.messages, throughput.bytes) == (10, 1000)
+    assert throughput.messages_per_second == pytest.approx(2.0)
+    assert throughput.bytes_per_second == pytest.approx(200.0)
+
+    clock.return_value = 20.0
+    assert publisher_metrics.snapshot().subjects["events.event"].messages_per_second == pytest.approx(0.5)
+
+
+def test_combined_snapshot_adds_up_publishers() -> None:
+    """Histograms and subject counters of several publishers are merged."""
+    first, second = PublisherMetrics(), PublisherMetrics()
+    first.ack_latency.record(1000)
+    second.ack_latency.record(3000)
+    first.record_publish("events.start", 10)
+    second.record_publish("events.start", 20)
+
+    snapshot = combined_snapshot([first, second])
+
+    assert snapshot.ack_latency.count == 2
+    assert snapshot.ack_latency.max == pytest.approx(3e-6)
+    assert snapshot.subjects["events.start"].bytes == 30
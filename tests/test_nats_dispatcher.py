@@ -0,0 +1,374 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from nats.errors import TimeoutError as NATS_TimeoutError
+from nats.js.api import AckPolicy
+from nats.js.errors import NotFoundError
+from ormsgpack import packb, unpackb
+
+from bluesky_nats.callback_executor import CallbackExecutor
+from bluesky_nats.compression import CONTENT_ENCODING_HEADER, get_codec
+from bluesky_nats.nats_dispatcher import AckConfig, AckStrategy, NATSDispatcher, PullConsumerConfig
+from bluesky_nats.sequencing import SEQUENCE_HEADER
+from bluesky_nats.tracing import TRACEPARENT_HEADER, TraceRecorder, format_traceparent
+
+
+def _message(subject: str, data: bytes, headers: dict | None = None) -> SimpleNamespace:
+    return SimpleNamespace(subject=subject, data=data, headers=headers, reply=None, ack=AsyncMock())
+
+
+def _dispatcher(**kwargs) -> tuple[NATSDispatcher, list[tuple[str, dict]]]:
+    """Dispatcher on the running test loop, not connected to NATS, collecting dispatched documents."""
+    dispatcher = NATSDispatcher(subject="events.>", loop=asyncio.get_running_loop(), **kwargs)
+    received: list[tuple[str, dict]] = []
+    dispatcher.subscribe(lambda name, doc: received.append((name, doc)))
+    return dispatcher, received
+
+
+@pytest.mark.asyncio
+async def test_handle_message_dispatches_and_acks() -> None:
+    """A message is deserialized, dispatched by subject suffix and acknowledged."""
+    dispatcher, received = _dispatcher()
+    msg = _message("events.test.start", packb({"uid": "run"}))
+
+    await dispatcher._handle_message(msg)  # noqa: SLF001
+    await asyncio.sleep(0)
+
+    assert received == [("start", {"uid": "run"})]
+    msg.ack.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_handle_message_decompresses_by_content_encoding() -> None:
+    """Compressed payloads are restored based on the Content-Encoding header."""
+    dispatcher, received = _dispatcher()
+    payload = get_codec("deflate").compress(packb({"uid": "run"}))
+    msg = _message("events.test.start", payload, {CONTENT_ENCODING_HEADER: "deflate", "run_id": "run"})
+
+    await dispatcher._handle_message(msg)  # noqa: SLF001
+    await asyncio.sleep(0)
+
+    assert received == [("start", {"uid": "run"})]
+
+
+@pytest.mark.asyncio
+async def test_handle_message_rejects_unknown_content_encoding() -> None:
+    """Messages with an unsupported encoding are not dispatched."""
+    dispatcher, received = _dispatcher()
+    msg = _message("events.test.start", b"???", {CONTENT_ENCODING_HEADER: "br"})
+
+    with pytest.raises(ValueError, match="Unsupported content encoding"):
+        await dispatcher._handle_message(msg)  # noqa: SLF001
+    assert received == []
+
+
+@pytest.mark.asyncio
+async def test_traced_message_records_a_span() -> None:
+    """Messages carrying a traceparent header are timed through deserialize, dispatch and callback."""
+    spans = []
+    dispatcher, received = _dispatcher(tracing=TraceRecorder(on_span=spans.append))
+    headers = {TRACEPARENT_HEADER: format_traceparent("a" * 32, "b" * 16), SEQUENCE_HEADER: "3"}
+
+    await dispatcher._handle_message(_message("events.test.start", packb({"uid": "run"}), headers))  # noqa: SLF001
+    await dispatcher._handle_message(_message("events.test.stop", packb({"uid": "stop"})))  # noqa: SLF001
+    await asyncio.sleep(0)
+
+    assert [name for name, _ in received] == ["start", "stop"]
+    assert [(span.subject, span.seq) for span in spans] == [("events.test.start", 3)]
+
+
+def _sequenced(name: str, seq: int, stream_seq: int, run_id: str = "run") -> SimpleNamespace:
+    msg = _message(
+        f"events.test.{name}", packb({"uid": f"{name}-{seq}"}), {"run_id": run_id, SEQUENCE_HEADER: str(seq)}
+    )
+    msg.reply = "$JS.ACK"
+    msg.metadata = SimpleNamespace(sequence=SimpleNamespace(stream=stream_seq), num_pending=0)
+    return msg
+
+
+def _stored(name: str, seq: int, stream_seq: int, run_id: str = "run") -> SimpleNamespace:
+    msg = _sequenced(name, seq, stream_seq, run_id)
+    return SimpleNamespace(subject=msg.subject, data=msg.data, headers=msg.headers, seq=stream_seq)
+
+
+@pytest.mark.asyncio
+async def test_sequence_gap_is_refetched_from_the_stream() -> None:
+    """Missing documents of a run are fetched by stream sequence and dispatched in order."""
+    dispatcher, received = _dispatcher(metrics=True)
+    stored = [_stored("event", 2, 12), _stored("event", 1, 13, run_id="other"), _stored("event", 3, 15)]
+    dispatcher._js = AsyncMock()  # noqa: SLF001
+    dispatcher._js.get_msg.side_effect = [*stored, NotFoundError()]  # noqa: SLF001
+
+    await dispatcher._handle_message(_sequenced("start", 1, 10))  # noqa: SLF001
+    await dispatcher._handle_message(_sequenced("stop", 4, 20))  # noqa: SLF001
+    await dispatcher._handle_message(_sequenced("event", 3, 15))  # noqa: SLF001
+    await asyncio.sleep(0)
+
+    assert [doc["uid"] for _, doc in received] == ["start-1", "event-2", "event-3", "stop-4"]
+    assert [call.kwargs["seq"] for call in dispatcher._js.get_msg.await_args_list] == [11, 13, 14]  # noqa: SLF001
+    assert dispatcher.metrics is not None
+    assert (dispatcher.metrics.refetched, dispatcher.metrics.missing) == (2, 0)
+
+
+@pytest.mark.asyncio
+async def test_late_message_fills_an_unrecovered_gap() -> None:
+    """A document that was not in the stream yet is dispatched when it arrives late, duplicates are not."""
+    dispatcher, received = _dispatcher()
+    dispatcher._js = AsyncMock()  # noqa: SLF001
+    dispatcher._js.get_msg.side_effect = NotFoundError()  # noqa: SLF001
+
+    await dispatcher._handle_message(_sequenced("start", 1, 10))  # noqa: SLF001
+    await dispatcher._handle_message(_sequenced("event", 3, 11))  # noqa: SLF001
+    await dispatcher._handle_message(_sequenced("event", 2, 12))  # noqa: SLF001
+    await dispatcher._handle_message(_sequenced("event", 2, 12))  # noqa: SLF001
+    await asyncio.sleep(0)
+
+    assert [doc["uid"] for _, doc in received] == ["start-1", "event-3", "event-2"]
+
+
+def test_pull_consumer_config_sizes_batches_by_bytes() -> None:
+    """Batches are capped by count and, from the average message size, by bytes."""
+    with pytest.raises(ValueError, match="batch"):
+        PullConsumerConfig(batch=0)
+    with pytest.raises(ValueError, match="max_wait"):
+        PullConsumerConfig(max_wait=0)
+    assert PullConsumerConfig(batch=100).batch_size(1e6) == 100
+    config = PullConsumerConfig(batch=100, max_bytes=10_000)
+    assert config.batch_size(50) == 100
+    assert config.batch_size(1_000) == 10
+    assert config.batch_size(1e6) == 1
+
+
+@pytest.mark.asyncio
+async def test_pull_mode_subscribes_a_pull_consumer() -> None:
+    """Pull mode binds a (durable) pull consumer instead of an ordered push subscription."""
+    dispatcher, _ = _dispatcher(pull=PullConsumerConfig(durable="viewer"))
+    dispatcher._js = Mock(pull_subscribe=AsyncMock(), subscribe=AsyncMock())  # noqa: SLF001
+
+    await dispatcher._subscribe()  # noqa: SLF001
+
+    dispatcher._js.pull_subscribe.assert_awaited_once()  # noqa: SLF001
+    assert dispatcher._js.pull_subscribe.await_args.kwargs["durable"] == "viewer"  # noqa: SLF001
+    dispatcher._js.subscribe.assert_not_called()  # noqa: SLF001
+
+
+@pytest.mark.asyncio
+async def test_pull_mode_processes_fetched_batches_in_order() -> None:
+    """Fetched batches are dispatched back to back and later fetches are sized by bytes."""
+    dispatcher, received = _dispatcher(pull=PullConsumerConfig(batch=8, max_bytes=8))
+    messages = [_message(f"events.test.{name}", packb({"n": n})) for n, name in enumerate(["start", "event", "stop"])]
+    responses: list = [messages[:2], NATS_TimeoutError(), messages[2:]]
+    batches: list[int] = []
+    idle = asyncio.Event()
+
+    async def fetch(batch, **kwargs):
+        batches.append(batch)
+        if not responses:
+            idle.set()
+            await asyncio.Event().wait()
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    dispatcher._subscription = Mock(fetch=fetch)  # noqa: SLF001
+    task = asyncio.create_task(dispatcher._poll_batches())  # noqa: SLF001
+    await asyncio.wait_for(idle.wait(), timeout=2)
+    task.cancel()
+    await task
+
+    assert [name for name, _ in received] == ["start", "event", "stop"]
+    assert all(msg.ack.await_count == 1 for msg in messages)
+    # 4 byte messages, so 8 bytes allow batches of 2 once the first batch has been seen
+    assert batches == [8, 2, 2, 2]
+
+
+def test_ack_config_rejects_invalid_values() -> None:
+    """Strategy, batch size and interval are validated."""
+    with pytest.raises(ValueError, match="'later' is not a valid AckStrategy"):
+        AckConfig(strategy="later")  # type: ignore[arg-type]
+    with pytest.raises(ValueError, match="every"):
+        AckConfig(strategy=AckStrategy.BATCH, every=0)
+    with pytest.raises(ValueError, match="interval"):
+        AckConfig(strategy=AckStrategy.BATCH, interval=0)
+
+
+@pytest.mark.asyncio
+async def test_ack_none_sends_no_acks() -> None:
+    """With AckStrategy.NONE messages are dispatched without an ack."""
+    dispatcher, received = _dispatcher(ack=AckConfig(strategy=AckStrategy.NONE))
+    msg = _message("events.test.start", packb({"uid": "run"}))
+
+    await dispatcher._handle_message(msg)  # noqa: SLF001
+    await asyncio.sleep(0)
+
+    assert received == [("start", {"uid": "run"})]
+    msg.ack.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_batched_acks_ack_every_nth_and_after_the_interval() -> None:
+    """Batched acks only ack every n-th message, the rest once the interval has passed."""
+    dispatcher, _ = _dispatcher(ack=AckConfig(strategy=AckStrategy.BATCH, every=3, interval=0.01))
+    messages = [_message("events.test.event", packb({"seq_num": n})) for n in range(5)]
+
+    for msg in messages:
+        await dispatcher._handle_message(msg)  # noqa: SLF001
+    assert [msg.ack.await_count for msg in messages] == [0, 0, 1, 0, 0]
+
+    await asyncio.sleep(0.05)
+    assert [msg.ack.await_count for msg in messages] == [0, 0, 1, 0, 1]
+
+
+@pytest.mark.asyncio
+async def test_async_acks_do_not_block_the_receive_loop() -> None:
+    """Asynchronous acks are sent from a background task, flush waits for them."""
+    dispatcher, _ = _dispatcher(ack=AckConfig(strategy=AckStrategy.ASYNC))
+    messages = [_message("events.test.event", packb({"seq_num": n})) for n in range(3)]
+
+    for msg in messages:
+        await dispatcher._handle_message(msg)  # noqa: SLF001
+    assert all(msg.ack.await_count == 0 for msg in messages)
+
+    await dispatcher._acks.flush()  # noqa: SLF001
+    assert all(msg.ack.await_count == 1 for msg in messages)
+
+
+@pytest.mark.asyncio
+async def test_pull_consumer_ack_policy_follows_the_strategy() -> None:
+    """Batched acks need a consumer acknowledging everything up to the acked message."""
+    dispatcher, _ = _dispatcher(pull=PullConsumerConfig(), ack=AckConfig(strategy=AckStrategy.BATCH))
+    dispatcher._js = Mock(pull_subscribe=AsyncMock())  # noqa: SLF001
+
+    await dispatcher._subscribe()  # noqa: SLF001
+
+    assert dispatcher._js.pull_subscribe.await_args.kwargs["config"].ack_policy == AckPolicy.ALL  # noqa: SLF001
+
+
+@pytest.mark.asyncio
+async def test_full_queue_blocks_receiving_until_callbacks_catch_up() -> None:
+    """The receive side waits on a full dispatch queue and the time blocked is recorded."""
+    dispatcher, received = _dispatcher(queue_size=2, metrics=True)
+    messages = [_message("events.test.event", packb({"seq_num": n})) for n in range(3)]
+
+    for msg in messages[:2]:
+        await dispatcher._handle_message(msg)  # noqa: SLF001
+    assert dispatcher.metrics.queue_depth == 2
+    assert received == []
+
+    await dispatcher._handle_message(messages[2])  # noqa: SLF001
+    await asyncio.sleep(0)
+
+    assert [doc["seq_num"] for _, doc in received] == [0, 1, 2]
+    assert dispatcher.metrics.queue_depth == 0
+    assert dispatcher.metrics.blocked.count == 1
+
+
+@pytest.mark.asyncio
+async def test_callback_errors_do_not_stop_the_processing_task() -> None:
+    """A failing callback is counted and later documents are still dispatched."""
+    dispatcher, received = _dispatcher(metrics=True)
+    dispatcher.subscribe(lambda name, doc: 1 / doc["n"])
+
+    await dispatcher._handle_message(_message("events.test.event", packb({"n": 0})))  # noqa: SLF001
+    await dispatcher._handle_message(_message("events.test.event", packb({"n": 1})))  # noqa: SLF001
+    await dispatcher._drain_queue()  # noqa: SLF001
+
+    assert [doc["n"] for _, doc in received] == [0, 1]
+    assert dispatcher.metrics.errors == 1
+
+
+def test_queue_size_must_be_positive() -> None:
+    """A dispatch queue needs room for at least one document."""
+    with pytest.raises(ValueError, match="queue_size"):
+        NATSDispatcher(subject="events.>", queue_size=0)
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_hands_callbacks_to_the_executor() -> None:
+    """Each callback runs off the loop and sees the documents of a run in order."""
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        dispatcher = NATSDispatcher(
+            subject="events.>", loop=asyncio.get_running_loop(), callback_executor=CallbackExecutor(pool)
+        )
+        threads, first, second = set(), [], []
+        dispatcher.subscribe(lambda name, doc: (threads.add(threading.get_ident()), first.append(doc["n"])))
+        dispatcher.subscribe(lambda name, doc: second.append(doc["n"]), "event")
+        for n in range(20):
+            msg = _message("events.test.event", packb({"n": n}), {"run_id": f"run-{n % 2}"})
+            await dispatcher._handle_message(msg)  # noqa: SLF001
+        await dispatcher._drain_queue()  # noqa: SLF001
+
+    assert [n for n in first if n % 2] == list(range(1, 20, 2))
+    assert [n for n in second if not n % 2] == list(range(0, 20, 2))
+    assert sorted(first) == sorted(second) == list(range(20))
+    assert threading.get_ident() not in threads
+
+
+@pytest.mark.asyncio
+async def test_unwanted_messages_are_dropped_before_deserialization() -> None:
+    """Only documents a callback subscribed to, of the wanted runs, are unpacked."""
+    deserializer = Mock(side_effect=unpackb)
+    dispatcher = NATSDispatcher(
+        subject="events.>", loop=asyncio.get_running_loop(), deserializer=deserializer, run_ids={"run"}, metrics=True
+    )
+    received = []
+    dispatcher.subscribe(lambda name, doc: received.append((name, doc)), "start")
+    messages = [
+        _message("events.test.start", packb({"uid": "run"}), {"run_id": "run"}),
+        _message("events.test.event", packb({"seq_num": 1}), {"run_id": "run"}),
+        _message("events.test.start", packb({"uid": "other"}), {"run_id": "other"}),
+        _message("events.test.unknown", b"", {"run_id": "run"}),
+    ]
+
+    for msg in messages:
+        await dispatcher._handle_message(msg)  # noqa: SLF001
+    await asyncio.sleep(0)
+
+    assert received == [("start", {"uid": "run"})]
+    deserializer.assert_called_once()
+    assert dispatcher.metrics.filtered == 3
+    assert all(msg.ack.await_count == 1 for msg in messages)
+
+
+@pytest.mark.asyncio
+async def test_unsubscribed_documents_are_no_longer_deserialized() -> None:
+    """Once the last callback of a document type is gone, its messages are dropped unread."""
+    deserializer = Mock(side_effect=unpackb)
+    dispatcher = NATSDispatcher(subject="events.>", loop=asyncio.get_running_loop(), deserializer=deserializer)
+    received = []
+    token = dispatcher.subscribe(lambda name, doc: received.append(name), "event")
+
+    await dispatcher._handle_message(_message("events.test.event", packb({"seq_num": 1})))  # noqa: SLF001
+    await asyncio.sleep(0)
+    dispatcher.unsubscribe(token)
+    await dispatcher._handle_message(_message("events.test.event", packb({"seq_num": 2})))  # noqa: SLF001
+    await asyncio.sleep(0)
+
+    assert received == ["event"]
+    deserializer.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_documents_become_server_side_filter_subjects() -> None:
+    """With a single token wildcard the consumer only delivers the wanted documents."""
+    dispatcher = NATSDispatcher(
+        subject="events.nats-bluesky.*", loop=asyncio.get_running_loop(), documents={"stop", "start"}
+    )
+    dispatcher._js = Mock(subscribe=AsyncMock())  # noqa: SLF001
+
+    await dispatcher._subscribe()  # noqa: SLF001
+
+    config = dispatcher._js.subscribe.await_args.kwargs["config"]  # noqa: SLF001
+    assert config.filter_subjects == ["events.nats-bluesky.start", "events.nats-bluesky.stop"]
+    assert dispatcher._sequences is None  # noqa: SLF001
+
+
+def test_documents_must_be_document_names() -> None:
+    """Typos in the document filter are reported."""
+    with pytest.raises(ValueError, match="documents"):
+        NATSDispatcher(subject="events.>", documents={"starts"})
@@ -1,4 +1,6 @@
 import asyncio
+import threading
+import time
 from concurrent.futures import CancelledError as FutureCancelledError
 from concurrent.futures import Future
 from dataclasses import asdict
@@ -6,12 +8,39 @@ from types import SimpleNamespace
 from unittest.mock import AsyncMock, Mock
 from uuid import uuid4
 
+import numpy as np
 import pytest
 from hypothesis import given
 from hypothesis.strategies import text, uuids
+from nats.js.api import PubAck
 from nats.js.errors import NoStreamResponseError
-
-from bluesky_nats.nats_publisher import NATSClientConfig, NATSPublisher
+from ormsgpack import packb
+
+from bluesky_nats.batching import BatchConfig
+from bluesky_nats.compression import CONTENT_ENCODING_HEADER, CompressionConfig, get_codec
+from bluesky_nats.metrics import PublisherMetrics
+from bluesky_nats.nats_dispatcher import NATSDispatcher
+from bluesky_nats.nats_publisher import (
+    MSG_ID_HEADER,
+    PACKB_OPTIONS,
+    AsyncNATSPublisher,
+    CorePublishConfig,
+    CoroutineExecutor,
+    NATSClientConfig,
+    NATSPublisher,
+    PriorityLanes,
+    PublishTracker,
+    PublishWindow,
+    RetryConfig,
+    WindowPolicy,
+    message_id,
+    subject_matches,
+)
+from bluesky_nats.object_store import ArrayOffloadConfig
+from bluesky_nats.routing import EXPECTED_STREAM_HEADER, RouteRule
+from bluesky_nats.sequencing import SEQUENCE_HEADER
+from bluesky_nats.spool import SpoolConfig
+from bluesky_nats.tracing import TRACEPARENT_HEADER, TracingConfig
 
 
 class InlineCoroutineExecutor:
@@ -24,6 +53,19 @@ class InlineCoroutineExecutor:
         return future
 
 
+class PendingCoroutineExecutor:
+    """Keep submitted publishes in flight until the test resolves them."""
+
+    def __init__(self) -> None:
+        self.futures: list[Future[None]] = []
+
+    def submit_coroutine(self, coro):
+        coro.close()
+        future: Future[None] = Future()
+        self.futures.append(future)
+        return future
+
+
 @pytest.fixture
 def mock_executor():
     """Fixture to mock the executor's submit method."""
@@ -323,7 +365,7 @@ def test_call_raises_after_latched_publish_error_in_strict_mode(mock_executor) -
 
     failed_future: Future[None] = Future()
     failed_future.set_exception(RuntimeError("publish failed"))
-    publisher._on_publish_done(failed_future)  # noqa: SLF001
+    publisher._track_publish(failed_future)  # noqa: SLF001
 
     with pytest.raises(RuntimeError, match="NATS strict publish failure: publish failed"):
         publisher("event", {"time": 0})
@@ -336,7 +378,7 @@ def test_call_does_not_raise_after_latched_publish_error_in_non_strict_mode(mock
 
     failed_future: Future[None] = Future()
     failed_future.set_exception(RuntimeError("publish failed"))
-    publisher._on_publish_done(failed_future)  # noqa: SLF001
+    publisher._track_publish(failed_future)  # noqa: SLF001
 
     publisher("event", {"time": 0})
 
@@ -372,12 +414,12 @@ def test_flush_publishes_returns_false_on_failed_future_and_continues(mock_execu
     ok_future: Future[None] = Future()
     ok_future.set_result(None)
 
-    publisher._publish_futures.add(failed_future)  # noqa: SLF001
-    publisher._publish_futures.add(ok_future)  # noqa: SLF001
+    publisher._track_publish(failed_future)  # noqa: SLF001
+    publisher._track_publish(ok_future)  # noqa: SLF001
 
     flushed = publisher.flush_publishes(timeout=1)
     assert flushed is False
-    assert not publisher._publish_futures  # noqa: SLF001
+    assert publisher.health.pending_publishes == 0
 
 
 def test_close_returns_false_when_publish_future_failed(mock_executor) -> None:
@@ -387,7 +429,7 @@ def test_close_returns_false_when_publish_future_failed(mock_executor) -> None:
 
     failed_future: Future[None] = Future()
     failed_future.set_exception(RuntimeError("publish failed"))
-    publisher._publish_futures.add(failed_future)  # noqa: SLF001
+    publisher._track_publish(failed_future)  # noqa: SLF001
 
     closed = publisher.close(timeout=1)
     assert closed is False
@@ -401,11 +443,11 @@ def test_flush_publishes_returns_false_on_cancelled_future(mock_executor) -> Non
     cancelled_future: Future[None] = Future()
     cancelled_future.cancel()
 
-    publisher._publish_futures.add(cancelled_future)  # noqa: SLF001
+    publisher._track_publish(cancelled_future)  # noqa: SLF001
 
     flushed = publisher.flush_publishes(timeout=1)
     assert flushed is False
-    assert not publisher._publish_futures  # noqa: SLF001
+    assert publisher.health.pending_publishes == 0
 
     health = publisher.health
     assert health.last_error is not None
@@ -445,6 +487,12 @@ def test_status_defaults(mock_executor) -> None:
     assert health.connected is False
     assert health.strict_publish is False
     assert health.pending_publishes == 0
+    assert health.inflight_bytes == 0
+    assert health.dropped_publishes == 0
+    assert health.failed_publishes == 0
+    assert health.spooled_publishes == 0
+    assert health.core_publishes == 0
+    assert health.estimated_lost == 0
     assert health.last_error is None
     assert health.last_error_at is None
     assert health.last_ack_at is None
@@ -473,3 +521,941 @@ async def test_status_updates_on_publish_ack(publisher) -> None:
 
     assert health.last_subject == "health.subject"
     assert health.last_ack_at is not None
+
+
+def test_call_with_batching_publishes_event_pages(mock_executor) -> None:
+    """Batching mode coalesces events and flushes them before the stop document."""
+    publisher = NATSPublisher(
+        executor=mock_executor, subject_factory="test.subject", batching=BatchConfig(max_size=10, linger=None)
+    )
+    publisher._publish_ordered = Mock(side_effect=publisher._publish_ordered)  # type: ignore[method-assign]  # noqa: SLF001
+    publisher._start_connect_if_needed = Mock()  # type: ignore[method-assign]  # noqa: SLF001
+    run_id = uuid4()
+
+    publisher("start", {"uid": run_id})
+    for seq_num in range(1, 4):
+        publisher(
+            "event",
+            {
+                "uid": str(uuid4()),
+                "time": 0.0,
+                "seq_num": seq_num,
+                "descriptor": "d1",
+                "data": {"x": seq_num},
+                "timestamps": {"x": 0.0},
+                "filled": {},
+            },
+        )
+    assert mock_executor.submit_coroutine.call_count == 1
+
+    publisher("stop", {"uid": str(uuid4()), "run_start": run_id})
+    assert mock_executor.submit_coroutine.call_count == 3
+    subjects = [call.args[0] for call in publisher._publish_ordered.call_args_list]  # noqa: SLF001
+    assert subjects == ["test.subject.start", "test.subject.event_page", "test.subject.stop"]
+
+
+def test_failed_linger_flush_is_latched_in_strict_mode() -> None:
+    """A page the linger timer cannot publish is kept and fails the next call in strict mode."""
+    executor = PendingCoroutineExecutor()
+    publisher = NATSPublisher(
+        executor=executor,
+        strict_publish=True,
+        batching=BatchConfig(max_size=100, linger=0.01),
+        window=PublishWindow(max_messages=1, policy=WindowPolicy.RAISE),
+    )
+    publisher._start_connect_if_needed = Mock()  # type: ignore[method-assign]  # noqa: SLF001
+    run_id = uuid4()
+    publisher("start", {"uid": run_id})
+    for seq_num in range(1, 4):
+        event = {"uid": str(uuid4()), "time": 0.0, "seq_num": seq_num, "descriptor": "d1"}
+        publisher("event", {**event, "data": {}, "timestamps": {}, "filled": {}})
+
+    deadline = time.monotonic() + 2
+    while publisher._strict_error is None and time.monotonic() < deadline:  # noqa: SLF001
+        time.sleep(0.01)
+
+    with pytest.raises(RuntimeError, match="NATS publish window full"):
+        publisher("stop", {"uid": str(uuid4()), "run_start": run_id})
+    assert publisher._batcher.pending == 3  # noqa: SLF001
+    assert len(executor.futures) == 1
+
+
+def _windowed_publisher(window: PublishWindow) -> tuple[NATSPublisher, PendingCoroutineExecutor]:
+    executor = PendingCoroutineExecutor()
+    publisher = NATSPublisher(executor=executor, window=window)
+    publisher._start_connect_if_needed = Mock()  # type: ignore[method-assign]  # noqa: SLF001
+    publisher.run_id = uuid4()
+    return publisher, executor
+
+
+def test_publish_window_rejects_invalid_limits() -> None:
+    """Window limits must be positive and the policy must be known."""
+    with pytest.raises(ValueError, match="max_messages"):
+        PublishWindow(max_messages=0)
+    with pytest.raises(ValueError, match="max_bytes"):
+        PublishWindow(max_bytes=-1)
+    with pytest.raises(ValueError, match="'sometimes' is not a valid WindowPolicy"):
+        PublishWindow(policy="sometimes")  # type: ignore[arg-type]
+
+
+def test_publish_window_raise_policy() -> None:
+    """A full window raises immediately with the raise policy."""
+    publisher, _ = _windowed_publisher(PublishWindow(max_messages=1, policy=WindowPolicy.RAISE))
+
+    publisher("event", {"time": 0})
+    with pytest.raises(RuntimeError, match="NATS publish window full"):
+        publisher("event", {"time": 1})
+
+
+def test_publish_window_drop_policy_drops_only_volatile_documents() -> None:
+    """Events are dropped when the window is full, run documents still block."""
+    publisher, executor = _windowed_publisher(PublishWindow(max_messages=1, policy=WindowPolicy.DROP, timeout=0.01))
+
+    publisher("event", {"time": 0})
+    publisher("event", {"time": 1})
+    assert len(executor.futures) == 1
+    assert publisher.health.dropped_publishes == 1
+
+    with pytest.raises(TimeoutError, match="NATS publish window did not free up"):
+        publisher("descriptor", {"uid": "d1"})
+
+
+@pytest.mark.asyncio
+async def test_dropped_documents_leave_no_sequence_gap() -> None:
+    """Documents dropped by a full window are not numbered, so the dispatcher sees no gap."""
+    publisher, executor = _windowed_publisher(PublishWindow(max_messages=1, policy=WindowPolicy.DROP))
+    publisher._publish_ordered = Mock(side_effect=publisher._publish_ordered)  # type: ignore[method-assign]  # noqa: SLF001
+    run_id = str(uuid4())
+    publisher("start", {"uid": run_id})
+    executor.futures[0].set_result(True)
+    publisher("event", {"seq_num": 1})
+    publisher("event", {"seq_num": 2})
+    executor.futures[1].set_result(True)
+    publisher("event", {"seq_num": 3})
+
+    dispatcher = NATSDispatcher(subject="events.>", loop=asyncio.get_running_loop(), metrics=True)
+    received = []
+    dispatcher.subscribe(lambda name, doc: received.append(doc.get("seq_num")))
+    for call in publisher._publish_ordered.call_args_list:  # noqa: SLF001
+        subject, payload, headers = call.args[:3]
+        msg = SimpleNamespace(subject=subject, data=payload, headers=headers, reply=None, ack=AsyncMock())
+        await dispatcher._handle_message(msg)  # noqa: SLF001
+    await asyncio.sleep(0)
+
+    assert publisher.health.dropped_publishes == 1
+    assert received == [None, 1, 3]
+    assert (dispatcher.metrics.refetched, dispatcher.metrics.missing) == (0, 0)
+
+
+def test_publish_window_block_policy_resumes_when_publish_completes() -> None:
+    """A blocked caller proceeds once an in-flight publish completes."""
+    publisher, executor = _windowed_publisher(PublishWindow(max_messages=1, timeout=5))
+    publisher("event", {"time": 0})
+
+    threading.Timer(0.05, executor.futures[0].set_result, args=(None,)).start()
+    publisher("event", {"time": 1})
+
+    assert len(executor.futures) == 2
+
+
+def test_publish_window_by_bytes_reports_occupancy() -> None:
+    """Health exposes in-flight bytes, a byte limit admits one oversized payload."""
+    publisher, executor = _windowed_publisher(PublishWindow(max_bytes=10, policy=WindowPolicy.RAISE))
+
+    publisher("event", {"data": "x" * 100})
+    assert publisher.health.pending_publishes == 1
+    assert publisher.health.inflight_bytes > 10
+
+    with pytest.raises(RuntimeError, match="NATS publish window full"):
+        publisher("event", {"data": "y"})
+
+    executor.futures[0].set_result(None)
+    assert publisher.health.inflight_bytes == 0
+    assert publisher.health.pending_publishes == 0
+
+
+@pytest.fixture
+def offloading_publisher():
+    """Publisher packing documents on its serializer thread with publish mocked out."""
+    executor = CoroutineExecutor()
+    publisher = NATSPublisher(executor=executor, subject_factory="test.subject", offload_serialization=True)
+    publisher.publish = AsyncMock()  # type: ignore[method-assign]
+    publisher._start_connect_if_needed = Mock()  # type: ignore[method-assign]  # noqa: SLF001
+    publisher.run_id = uuid4()
+    yield publisher
+    executor.shutdown()
+
+
+def test_offloaded_serialization_runs_off_caller_thread(offloading_publisher, mocker) -> None:
+    """Payloads are packed on the serializer thread and published unchanged."""
+    pack_threads: list[str] = []
+
+    def _packb(doc, option):
+        pack_threads.append(threading.current_thread().name)
+        return packb(doc, option=option)
+
+    mocker.patch("bluesky_nats.nats_publisher.packb", side_effect=_packb)
+    doc = {"time": 0, "data": {"x": 1}}
+    offloading_publisher("event", doc)
+
+    assert offloading_publisher.flush_publishes(timeout=2) is True
+    assert len(pack_threads) == 1
+    assert pack_threads[0].startswith("nats-serializer")
+    offloading_publisher.publish.assert_awaited_once_with(
+        subject="test.subject.event", payload=packb(doc, option=PACKB_OPTIONS), headers=mocker.ANY
+    )
+
+
+def test_offloaded_serialization_preserves_order(offloading_publisher) -> None:
+    """Offloaded documents are published in the order they were emitted."""
+    for seq_num in range(50):
+        offloading_publisher("event", {"seq_num": seq_num})
+
+    assert offloading_publisher.flush_publishes(timeout=5) is True
+    payloads = [call.kwargs["payload"] for call in offloading_publisher.publish.await_args_list]
+    assert payloads == [packb({"seq_num": seq_num}, option=PACKB_OPTIONS) for seq_num in range(50)]
+
+
+def test_offloaded_serialization_error_is_latched_in_strict_mode(offloading_publisher, mocker) -> None:
+    """Serialization failures on the worker surface on the next callback in strict mode."""
+    offloading_publisher._strict_publish = True  # noqa: SLF001
+    emitted = threading.Event()
+
+    def _packb(doc, option):
+        # fail only after the callback has returned, as a slow worker would
+        emitted.wait(timeout=2)
+        return packb(doc, option=option)
+
+    mocker.patch("bluesky_nats.nats_publisher.packb", side_effect=_packb)
+    offloading_publisher("event", {"data": object()})
+    emitted.set()
+
+    assert offloading_publisher.flush_publishes(timeout=2) is False
+    offloading_publisher.publish.assert_not_awaited()
+    with pytest.raises(RuntimeError, match="NATS strict publish failure"):
+        offloading_publisher("event", {"time": 0})
+
+
+def test_array_offload_keeps_publish_order_while_uploading(mocker) -> None:
+    """Documents emitted after an offloaded event wait until that event is published."""
+    executor = CoroutineExecutor()
+    publisher = NATSPublisher(
+        executor=executor, subject_factory="test.subject", array_offload=ArrayOffloadConfig(threshold=8)
+    )
+    publisher.publish = AsyncMock()  # type: ignore[method-assign]
+    publisher._start_connect_if_needed = Mock()  # type: ignore[method-assign]  # noqa: SLF001
+
+    async def _slow_upload(uploads):
+        await asyncio.sleep(0.05)
+
+    upload = mocker.patch.object(publisher, "_upload_arrays", side_effect=_slow_upload)
+    run_id = uuid4()
+    frame = np.zeros(16)
+
+    try:
+        publisher("start", {"uid": run_id})
+        publisher("event", {"uid": "e1", "data": {"img": frame}})
+        publisher("stop", {"uid": "stop", "run_start": run_id})
+        assert publisher.flush_publishes(timeout=2) is True
+    finally:
+        executor.shutdown()
+
+    upload.assert_awaited_once_with([("e1/img", frame)])
+    subjects = [call.kwargs["subject"] for call in publisher.publish.await_args_list]
+    assert subjects == ["test.subject.start", "test.subject.event", "test.subject.stop"]
+
+
+def test_compression_applies_above_min_size_and_sets_header(publisher) -> None:
+    """Payloads above the threshold are compressed and tagged with Content-Encoding."""
+    publisher._codec = get_codec("deflate")  # noqa: SLF001
+    publisher._compression = CompressionConfig(codec="deflate", min_size=64)  # noqa: SLF001
+
+    small_headers: dict = {}
+    assert publisher._encode({"x": 1}, small_headers) == packb({"x": 1})  # noqa: SLF001
+    assert CONTENT_ENCODING_HEADER not in small_headers
+
+    doc = {"data": "x" * 1000}
+    large_headers: dict = {}
+    payload = publisher._encode(doc, large_headers)  # noqa: SLF001
+    assert large_headers[CONTENT_ENCODING_HEADER] == "deflate"
+    assert len(payload) < 1000
+    assert get_codec("deflate").decompress(payload) == packb(doc)
+
+
+@pytest.mark.asyncio
+async def test_spool_holds_publishes_while_disconnected_and_replays_in_order(tmp_path, mocker) -> None:
+    """Publishes fail over to the spool and are replayed in order once NATS is reachable."""
+    mocker.patch("bluesky_nats.nats_publisher.SPOOL_RETRY_INTERVAL", 0.01)
+    publisher = NATSPublisher(executor=Mock(), strict_publish=True, spool=SpoolConfig(tmp_path))
+    js = AsyncMock()
+    publisher._get_jetstream = AsyncMock(side_effect=ConnectionError("down"))  # type: ignore[method-assign]  # noqa: SLF001
+
+    for index in range(3):
+        await publisher.publish(subject=f"events.{index}", payload=b"doc", headers={"run_id": "run"})
+
+    health = publisher.health
+    assert health.spooled_publishes == 3
+    assert "ConnectionError: down" in str(health.last_error)
+    publisher._raise_if_strict_error()  # noqa: SLF001
+
+    publisher._get_jetstream.side_effect = None  # noqa: SLF001
+    publisher._get_jetstream.return_value = js  # noqa: SLF001
+    await asyncio.wait_for(publisher._spool_replay, timeout=2)  # type: ignore[arg-type]  # noqa: SLF001
+
+    assert publisher.health.spooled_publishes == 0
+    assert [call.kwargs["subject"] for call in js.publish.await_args_list] == ["events.0", "events.1", "events.2"]
+    await publisher.publish(subject="events.3", payload=b"doc", headers={})
+    js.publish.assert_awaited_with(subject="events.3", payload=b"doc", headers={})
+
+
+@pytest.mark.asyncio
+async def test_spool_replay_retries_from_first_failed_record(tmp_path, mocker) -> None:
+    """Only the acknowledged prefix of a replay batch is released from the spool."""
+    mocker.patch("bluesky_nats.nats_publisher.SPOOL_RETRY_INTERVAL", 0.01)
+    publisher = NATSPublisher(executor=Mock(), spool=SpoolConfig(tmp_path))
+    publisher.js = AsyncMock()
+    publisher.js.publish.side_effect = [TimeoutError(), TimeoutError(), None, None, None]
+    publisher.nats_client = Mock(is_connected=True)
+
+    await publisher.publish(subject="events.0", payload=b"doc", headers={})
+    await publisher.publish(subject="events.1", payload=b"doc", headers={})
+    await asyncio.wait_for(publisher._spool_replay, timeout=2)  # type: ignore[arg-type]  # noqa: SLF001
+
+    subjects = [call.kwargs["subject"] for call in publisher.js.publish.await_args_list]
+    assert subjects == ["events.0", "events.0", "events.1", "events.0", "events.1"]
+    assert publisher.health.spooled_publishes == 0
+
+
+@pytest.mark.asyncio
+async def test_partially_failed_replay_batch_is_stored_once(tmp_path, mocker) -> None:
+    """Records resent after a failure in a replay batch are dropped by their deterministic Nats-Msg-Id."""
+    mocker.patch("bluesky_nats.nats_publisher.SPOOL_RETRY_INTERVAL", 0.01)
+    publisher = NATSPublisher(executor=Mock(), spool=SpoolConfig(tmp_path))
+    publisher._get_jetstream = AsyncMock(side_effect=ConnectionError("down"))  # type: ignore[method-assign]  # noqa: SLF001
+    for seq_num in range(4):
+        headers = {"run_id": "run", SEQUENCE_HEADER: str(seq_num + 1)}
+        await publisher.publish(subject=f"events.{seq_num}", payload=b"doc", headers=headers)
+
+    stream: list[str] = []
+    failures = iter([False, True])
+
+    async def store(subject: str, payload: bytes, headers: dict) -> PubAck:
+        if subject == "events.1" and next(failures, False):
+            raise TimeoutError
+        duplicate = headers[MSG_ID_HEADER] in stream
+        if not duplicate:
+            stream.append(headers[MSG_ID_HEADER])
+        return PubAck(stream="bluesky", seq=len(stream), duplicate=duplicate)
+
+    js = AsyncMock()
+    js.publish.side_effect = store
+    publisher._get_jetstream.side_effect = None  # noqa: SLF001
+    publisher._get_jetstream.return_value = js  # noqa: SLF001
+    await asyncio.wait_for(publisher._spool_replay, timeout=2)  # type: ignore[arg-type]  # noqa: SLF001
+
+    assert sorted(stream) == ["run:1", "run:2", "run:3", "run:4"]
+    assert publisher.health.spooled_publishes == 0
+
+
+@pytest.mark.asyncio
+async def test_spool_drains_while_publishes_arrive_faster_than_one_round_trip(tmp_path, mocker) -> None:
+    """Replay keeps several acks outstanding, so the backlog shrinks under a steady publish stream."""
+    mocker.patch("bluesky_nats.nats_publisher.SPOOL_RETRY_INTERVAL", 0.01)
+    publisher = NATSPublisher(executor=Mock(), spool=SpoolConfig(tmp_path))
+    publisher._get_jetstream = AsyncMock(side_effect=ConnectionError("down"))  # type: ignore[method-assign]  # noqa: SLF001
+    for seq_num in range(50):
+        await publisher.publish(subject=f"events.{seq_num}", payload=b"doc", headers={})
+
+    async def slow_ack(subject: str, payload: bytes, headers: dict) -> PubAck:
+        await asyncio.sleep(0.01)
+        return PubAck(stream="bluesky", seq=1)
+
+    js = AsyncMock()
+    js.publish.side_effect = slow_ack
+    publisher._get_jetstream.side_effect = None  # noqa: SLF001
+    publisher._get_jetstream.return_value = js  # noqa: SLF001
+    # one publish per millisecond, ten times the rate of replaying one record per round trip
+    for seq_num in range(50, 150):
+        await publisher.publish(subject=f"events.{seq_num}", payload=b"doc", headers={})
+        await asyncio.sleep(0.001)
+    assert publisher.health.spooled_publishes < 50
+
+    await asyncio.wait_for(publisher._spool_replay, timeout=2)  # type: ignore[arg-type]  # noqa: SLF001
+    assert publisher.health.spooled_publishes == 0
+    subjects = [call.kwargs["subject"] for call in js.publish.await_args_list]
+    assert subjects == [f"events.{seq_num}" for seq_num in range(150)]
+
+
+@pytest.mark.asyncio
+async def test_publish_without_spool_space_records_error(tmp_path) -> None:
+    """When the spool is full the failure is handled as before."""
+    publisher = NATSPublisher(executor=Mock(), strict_publish=True, spool=SpoolConfig(tmp_path, max_bytes=16))
+    publisher._get_jetstream = AsyncMock(side_effect=ConnectionError("down"))  # type: ignore[method-assign]  # noqa: SLF001
+
+    with pytest.raises(ConnectionError):
+        await publisher.publish(subject="events.0", payload=b"x" * 100, headers={})
+    assert publisher.health.spooled_publishes == 0
+
+
+def test_retry_config_backoff_is_bounded() -> None:
+    """Backoff grows exponentially up to max_backoff and invalid settings are rejected."""
+    retry = RetryConfig(initial_backoff=0.1, max_backoff=0.5, multiplier=2)
+
+    assert [retry.backoff(attempt) for attempt in range(1, 5)] == [0.1, 0.2, 0.4, 0.5]
+    with pytest.raises(ValueError, match="max_attempts"):
+        RetryConfig(max_attempts=0)
+    with pytest.raises(ValueError, match="backoff"):
+        RetryConfig(initial_backoff=1, max_backoff=0.5)
+
+
+def test_message_id_is_derived_from_document_keys() -> None:
+    """Message ids are stable per document and distinguish pages by first uid and length."""
+    assert message_id("event", {"uid": "e1"}) == "event:e1"
+    assert message_id("event_page", {"uid": ["e1", "e2"]}) == "event_page:e1:2"
+    assert message_id("datum", {"datum_id": "r1/0"}) == "datum:r1/0"
+    assert message_id("datum_page", {"datum_id": ["r1/0", "r1/1"]}) == "datum_page:r1/0:2"
+    assert message_id("event", {}) is None
+
+
+def test_retry_attaches_message_id_header() -> None:
+    """With retry enabled every message carries a deterministic Nats-Msg-Id header."""
+    executor = Mock(wraps=InlineCoroutineExecutor())
+    publisher = NATSPublisher(executor=executor, subject_factory="test.subject", retry=RetryConfig())
+    publisher.publish = AsyncMock()  # type: ignore[method-assign]
+    publisher._start_connect_if_needed = Mock()  # type: ignore[method-assign]  # noqa: SLF001
+    run_id = str(uuid4())
+
+    publisher("start", {"uid": run_id})
+    publisher("event", {"uid": "e1"})
+    publisher("bulk_events", {})
+
+    headers = [call.kwargs["headers"][MSG_ID_HEADER] for call in publisher.publish.await_args_list]
+    assert headers == [f"start:{run_id}", "event:e1", f"{run_id}:3"]
+
+
+@pytest.mark.asyncio
+async def test_publish_retries_transient_failures(publisher) -> None:
+    """Timeouts and missing stream responses are retried until the publish is acknowledged."""
+    publisher._retry = RetryConfig(initial_backoff=0.001)  # noqa: SLF001
+    publisher.js.publish.side_effect = [TimeoutError(), NoStreamResponseError(), None]
+
+    await publisher.publish(subject="events.0", payload=b"doc", headers={})
+
+    assert publisher.js.publish.await_count == 3
+    assert publisher.health.last_error is None
+    assert publisher.health.last_ack_at is not None
+
+
+@pytest.mark.asyncio
+async def test_publish_gives_up_after_max_attempts(publisher) -> None:
+    """Exhausted retries are recorded like any other publish failure."""
+    publisher._retry = RetryConfig(max_attempts=3, initial_backoff=0.001)  # noqa: SLF001
+    publisher._strict_publish = True  # noqa: SLF001
+    publisher.js.publish.side_effect = TimeoutError("no ack")
+
+    await publisher.publish(subject="events.0", payload=b"doc", headers={})
+
+    assert publisher.js.publish.await_count == 3
+    with pytest.raises(RuntimeError, match="no ack"):
+        publisher._raise_if_strict_error()  # noqa: SLF001
+
+
+@pytest.mark.asyncio
+async def test_publish_does_not_retry_permanent_failures(publisher) -> None:
+    """Errors that are not transient fail on the first attempt."""
+    publisher._retry = RetryConfig(initial_backoff=0.001)  # noqa: SLF001
+    publisher.js.publish.side_effect = ValueError("bad payload")
+
+    await publisher.publish(subject="events.0", payload=b"doc", headers={})
+
+    assert publisher.js.publish.await_count == 1
+    assert "ValueError: bad payload" in str(publisher.health.last_error)
+
+
+@pytest.mark.parametrize(
+    ("pattern", "subject", "expected"),
+    [
+        ("events.volatile.event", "events.volatile.event", True),
+        ("events.*.event", "events.volatile.event", True),
+        ("events.>", "events.volatile.event", True),
+        ("events.>", "events", False),
+        ("events.*", "events.volatile.event", False),
+        ("events.volatile.stop", "events.volatile.event", False),
+    ],
+)
+def test_subject_matches(pattern, subject, expected) -> None:
+    """NATS wildcards match single tokens and trailing subjects."""
+    assert subject_matches(pattern, subject) is expected
+
+
+def test_core_publish_config_selects_by_document_or_subject() -> None:
+    """Documents are selected by their name token or by subject patterns."""
+    config = CorePublishConfig(documents=frozenset({"event"}), subjects=("preview.>",))
+
+    assert config.selects("events.volatile.event")
+    assert config.selects("preview.volatile.start")
+    assert not config.selects("events.volatile.event_page")
+    with pytest.raises(ValueError, match="sample_every"):
+        CorePublishConfig(sample_every=0)
+
+
+@pytest.mark.asyncio
+async def test_core_publish_skips_acks_and_estimates_loss_from_sampled_sequence(publisher) -> None:
+    """Selected documents bypass JetStream except for sampled probes, whose sequence reveals gaps."""
+    publisher._core_publish = CorePublishConfig(sample_every=3)  # noqa: SLF001
+    publisher.nats_client = Mock(is_connected=True, publish=AsyncMock())
+    # the stream stored the start document and one of the two events published before the probe
+    publisher.js.publish.side_effect = [PubAck(stream="bluesky", seq=1), PubAck(stream="bluesky", seq=3)]
+
+    await publisher.publish(subject="test.subject.start", payload=b"start", headers={})
+    for seq_num in range(5):
+        await publisher.publish(subject="test.subject.event", payload=b"%d" % seq_num, headers={})
+
+    assert publisher.js.publish.await_count == 2
+    assert publisher.js.publish.await_args_list[1].kwargs["payload"] == b"2"
+    assert publisher.nats_client.publish.await_count == 4
+    health = publisher.health
+    assert health.core_publishes == 4
+    assert health.estimated_lost == 1
+
+
+@pytest.mark.asyncio
+async def test_core_publish_loss_estimate_is_kept_per_stream(publisher) -> None:
+    """Publishes routed to another stream between two probes do not count as lost."""
+    publisher._core_publish = CorePublishConfig(sample_every=2)  # noqa: SLF001
+    publisher.nats_client = Mock(is_connected=True, publish=AsyncMock())
+    publisher.js.publish.side_effect = [
+        PubAck(stream="bluesky", seq=2),
+        PubAck(stream="metadata", seq=1),
+        PubAck(stream="bluesky", seq=4),
+    ]
+    routed = {EXPECTED_STREAM_HEADER: "metadata"}
+
+    for seq_num in range(4):
+        if seq_num == 2:
+            await publisher.publish(subject="meta.descriptor", payload=b"d", headers=dict(routed))
+        await publisher.publish(subject="test.subject.event", payload=b"%d" % seq_num, headers={})
+
+    assert publisher.health.estimated_lost == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_core_publish_is_counted_as_lost_once(publisher) -> None:
+    """A core publish that raised is not counted again by the next probe's sequence gap."""
+    publisher._core_publish = CorePublishConfig(sample_every=3)  # noqa: SLF001
+    publisher.nats_client = Mock(is_connected=True, publish=AsyncMock(side_effect=[ConnectionError("down"), None]))
+    # start at seq 1, event 0 fails over core NATS, event 1 is sent, the probe event 2 is acked at seq 3
+    publisher.js.publish.side_effect = [PubAck(stream="bluesky", seq=1), PubAck(stream="bluesky", seq=3)]
+
+    await publisher.publish(subject="test.subject.start", payload=b"start", headers={})
+    for seq_num in range(3):
+        await publisher.publish(subject="test.subject.event", payload=b"%d" % seq_num, headers={})
+
+    assert publisher.js.publish.await_count == 2
+    assert publisher.health.estimated_lost == 1
+
+
+@pytest.mark.asyncio
+async def test_spooled_probe_is_not_counted_as_sent(publisher, mocker) -> None:
+    """A probe that is spooled instead of sent does not turn into an estimated loss."""
+    publisher._core_publish = CorePublishConfig(sample_every=2)  # noqa: SLF001
+    publisher._spool = Mock(pending_records=0, append=AsyncMock(return_value=True))  # noqa: SLF001
+    mocker.patch.object(publisher, "_ensure_spool_replay")
+    publisher.nats_client = Mock(is_connected=True, publish=AsyncMock())
+    # start, then events 0 and 2 over core NATS, the probe event 1 times out, event 3 is acked
+    publisher.js.publish.side_effect = [
+        PubAck(stream="bluesky", seq=1),
+        TimeoutError(),
+        PubAck(stream="bluesky", seq=4),
+    ]
+
+    await publisher.publish(subject="test.subject.start", payload=b"start", headers={})
+    for seq_num in range(4):
+        await publisher.publish(subject="test.subject.event", payload=b"%d" % seq_num, headers={})
+
+    publisher._spool.append.assert_awaited_once()  # noqa: SLF001
+    assert publisher.health.estimated_lost == 0
+
+
+@pytest.mark.asyncio
+async def test_core_publish_failure_counts_as_loss_without_latching(publisher) -> None:
+    """A failed fire-and-forget publish is reported, but does not fail strict mode."""
+    publisher._strict_publish = True  # noqa: SLF001
+    publisher._core_publish = CorePublishConfig(sample_every=None)  # noqa: SLF001
+    publisher.nats_client = Mock(is_connected=True, publish=AsyncMock(side_effect=ConnectionError("closed")))
+
+    await publisher.publish(subject="test.subject.event", payload=b"doc", headers={})
+
+    assert publisher.health.estimated_lost == 1
+    assert "closed" in str(publisher.health.last_error)
+    publisher._raise_if_strict_error()  # noqa: SLF001
+
+
+def _async_publisher(**kwargs) -> AsyncNATSPublisher:
+    publisher = AsyncNATSPublisher(subject_factory="test.subject", **kwargs)
+    publisher.js = AsyncMock()
+    publisher.nats_client = Mock(is_connected=True)
+    return publisher
+
+
+@pytest.mark.asyncio
+async def test_async_publisher_publishes_from_tasks_on_the_running_loop() -> None:
+    """Documents emitted on the loop are published from tasks, without a thread hop."""
+    publisher = _async_publisher()
+    run_id = str(uuid4())
+
+    publish_future = publisher._publish_document("start", {"uid": run_id})  # noqa: SLF001
+    assert isinstance(publish_future, asyncio.Task)
+    publisher("stop", {"uid": "stop", "run_start": run_id})
+
+    assert await publisher.aflush(timeout=1) is True
+    subjects = [call.kwargs["subject"] for call in publisher.js.publish.await_args_list]
+    assert subjects == ["test.subject.start", "test.subject.stop"]
+    assert publisher.health.pending_publishes == 0
+
+
+@pytest.mark.asyncio
+async def test_async_publisher_accepts_documents_from_other_threads() -> None:
+    """Documents emitted off the loop are handed over thread-safely."""
+    publisher = _async_publisher()
+    publisher.run_id = uuid4()
+
+    await asyncio.to_thread(publisher, "event", {"uid": "e1"})
+
+    assert await publisher.aflush(timeout=1) is True
+    publisher.js.publish.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_async_publisher_refuses_to_block_its_loop() -> None:
+    """Blocking calls and a full BLOCK window raise instead of deadlocking the loop."""
+    publisher = _async_publisher(window=PublishWindow(max_messages=1))
+    publisher.run_id = uuid4()
+
+    with pytest.raises(RuntimeError, match="await aflush"):
+        publisher.flush_publishes()
+    publisher("event", {"uid": "e1"})
+    with pytest.raises(RuntimeError, match="window full"):
+        publisher("event", {"uid": "e2"})
+    assert await publisher.aflush(timeout=1) is True
+
+
+@pytest.mark.asyncio
+async def test_async_publisher_close_from_another_thread() -> None:
+    """Synchronous close waits for pending publishes through the loop."""
+    publisher = _async_publisher()
+    publisher.nats_client = Mock(is_connected=True, drain=AsyncMock())
+    publisher.run_id = uuid4()
+    js = publisher.js
+    publisher("event", {"uid": "e1"})
+
+    assert await asyncio.to_thread(publisher.close, 1) is True
+    js.publish.assert_awaited_once()
+    publisher.nats_client.drain.assert_awaited_once()
+    assert publisher.js is None
+
+
+def test_publish_tracker_watermark_handles_out_of_order_completion() -> None:
+    """The watermark only advances over a contiguous prefix of completed publishes."""
+    tracker = PublishTracker()
+    first, second, third = (tracker.track() for _ in range(3))
+    reached: list[int] = []
+    tracker.when_completed(second, lambda: reached.append(second))
+
+    tracker.complete(third)
+    tracker.complete(second, failed=True)
+    assert tracker.pending == 1
+    assert reached == []
+    assert tracker.wait(second, timeout=0.01) is False
+
+    tracker.complete(first)
+    assert tracker.pending == 0
+    assert reached == [second]
+    assert tracker.wait(third, timeout=0) is True
+    assert tracker.failed == 1
+
+
+def test_flush_waits_once_for_a_large_backlog(mock_executor) -> None:
+    """Flush returns when publishes completed from another thread catch up with the backlog."""
+    publisher = NATSPublisher(executor=mock_executor)
+    futures: list[Future[None]] = [Future() for _ in range(10_000)]
+    for future in futures:
+        publisher._track_publish(future)  # noqa: SLF001
+    futures[-1].set_exception(RuntimeError("publish failed"))
+
+    def _complete() -> None:
+        for future in futures[:-1]:
+            future.set_result(None)
+
+    thread = threading.Thread(target=_complete)
+    thread.start()
+    assert publisher.flush_publishes(timeout=5) is False
+    thread.join()
+
+    health = publisher.health
+    assert health.pending_publishes == 0
+    assert health.failed_publishes == 1
+    # failures are reported by the first flush that sees them
+    assert publisher.flush_publishes(timeout=1) is True
+
+
+def test_flush_run_waits_only_for_that_runs_publishes() -> None:
+    """A run is flushed once its own publishes are acknowledged, later publishes are not awaited."""
+    executor = PendingCoroutineExecutor()
+    publisher = NATSPublisher(executor=executor, subject_factory="test.subject")
+    publisher._start_connect_if_needed = Mock()  # type: ignore[method-assign]  # noqa: SLF001
+
+    publisher("start", {"uid": "run-1"})
+    publisher("stop", {"uid": "stop-1", "run_start": "run-1"})
+    publisher("start", {"uid": "run-2"})
+    assert publisher.flush_run("run-1", timeout=0.01) is False
+
+    executor.futures[0].set_result(True)
+    executor.futures[1].set_result(True)
+    assert publisher.flush_run("run-1", timeout=0.01) is True
+    assert publisher.flush_run("run-2", timeout=0.01) is False
+    assert publisher.flush_run("unknown", timeout=0) is True
+
+
+def test_flush_run_fails_for_unacknowledged_publishes() -> None:
+    """Publishes that were spooled or failed without raising fail both the run and the global flush."""
+    executor = PendingCoroutineExecutor()
+    publisher = NATSPublisher(executor=executor, subject_factory="test.subject")
+    publisher._start_connect_if_needed = Mock()  # type: ignore[method-assign]  # noqa: SLF001
+
+    publisher("start", {"uid": "run-1"})
+    executor.futures[0].set_result(False)
+
+    assert publisher.flush_run("run-1", timeout=0.01) is False
+    assert publisher.flush_publishes(timeout=0.01) is False
+
+
+def test_spooled_publish_is_not_counted_as_failed(tmp_path, mocker) -> None:
+    """A publish that is spooled and replayed fails the flush, but is no failed publish."""
+    mocker.patch("bluesky_nats.nats_publisher.SPOOL_RETRY_INTERVAL", 0.01)
+    executor = CoroutineExecutor()
+    publisher = NATSPublisher(executor=executor, subject_factory="test.subject", spool=SpoolConfig(tmp_path))
+    publisher.js = AsyncMock()
+    publisher.js.publish.side_effect = [TimeoutError(), None]
+    publisher.nats_client = Mock(is_connected=True)
+
+    try:
+        publisher("start", {"uid": "run-1"})
+        assert publisher.flush_publishes(timeout=2) is False
+        deadline = time.monotonic() + 2
+        while publisher.health.spooled_publishes and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        executor.shutdown()
+    health = publisher.health
+    assert publisher.js.publish.await_count == 2
+    assert (health.spooled_publishes, health.failed_publishes) == (0, 0)
+
+
+def test_swallowed_publish_error_fails_flush_publishes() -> None:
+    """A publish that logs a NoStreamResponseError and returns False is reported by flush_publishes."""
+    executor = CoroutineExecutor()
+    publisher = NATSPublisher(executor=executor, subject_factory="test.subject")
+    publisher.js = AsyncMock()
+    publisher.js.publish.side_effect = NoStreamResponseError("No streams available")
+    publisher.nats_client = Mock(is_connected=True)
+
+    try:
+        publisher("start", {"uid": "run-1"})
+        assert publisher.flush_publishes(timeout=2) is False
+        assert publisher.flush_run("run-1", timeout=0.01) is False
+    finally:
+        executor.shutdown()
+    assert publisher.health.failed_publishes == 1
+
+
+def test_flush_on_stop_waits_for_the_stopped_run(mock_executor) -> None:
+    """With flush_on_stop, a stop document returns once its run is acknowledged."""
+    publisher = NATSPublisher(executor=mock_executor, subject_factory="test.subject", flush_on_stop=1.0)
+    publisher.flush_run = Mock(return_value=True)  # type: ignore[method-assign]
+
+    publisher("start", {"uid": "run-1"})
+    publisher.flush_run.assert_not_called()
+    publisher("stop", {"uid": "stop-1", "run_start": "run-1"})
+    publisher.flush_run.assert_called_once_with("run-1", timeout=1.0)
+
+
+def test_flush_on_stop_raises_in_strict_mode(mock_executor) -> None:
+    """An unflushed run fails the stop document in strict mode."""
+    publisher = NATSPublisher(
+        executor=mock_executor, subject_factory="test.subject", strict_publish=True, flush_on_stop=0.01
+    )
+    publisher.flush_run = Mock(return_value=False)  # type: ignore[method-assign]
+    publisher("start", {"uid": "run-1"})
+
+    with pytest.raises(RuntimeError, match="run-1"):
+        publisher("stop", {"uid": "stop-1", "run_start": "run-1"})
+
+
+@pytest.mark.asyncio
+async def test_async_publisher_flushes_a_run_on_its_loop() -> None:
+    """aflush_run awaits the run's publishes, flush_on_stop is refused."""
+    publisher = _async_publisher()
+    publisher("start", {"uid": "run-1"})
+    publisher("stop", {"uid": "stop-1", "run_start": "run-1"})
+
+    assert await publisher.aflush_run("run-1", timeout=1) is True
+    assert publisher.js.publish.await_count == 2
+    with pytest.raises(RuntimeError, match="await aflush_run"):
+        publisher.flush_run("run-1")
+    with pytest.raises(ValueError, match="flush_on_stop"):
+        _async_publisher(flush_on_stop=1.0)
+
+
+@pytest.mark.asyncio
+async def test_metrics_record_serialization_queueing_and_ack_latency(publisher) -> None:
+    """With metrics enabled, every stage of a publish is timed and throughput is counted per subject."""
+    assert publisher.metrics is None
+    assert publisher.health.metrics is None
+    publisher._metrics = PublisherMetrics()  # noqa: SLF001
+
+    payload = publisher._encode({"uid": "e1"}, {})  # noqa: SLF001
+    await publisher._publish_ordered("test.subject.event", payload, {}, [], queued_at=1)  # noqa: SLF001
+
+    metrics = publisher.health.metrics
+    assert metrics is not None
+    assert metrics.serialization.count == 1
+    assert metrics.queue_delay.count == 1
+    assert metrics.ack_latency.count == 1
+    assert metrics.subjects["test.subject.event"].bytes == len(payload)
+
+
+def test_tracing_adds_trace_context_to_sampled_documents() -> None:
+    """Sampled documents carry traceparent, publish time and per-run sequence headers."""
+    executor = Mock(wraps=InlineCoroutineExecutor())
+    publisher = NATSPublisher(executor=executor, subject_factory="test.subject", tracing=TracingConfig(sample_every=2))
+    publisher.publish = AsyncMock()  # type: ignore[method-assign]
+    publisher._start_connect_if_needed = Mock()  # type: ignore[method-assign]  # noqa: SLF001
+    run_id = uuid4()
+
+    publisher("start", {"uid": str(run_id)})
+    publisher("event", {"uid": "e1"})
+
+    first, second = (call.kwargs["headers"] for call in publisher.publish.await_args_list)
+    assert TRACEPARENT_HEADER not in first
+    assert second[TRACEPARENT_HEADER].startswith(f"00-{run_id.hex}-")
+    assert second[SEQUENCE_HEADER] == "2"
+
+
+def test_routes_and_header_factory_apply_per_document_type() -> None:
+    """Routed documents use their subject and stream, every message gets fresh copies of the static headers."""
+    executor = Mock(wraps=InlineCoroutineExecutor())
+    subject_factory = Mock(return_value="test.subject")
+    publisher = NATSPublisher(
+        executor=executor,
+        subject_factory=subject_factory,
+        routes=[RouteRule(frozenset({"start", "stop"}), "test.meta", stream="META")],
+        header_factory=lambda run_id, name: {"beamline": "bl1"},
+    )
+    publisher.publish = AsyncMock()  # type: ignore[method-assign]
+    publisher._start_connect_if_needed = Mock()  # type: ignore[method-assign]  # noqa: SLF001
+    subject_factory.reset_mock()  # called once by the validation
+    run_id = str(uuid4())
+
+    publisher("start", {"uid": run_id})
+    publisher("event", {"uid": "e1"})
+    publisher("event", {"uid": "e2"})
+
+    calls = [call.kwargs for call in publisher.publish.await_args_list]
+    assert [call["subject"] for call in calls] == ["test.meta.start", "test.subject.event", "test.subject.event"]
+    assert calls[0]["headers"][EXPECTED_STREAM_HEADER] == "META"
+    assert EXPECTED_STREAM_HEADER not in calls[1]["headers"]
+    assert [call["headers"][SEQUENCE_HEADER] for call in calls] == ["1", "2", "3"]
+    assert all(call["headers"]["beamline"] == "bl1" for call in calls)
+    subject_factory.assert_called_once()
+
+
+def _laned_publisher(lanes: PriorityLanes, **options) -> tuple[NATSPublisher, PendingCoroutineExecutor, Mock]:
+    executor = PendingCoroutineExecutor()
+    publisher = NATSPublisher(executor=executor, subject_factory="test.subject", priority_lanes=lanes, **options)
+    publisher._start_connect_if_needed = Mock()  # type: ignore[method-assign]  # noqa: SLF001
+    publish_ordered = Mock(side_effect=lambda *args, **kwargs: asyncio.sleep(0))
+    publisher._publish_ordered = publish_ordered  # type: ignore[method-assign]  # noqa: SLF001
+    return publisher, executor, publish_ordered
+
+
+def test_priority_lanes_reject_empty_documents() -> None:
+    """At least one document type must use the priority lane."""
+    with pytest.raises(ValueError, match="documents must not be empty"):
+        PriorityLanes(documents=frozenset())
+
+
+def test_priority_documents_bypass_a_full_window() -> None:
+    """Run metadata is admitted while bulk documents fill the publish window."""
+    window = PublishWindow(max_messages=1, policy=WindowPolicy.RAISE)
+    publisher, executor, _ = _laned_publisher(PriorityLanes(), window=window)
+    run_id = str(uuid4())
+    publisher.run_id = run_id  # type: ignore[assignment]
+    publisher("event", {"time": 0, "descriptor": "d1"})
+
+    publisher("descriptor", {"uid": "d2", "run_start": run_id})
+    publisher("stop", {"uid": str(uuid4()), "run_start": run_id})
+    assert len(executor.futures) == 3
+
+    with pytest.raises(RuntimeError, match="NATS publish window full"):
+        publisher("event", {"time": 1, "descriptor": "d1"})
+
+
+def test_priority_lanes_keep_each_run_in_order() -> None:
+    """Priority documents wait for their run, bulk documents for the preceding priority document."""
+    publisher, executor, publish_ordered = _laned_publisher(PriorityLanes())
+    first, second = str(uuid4()), str(uuid4())
+
+    publisher("start", {"uid": first})
+    publisher("event", {"time": 0, "descriptor": "d1"})
+    publisher("stop", {"uid": str(uuid4()), "run_start": first})
+    publisher("start", {"uid": second})
+
+    start_after, event_after, stop_after, next_start_after = (call.args[4] for call in publish_ordered.call_args_list)
+    assert start_after == ()
+    assert event_after == (executor.futures[0],)
+    assert len(stop_after) == 1
+    assert not stop_after[0].done()
+    # the next run does not wait for the previous one
+    assert next_start_after == ()
+    assert [call.kwargs["priority"] for call in publish_ordered.call_args_list] == [True, False, True, True]
+
+    for future in executor.futures[:2]:
+        future.set_result(True)
+    assert stop_after[0].done()
+
+
+@pytest.mark.asyncio
+async def test_priority_lane_uses_its_own_connection() -> None:
+    """Priority publishes use the second JetStream context, bulk publishes the main one."""
+    publisher = NATSPublisher(
+        executor=Mock(), subject_factory="test.subject", priority_lanes=PriorityLanes(separate_connection=True)
+    )
+    publisher.nats_client = Mock(is_connected=True, connect=AsyncMock(), jetstream=Mock(return_value=AsyncMock()))
+    publisher._priority_client = Mock(  # noqa: SLF001
+        is_connected=False, connect=AsyncMock(), jetstream=Mock(return_value=AsyncMock())
+    )
+    await publisher._connect(NATSClientConfig())  # noqa: SLF001
+
+    await publisher.publish(subject="test.subject.stop", payload=b"doc", headers={}, priority=True)
+    await publisher.publish(subject="test.subject.event", payload=b"doc", headers={})
+
+    publisher._priority_js.publish.assert_awaited_once()  # type: ignore[union-attr]  # noqa: SLF001
+    publisher.js.publish.assert_awaited_once()  # type: ignore[union-attr]
+
+
+@pytest.mark.asyncio
+async def test_priority_lane_falls_back_to_main_connection() -> None:
+    """A failed priority connection leaves priority documents on the main connection."""
+    publisher = NATSPublisher(
+        executor=Mock(), subject_factory="test.subject", priority_lanes=PriorityLanes(separate_connection=True)
+    )
+    publisher.nats_client = Mock(is_connected=True, connect=AsyncMock(), jetstream=Mock(return_value=AsyncMock()))
+    publisher._priority_client = Mock(  # noqa: SLF001
+        is_connected=False, connect=AsyncMock(side_effect=ConnectionError("refused"))
+    )
+    await publisher._connect(NATSClientConfig())  # noqa: SLF001
+
+    await publisher.publish(subject="test.subject.stop", payload=b"doc", headers={}, priority=True)
+
+    publisher.js.publish.assert_awaited_once()  # type: ignore[union-attr]
@@ -0,0 +1,123 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock
+
+import numpy as np
+import pytest
+from nats.js.errors import BucketNotFoundError
+
+from bluesky_nats.object_store import (
+    OBJECT_REFERENCE_KEY,
+    ArrayOffloadConfig,
+    ObjectResolver,
+    externalize_arrays,
+    get_object_store,
+    is_reference,
+    upload_arrays,
+)
+
+
+class FakeObjectStore:
+    """In-memory stand-in for a nats-py ObjectStore."""
+
+    def __init__(self) -> None:
+        self.objects: dict[str, bytes] = {}
+        self.chunk_sizes: dict[str, int] = {}
+
+    async def put(self, name, data, meta=None):
+        self.objects[name] = data
+        self.chunk_sizes[name] = meta.options.max_chunk_size
+        return SimpleNamespace(name=name, size=len(data))
+
+    async def get(self, name):
+        return SimpleNamespace(data=self.objects[name])
+
+
+CONFIG = ArrayOffloadConfig(bucket="arrays", threshold=64, chunk_size=32)
+
+
+def test_config_rejects_invalid_values() -> None:
+    """Threshold and chunk size must be positive."""
+    with pytest.raises(ValueError, match="positive"):
+        ArrayOffloadConfig(threshold=0)
+
+
+def test_externalize_leaves_small_and_non_event_documents_untouched() -> None:
+    """Documents without large arrays are returned as-is."""
+    event = {"uid": "e1", "data": {"x": np.zeros(2), "y": 1.0}}
+    start = {"uid": "run", "data": np.zeros(100)}
+
+    assert externalize_arrays("event", event, CONFIG) == (event, [])
+    assert externalize_arrays("start", start, CONFIG) == (start, [])
+
+
+def test_externalize_event_replaces_large_arrays_without_mutating_input() -> None:
+    """Large arrays become references named after the event uid and data key."""
+    frame = np.arange(100, dtype=np.int32).reshape(10, 10)
+    event = {"uid": "e1", "data": {"img": frame, "x": 1.0}}
+
+    doc, uploads = externalize_arrays("event", event, CONFIG)
+
+    assert event["data"]["img"] is frame
+    assert doc["data"]["x"] == 1.0
+    reference = doc["data"]["img"][OBJECT_REFERENCE_KEY]
+    assert reference == {"bucket": "arrays", "name": "e1/img", "dtype": "<i4", "shape": [10, 10]}
+    assert uploads == [("e1/img", frame)]
+
+
+def test_externalize_event_page_references_each_row() -> None:
+    """Each large array of an event_page is uploaded under its own event uid."""
+    page = {"uid": ["e1", "e2"], "data": {"img": [np.zeros(100), np.zeros(1)]}}
+
+    doc, uploads = externalize_arrays("event_page", page, CONFIG)
+
+    assert is_reference(doc["data"]["img"][0])
+    assert isinstance(doc["data"]["img"][1], np.ndarray)
+    assert [name for name, _ in uploads] == ["e1/img"]
+
+
+@pytest.mark.asyncio
+async def test_upload_and_resolve_round_trip() -> None:
+    """Uploaded arrays are resolved back with dtype and shape."""
+    frame = np.arange(60, dtype=np.float64).reshape(3, 4, 5)
+    store = FakeObjectStore()
+    doc, uploads = externalize_arrays("event", {"uid": "e1", "data": {"img": frame}}, CONFIG)
+
+    await upload_arrays(store, uploads, CONFIG.chunk_size)  # type: ignore[arg-type]
+    assert store.chunk_sizes == {"e1/img": 32}
+
+    resolver = ObjectResolver(Mock(object_store=AsyncMock(return_value=store)))
+    resolved = await resolver.resolve("event", doc)
+
+    np.testing.assert_array_equal(resolved["data"]["img"], frame)
+    assert resolved["data"]["img"].flags.writeable
+
+
+@pytest.mark.asyncio
+async def test_resolver_resolves_event_pages_and_caches_buckets() -> None:
+    """Event pages are resolved element-wise and the bucket is bound only once."""
+    store = FakeObjectStore()
+    page = {"uid": ["e1", "e2"], "data": {"img": [np.ones(100), np.full(100, 2.0)], "x": [1, 2]}}
+    doc, uploads = externalize_arrays("event_page", page, CONFIG)
+    await upload_arrays(store, uploads, CONFIG.chunk_size)  # type: ignore[arg-type]
+    js = Mock(object_store=AsyncMock(return_value=store))
+
+    resolved = await ObjectResolver(js).resolve("event_page", doc)
+
+    np.testing.assert_array_equal(resolved["data"]["img"][1], np.full(100, 2.0))
+    assert resolved["data"]["x"] == [1, 2]
+    js.object_store.assert_awaited_once_with("arrays")
+
+
+@pytest.mark.asyncio
+async def test_get_object_store_creates_missing_bucket() -> None:
+    """A missing bucket is created unless creation is disabled."""
+    store = FakeObjectStore()
+    js = Mock(
+        object_store=AsyncMock(side_effect=BucketNotFoundError()), create_object_store=AsyncMock(return_value=store)
+    )
+
+    assert await get_object_store(js, CONFIG) is store
+    js.create_object_store.assert_awaited_once_with("arrays")
+
+    with pytest.raises(BucketNotFoundError):
+        await get_object_store(js, ArrayOffloadConfig(create_bucket=False))
@@ -0,0 +1,48 @@
+from unittest.mock import Mock
+
+import pytest
+
+from bluesky_nats.routing import EXPECTED_STREAM_HEADER, DocumentRouter, RouteRule
+
+
+def test_route_rule_rejects_empty_fields() -> None:
+    """A rule needs documents and a subject prefix."""
+    with pytest.raises(ValueError, match="must not be empty"):
+        RouteRule(documents=frozenset(), subject_prefix="meta")
+    with pytest.raises(ValueError, match="must not be empty"):
+        RouteRule(documents=frozenset({"start"}), subject_prefix="")
+
+
+def test_router_rejects_overlapping_rules() -> None:
+    """A document name is routed by one rule only."""
+    rules = [RouteRule(frozenset({"start", "stop"}), "meta"), RouteRule(frozenset({"stop"}), "other")]
+    with pytest.raises(ValueError, match="one RouteRule only"):
+        DocumentRouter("events", rules)
+
+
+def test_router_applies_rules_and_stream_header() -> None:
+    """Ruled documents go to their prefix and assert the stream, others to the default subject."""
+    rule = RouteRule(documents={"start", "stop"}, subject_prefix="meta", stream="METADATA")  # type: ignore[arg-type]
+    router = DocumentRouter("events", [rule])
+
+    start = router.route("run", "start")
+    event = router.route("run", "event")
+
+    assert (start.subject, start.headers) == ("meta.start", {"run_id": "run", EXPECTED_STREAM_HEADER: "METADATA"})
+    assert (event.subject, event.headers) == ("events.event", {"run_id": "run"})
+
+
+def test_router_compiles_once_per_run_and_document() -> None:
+    """Factories are called once per run and document name, not per document."""
+    subject_factory = Mock(return_value="events")
+    header_factory = Mock(side_effect=lambda run_id, name: {"beamline": "bl1", "doc": name})
+    router = DocumentRouter(subject_factory, header_factory=header_factory)
+
+    routes = [router.route("a", "event") for _ in range(3)]
+    assert routes[0] is routes[2]
+    assert routes[0].headers == {"run_id": "a", "beamline": "bl1", "doc": "event"}
+    assert subject_factory.call_count == header_factory.call_count == 1
+
+    router.route("a", "start")
+    router.route("b", "event")
+    assert subject_factory.call_count == header_factory.call_count == 3
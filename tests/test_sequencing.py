@@ -0,0 +1,34 @@
+from bluesky_nats.sequencing import MISSING_HISTORY, RunPosition, RunSequences, SequenceCounter, parse_sequence
+
+
+def test_counter_restarts_with_every_run() -> None:
+    """Sequence numbers count the documents of one run, prefixed by the source if any."""
+    counter = SequenceCounter()
+    assert [counter.next("a"), counter.next("a"), counter.next("b")] == ["1", "2", "1"]
+    assert SequenceCounter("3").next("a") == "3:1"
+
+
+def test_parse_sequence() -> None:
+    """Header values are split into source and number."""
+    assert parse_sequence("7") == ("", 7)
+    assert parse_sequence("2:7") == ("2", 7)
+    assert parse_sequence("x") is None
+
+
+def test_missing_numbers_are_bounded() -> None:
+    """Missing numbers far behind the position are forgotten."""
+    position = RunPosition(seq=2 * MISSING_HISTORY, stream_seq=None)
+    position.add_missing(set(range(1, 2 * MISSING_HISTORY)))
+    assert min(position.missing) == MISSING_HISTORY + 1
+    assert len(position.missing) < MISSING_HISTORY
+
+
+def test_run_sequences_keep_recent_runs() -> None:
+    """Only the most recently seen runs are tracked."""
+    sequences = RunSequences(max_runs=2)
+    sequences.start(("a", ""), 1, None)
+    sequences.start(("b", ""), 1, None)
+    assert sequences.get(("a", "")) is not None
+    sequences.start(("c", ""), 1, None)
+    assert sequences.get(("b", "")) is None
+    assert sequences.get(("a", "")) is not None
@@ -0,0 +1,149 @@
+import time
+from concurrent.futures import Future
+from itertools import count
+from unittest.mock import Mock
+
+import pytest
+
+from bluesky_nats.batching import BatchConfig
+from bluesky_nats.sharding import ShardedNATSPublisher, document_shard_key
+
+
+def _sharded_publisher(shards: int = 4) -> tuple[ShardedNATSPublisher, dict[int, list[tuple[str, list]]]]:
+    """Publisher whose shards record routed documents and return pending futures."""
+    publisher = ShardedNATSPublisher([Mock() for _ in range(shards)], subject_factory="test.subject")
+    routed: dict[int, list[tuple[str, list]]] = {index: [] for index in range(shards)}
+    for index, shard in enumerate(publisher.shards):
+
+        def _publish_document(name, doc, after, index=index):
+            routed[index].append((name, after))
+            return Future()
+
+        shard._publish_document = Mock(side_effect=_publish_document)  # type: ignore[method-assign]  # noqa: SLF001
+    return publisher, routed
+
+
+def _keys_on_distinct_shards(publisher: ShardedNATSPublisher, number: int) -> list[str]:
+    keys: dict[int, str] = {}
+    for candidate in (f"key-{i}" for i in count()):
+        keys.setdefault(publisher._shard_index(candidate), candidate)  # noqa: SLF001
+        if len(keys) == number:
+            return list(keys.values())
+    return []
+
+
+def test_requires_an_executor() -> None:
+    """At least one shard is needed."""
+    with pytest.raises(ValueError, match="at least one executor"):
+        ShardedNATSPublisher([])
+
+
+def test_document_shard_key() -> None:
+    """Events follow their descriptor, datums their resource and stop its run."""
+    assert document_shard_key("event", {"descriptor": "d1"}) == "d1"
+    assert document_shard_key("event_page", {"descriptor": "d1"}) == "d1"
+    assert document_shard_key("datum_page", {"resource": "r1"}) == "r1"
+    assert document_shard_key("descriptor", {"uid": "d1", "run_start": "run"}) == "d1"
+    assert document_shard_key("stop", {"uid": "stop", "run_start": "run"}) == "run"
+
+
+def test_related_documents_share_a_shard_and_wait_across_shards() -> None:
+    """Events go to their descriptor's shard and wait for the start; stop waits for all shards."""
+    publisher, routed = _sharded_publisher()
+    run, d1, d2 = _keys_on_distinct_shards(publisher, 3)
+    run_shard, d1_shard, d2_shard = (publisher._shard_index(key) for key in (run, d1, d2))  # noqa: SLF001
+
+    publisher("start", {"uid": run})
+    publisher("descriptor", {"uid": d1, "run_start": run})
+    publisher("descriptor", {"uid": d2, "run_start": run})
+    for seq_num in range(3):
+        publisher("event", {"uid": f"e{seq_num}", "descriptor": d1})
+        publisher("event", {"uid": f"f{seq_num}", "descriptor": d2})
+    publisher("stop", {"uid": "stop", "run_start": run})
+
+    assert [name for name, _ in routed[d1_shard]] == ["descriptor", "event", "event", "event"]
+    assert [name for name, _ in routed[run_shard]] == ["start", "stop"]
+    assert all(shard.run_id == run for shard in publisher.shards)
+    # d2's descriptor waits for d1's descriptor, events wait for the last descriptor only
+    assert len(routed[d2_shard][0][1]) == 1
+    assert [len(after) for _, after in routed[d1_shard][1:]] == [1, 1, 1]
+    assert routed[d2_shard][1][1] == []
+    # stop waits for the last publish of both descriptor shards
+    assert len(routed[run_shard][1][1]) == 2
+
+
+def test_events_wait_for_datums_on_other_shards() -> None:
+    """Events are held back until datums published through other connections are stored."""
+    publisher, routed = _sharded_publisher()
+    descriptor, resource = _keys_on_distinct_shards(publisher, 2)
+
+    publisher("datum", {"datum_id": f"{resource}/0", "resource": resource})
+    publisher("event", {"uid": "e0", "descriptor": descriptor})
+
+    _, after = routed[publisher._shard_index(descriptor)][-1]  # noqa: SLF001
+    assert len(after) == 1
+
+
+def test_health_and_flush_are_aggregated() -> None:
+    """Counters are summed and the most recent error is reported."""
+    publisher = ShardedNATSPublisher([Mock(), Mock()])
+    first, second = publisher.shards
+    first._dropped_publishes = 2  # noqa: SLF001
+    second._dropped_publishes = 3  # noqa: SLF001
+    first._record_error(RuntimeError("old"))  # noqa: SLF001
+    second._record_error(RuntimeError("new"))  # noqa: SLF001
+    first._last_error_at = 1.0  # noqa: SLF001
+    first.flush_publishes = Mock(return_value=True)  # type: ignore[method-assign]
+    second.flush_publishes = Mock(return_value=False)  # type: ignore[method-assign]
+
+    health = publisher.health
+
+    assert health.dropped_publishes == 5
+    assert health.last_error == "RuntimeError: new"
+    assert health.connected is False
+    assert publisher.flush_publishes(timeout=1) is False
+    first.flush_publishes.assert_called_once()
+    second.flush_publishes.assert_called_once()
+
+
+def test_flush_on_stop_flushes_the_run_on_every_shard() -> None:
+    """A stop document waits for the run on all shards, not only the stop's shard."""
+    publisher = ShardedNATSPublisher([Mock(), Mock()], subject_factory="test.subject", flush_on_stop=1.0)
+    for shard in publisher.shards:
+        shard._publish_document = Mock(return_value=Future())  # type: ignore[method-assign]  # noqa: SLF001
+        shard.flush_run = Mock(return_value=True)  # type: ignore[method-assign]
+
+    publisher("start", {"uid": "run"})
+    publisher("stop", {"uid": "stop", "run_start": "run"})
+
+    for shard in publisher.shards:
+        shard.flush_run.assert_called_once()
+        assert shard.flush_run.call_args.args[0] == "run"
+
+
+def test_shards_number_documents_independently() -> None:
+    """Each shard stamps its own per-run sequence, tagged with the shard index."""
+    publisher = ShardedNATSPublisher([Mock(), Mock()])
+    assert [shard._sequence.next("run") for shard in publisher.shards] == ["0:1", "1:1"]  # noqa: SLF001
+
+
+def test_failed_linger_flush_is_latched_in_strict_mode() -> None:
+    """A page the linger timer cannot route fails the next call even once the shards recover."""
+    publisher = ShardedNATSPublisher(
+        [Mock(), Mock()], strict_publish=True, batching=BatchConfig(max_size=100, linger=0.01)
+    )
+    for shard in publisher.shards:
+        shard._publish_document = Mock(side_effect=RuntimeError("shard down"))  # type: ignore[method-assign]  # noqa: SLF001
+    for seq_num in range(1, 4):
+        event = {"uid": f"e{seq_num}", "time": 0.0, "seq_num": seq_num, "descriptor": "d1"}
+        publisher("event", {**event, "data": {}, "timestamps": {}, "filled": {}})
+
+    deadline = time.monotonic() + 2
+    while publisher.shards[0]._strict_error is None and time.monotonic() < deadline:  # noqa: SLF001
+        time.sleep(0.01)
+    for shard in publisher.shards:
+        shard._publish_document.side_effect = None  # noqa: SLF001
+
+    with pytest.raises(RuntimeError, match="shard down"):
+        publisher("stop", {"uid": "stop", "run_start": "run"})
+    assert publisher._batcher.pending == 3  # type: ignore[union-attr]  # noqa: SLF001
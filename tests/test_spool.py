@@ -0,0 +1,161 @@
+import asyncio
+import threading
+
+import pytest
+
+from bluesky_nats.spool import CURSOR_FILE, FRAME_HEADER, FsyncPolicy, SegmentSpool, SpoolConfig, ThreadedSpool
+
+
+def _append(spool: SegmentSpool, count: int, start: int = 0) -> None:
+    for index in range(start, start + count):
+        assert spool.append(f"events.{index}", {"run_id": "run"}, b"x" * 100)
+
+
+def test_config_rejects_invalid_values(tmp_path) -> None:
+    """Segments must hold a record header and the size cap must be positive."""
+    with pytest.raises(ValueError, match="segment_size"):
+        SpoolConfig(tmp_path, segment_size=FRAME_HEADER.size)
+    with pytest.raises(ValueError, match="max_bytes"):
+        SpoolConfig(tmp_path, max_bytes=0)
+
+
+def test_append_read_commit(tmp_path) -> None:
+    """Records come back in order and are released by commit."""
+    spool = SegmentSpool(SpoolConfig(tmp_path))
+    _append(spool, 3)
+
+    records = spool.read(2)
+    assert [(r.subject, r.headers, r.payload) for r in records] == [
+        ("events.0", {"run_id": "run"}, b"x" * 100),
+        ("events.1", {"run_id": "run"}, b"x" * 100),
+    ]
+    assert spool.read(2) == records
+
+    spool.commit(records)
+    assert spool.pending_records == 1
+    assert [r.subject for r in spool.read(10)] == ["events.2"]
+
+
+def test_rotation_deletes_committed_segments(tmp_path) -> None:
+    """Records spill over into new segments, which are removed once fully replayed."""
+    spool = SegmentSpool(SpoolConfig(tmp_path, segment_size=512, fsync=FsyncPolicy.ALWAYS))
+    _append(spool, 10)
+    assert len(list(tmp_path.glob("*.seg"))) > 1
+
+    records = spool.read(100)
+    assert [r.subject for r in records] == [f"events.{i}" for i in range(10)]
+    spool.commit(records)
+
+    assert spool.pending_records == 0
+    assert spool.pending_bytes == 0
+    assert len(list(tmp_path.glob("*.seg"))) == 1
+
+
+def test_oversized_record_gets_own_segment(tmp_path) -> None:
+    """A record larger than segment_size is still spooled."""
+    spool = SegmentSpool(SpoolConfig(tmp_path, segment_size=64))
+    assert spool.append("events.big", {}, b"x" * 1000)
+    assert spool.read(1)[0].payload == b"x" * 1000
+
+
+def test_reopen_resumes_from_committed_position(tmp_path) -> None:
+    """Pending records and the read position survive a restart."""
+    config = SpoolConfig(tmp_path, segment_size=512)
+    spool = SegmentSpool(config)
+    _append(spool, 10)
+    spool.commit(spool.read(4))
+    spool.close()
+
+    spool = SegmentSpool(config)
+    assert spool.pending_records == 6
+    assert [r.subject for r in spool.read(100)] == [f"events.{i}" for i in range(4, 10)]
+
+    _append(spool, 1, start=10)
+    assert spool.read(100)[-1].subject == "events.10"
+
+
+def test_append_refused_when_full(tmp_path) -> None:
+    """Appends beyond max_bytes are refused until records are committed."""
+    spool = SegmentSpool(SpoolConfig(tmp_path, max_bytes=300))
+    _append(spool, 2)
+
+    assert spool.append("events.2", {}, b"x" * 100) is False
+    spool.commit(spool.read(1))
+    assert spool.append("events.2", {}, b"x" * 100) is True
+
+
+def test_torn_tail_is_discarded(tmp_path) -> None:
+    """A partially written record at the end of a segment is dropped on recovery."""
+    config = SpoolConfig(tmp_path, segment_size=4096)
+    spool = SegmentSpool(config)
+    _append(spool, 2)
+    tail = spool.read(2)[-1].end
+    spool.close()
+    segment = next(tmp_path.glob("*.seg"))
+    with segment.open("r+b") as f:
+        f.seek(tail)
+        f.write(FRAME_HEADER.pack(50, 1234) + b"garbage")
+
+    spool = SegmentSpool(config)
+    assert spool.pending_records == 2
+    _append(spool, 1, start=2)
+    assert [r.subject for r in spool.read(10)] == ["events.0", "events.1", "events.2"]
+
+
+@pytest.mark.parametrize("cursor", [b"", b"\x01\x02\x03"])
+def test_damaged_cursor_replays_from_oldest_segment(tmp_path, cursor) -> None:
+    """An empty or truncated cursor file does not keep the spool from opening."""
+    config = SpoolConfig(tmp_path, segment_size=512)
+    spool = SegmentSpool(config)
+    _append(spool, 10)
+    spool.commit(spool.read(1))
+    spool.close()
+    (tmp_path / CURSOR_FILE).write_bytes(cursor)
+
+    spool = SegmentSpool(config)
+    assert [r.subject for r in spool.read(100)] == [f"events.{i}" for i in range(10)]
+
+
+def test_commit_replaces_cursor_atomically(tmp_path, mocker) -> None:
+    """A failure while writing the new cursor leaves the previous one intact."""
+    config = SpoolConfig(tmp_path, segment_size=512)
+    spool = SegmentSpool(config)
+    _append(spool, 10)
+    spool.commit(spool.read(4))
+    mocker.patch("bluesky_nats.spool.os.fsync", side_effect=OSError("disk gone"))
+    with pytest.raises(OSError, match="disk gone"):
+        spool.commit(spool.read(2))
+    spool.close()
+
+    spool = SegmentSpool(config)
+    assert spool.read(1)[0].subject == "events.4"
+
+
+@pytest.mark.asyncio
+async def test_threaded_spool_writes_off_the_event_loop(tmp_path, mocker) -> None:
+    """Appends run on the spool thread and count as pending while they are written."""
+    spool = SegmentSpool(SpoolConfig(tmp_path, fsync=FsyncPolicy.ALWAYS))
+    release, threads = threading.Event(), []
+    append = spool.append
+
+    def blocking_append(*args: object) -> bool:
+        threads.append(threading.current_thread().name)
+        release.wait(timeout=2)
+        return append(*args)
+
+    mocker.patch.object(spool, "append", side_effect=blocking_append)
+    threaded = ThreadedSpool(spool)
+    pending = asyncio.create_task(threaded.append("events.0", {"run_id": "run"}, b"x" * 100))
+    await asyncio.sleep(0.01)
+    assert threaded.pending_records == 1
+    assert not pending.done()
+
+    release.set()
+    assert await asyncio.wait_for(pending, timeout=2)
+    records = await threaded.read(10)
+    await threaded.commit(records)
+    threaded.close()
+
+    assert threads[0].startswith("nats-spool")
+    assert [r.subject for r in records] == ["events.0"]
+    assert threaded.pending_records == 0
@@ -0,0 +1,64 @@
+from uuid import uuid4
+
+import pytest
+
+from bluesky_nats.sequencing import SEQUENCE_HEADER
+from bluesky_nats.tracing import (
+    PUBLISH_TIME_HEADER,
+    TRACEPARENT_HEADER,
+    TraceContext,
+    TraceRecorder,
+    TracingConfig,
+    format_traceparent,
+    parse_traceparent,
+    trace_id_for_run,
+)
+
+
+def test_config_rejects_invalid_sampling() -> None:
+    """At least every document can be traced."""
+    with pytest.raises(ValueError, match="sample_every"):
+        TracingConfig(sample_every=0)
+
+
+def test_traceparent_round_trip() -> None:
+    """The trace id of a run is its uid, malformed headers are ignored."""
+    run_id = uuid4()
+    trace_id = trace_id_for_run(str(run_id))
+    assert trace_id == run_id.hex
+    assert parse_traceparent(format_traceparent(trace_id, "0" * 16)) == (trace_id, "0" * 16)
+    assert parse_traceparent("01-abc-def-00") is None
+    assert len(trace_id_for_run("not-a-uuid")) == 32
+
+
+def test_trace_context_samples_documents() -> None:
+    """Only every sample_every-th document carries trace headers."""
+    context = TraceContext(TracingConfig(sample_every=2))
+    run_id = str(uuid4())
+    headers = [{} for _ in range(4)]
+    for header in headers:
+        context.inject(header, run_id)
+
+    assert [TRACEPARENT_HEADER in header for header in headers] == [False, True, False, True]
+    assert int(headers[3][PUBLISH_TIME_HEADER]) > 0
+    assert parse_traceparent(headers[1][TRACEPARENT_HEADER])[0] == trace_id_for_run(run_id)  # type: ignore[index]
+
+
+def test_recorder_builds_spans() -> None:
+    """Stage timings are recorded in histograms and passed on as spans."""
+    spans = []
+    recorder = TraceRecorder(on_span=spans.append)
+    headers = {
+        TRACEPARENT_HEADER: format_traceparent("a" * 32, "b" * 16),
+        PUBLISH_TIME_HEADER: "1000",
+        SEQUENCE_HEADER: "7",
+    }
+
+    recorder.record(headers, "events.event", received_at=3000, started=0, deserialized=10, dispatched=40, done=100)
+    recorder.record({}, "events.event", received_at=0, started=0, deserialized=0, dispatched=0, done=0)
+
+    (span,) = spans
+    assert (span.trace_id, span.seq) == ("a" * 32, 7)
+    assert span.transit == pytest.approx(2e-6)
+    assert span.callback == pytest.approx(60e-9)
+    assert recorder.snapshot().dispatch.count == 1